@@ -2,4 +2,5 @@
 set -e
 python -m playwright install --with-deps chromium  --only-shell
 apt update
-apt install -y libreoffice
+apt install -y libreoffice python3-uno python3-pip
+/usr/bin/python3 -m pip install --break-system-packages unoserver
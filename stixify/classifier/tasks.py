@@ -10,6 +10,7 @@ import joblib
 from celery import shared_task
 from django.conf import settings
 
+from stixify.worker import ratelimit
 from .models import DocumentEmbedding, Cluster
 
 
@@ -29,8 +30,14 @@ def compute_embedding_for_document(doc: DocumentEmbedding):
 
     client = _openai_client()
     try:
-        resp = client.embeddings.create(
-            input=doc.text, model="text-embedding-3-small", dimensions=512
+        resp = ratelimit.call(
+            "openai",
+            "text-embedding-3-small",
+            lambda: client.embeddings.create(
+                input=doc.text, model="text-embedding-3-small", dimensions=512
+            ),
+            tokens=ratelimit.estimate_tokens(doc.text),
+            get_tokens=lambda resp: resp.usage.total_tokens,
         )
         vec = resp.data[0].embedding  # list of floats
         # store as list of floats; `updated_at` is auto-updated by the model
@@ -245,9 +252,15 @@ def _label_cluster(sample_texts: List[str]) -> dict:
         "\n\nSample excerpts:\n"
     )
     prompt += "\n".join([f"- {t[:2048]}" for t in sample_texts])
-    resp = client.chat.completions.create(
-        model="gpt-5-mini",
-        messages=[{"role": "user", "content": prompt}],
+    resp = ratelimit.call(
+        "openai",
+        "gpt-5-mini",
+        lambda: client.chat.completions.create(
+            model="gpt-5-mini",
+            messages=[{"role": "user", "content": prompt}],
+        ),
+        tokens=ratelimit.estimate_tokens(prompt),
+        get_tokens=lambda resp: resp.usage.total_tokens,
     )
     text = resp.choices[
         0
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 import copy
 import logging
+import json
 import os
 from pathlib import Path
 from textwrap import dedent
@@ -128,6 +129,9 @@ CACHES = {
     }
 }
 
+# how long the rendered markdown of a File is cached for (see `stixify.web.md_helper`)
+MARKDOWN_CACHE_SECONDS = int(os.getenv("MARKDOWN_CACHE_SECONDS", 24 * 60 * 60))
+
 # Storage
 
 STORAGES = {
@@ -160,6 +164,37 @@ if os.getenv("USE_S3_STORAGE") == "1":
         "OPTIONS": {**options, 'location':'django/staticfiles'},
     }
 
+# direct uploads to the storage (`stixify.web.direct_uploads`), only available with `USE_S3_STORAGE=1`
+DIRECT_UPLOAD_EXPIRY = int(os.getenv("DIRECT_UPLOAD_EXPIRY", 3600))
+DIRECT_UPLOAD_MAX_SIZE = int(os.getenv("DIRECT_UPLOAD_MAX_SIZE", 5 * 1024**3))  # single PUT limit of S3
+# the endpoint the clients upload to (and download from with `FILE_DOWNLOAD_MODE=redirect`), when it is not `R2_ENDPOINT_URL` (e.g. the public url of a MinIO server)
+DIRECT_UPLOAD_ENDPOINT_URL = os.getenv("DIRECT_UPLOAD_ENDPOINT_URL")
+
+# how stored files are downloaded, `stream`, `redirect` or `x-accel` (see `stixify.web.downloads`)
+FILE_DOWNLOAD_MODE = os.getenv("FILE_DOWNLOAD_MODE", "stream")
+FILE_DOWNLOAD_X_ACCEL_PREFIX = os.getenv("FILE_DOWNLOAD_X_ACCEL_PREFIX", "/protected/")
+FILE_DOWNLOAD_URL_EXPIRY = int(os.getenv("FILE_DOWNLOAD_URL_EXPIRY", 300))
+
+# the number of images of a File uploaded to the storage at the same time
+IMAGE_UPLOAD_CONCURRENCY = int(os.getenv("IMAGE_UPLOAD_CONCURRENCY", 8))
+
+FILE_UPLOAD_HANDLERS = [
+    "stixify.web.upload_handlers.DigestMemoryFileUploadHandler",
+    "stixify.web.upload_handlers.DigestTemporaryFileUploadHandler",
+]
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", 1000))
+DATA_UPLOAD_MAX_NUMBER_FILES = BULK_UPLOAD_MAX_FILES
+# uncompressed sizes, the upload limits of Django only apply to the (compressed) request body
+BULK_UPLOAD_MAX_ARCHIVE_SIZE = int(os.getenv("BULK_UPLOAD_MAX_ARCHIVE_SIZE", 2 * 1024**3))
+BULK_UPLOAD_MAX_ARCHIVE_MEMBER_SIZE = int(os.getenv("BULK_UPLOAD_MAX_ARCHIVE_MEMBER_SIZE", 500 * 1024**2))
+BULK_REPROCESS_MAX_IN_FLIGHT = int(os.getenv("BULK_REPROCESS_MAX_IN_FLIGHT", 10))
+BULK_REPROCESS_DISPATCH_INTERVAL = int(os.getenv("BULK_REPROCESS_DISPATCH_INTERVAL", 60))
+FAILED_JOB_RESUME_HOURS = int(os.getenv("FAILED_JOB_RESUME_HOURS", 24))
+# a pipeline stage running longer fails, the broker redelivers unacknowledged tasks only after it was killed
+PIPELINE_STAGE_TIME_LIMIT = int(os.getenv("PIPELINE_STAGE_TIME_LIMIT", 3 * 3600))
+# maximum number of jobs of a priority class (`JobPriority`) queued or processing at the same time, e.g {"bulk": 20}
+JOB_PRIORITY_MAX_IN_FLIGHT = json.loads(os.getenv("JOB_PRIORITY_MAX_IN_FLIGHT") or "{}")
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -253,7 +288,11 @@ SPECTACULAR_SETTINGS: dict[str, Any] = {
         {"name": "Extractors", "description": "Search through extractors that can be used in profiles (see txt2stix for more information)"},
         {"name": "Jobs", "description": "Check the status of data retrieval from Files uploaded."},
         {"name": "Server Status", "description": "Checks health of the server."},
-    ]
+    ],
+    "ENUM_NAME_OVERRIDES": {
+        "JobPriorityEnum": "stixify.web.models.JobPriority",
+        "UploadPriorityEnum": ["interactive", "bulk"],
+    },
 }
 
 
@@ -280,3 +319,18 @@ CLASSIFIER_LABEL_SAMPLE_SIZE = int(os.getenv("CLASSIFIER_LABEL_SAMPLE_SIZE", 10)
 CLASSIFIER_MODEL_PATH = os.getenv("CLASSIFIER_MODEL_PATH", os.path.join(BASE_DIR, "classifier_hdbscan.joblib"))
 CLASSIFIER_CONCURRENCY = int(os.getenv("CLASSIFIER_CONCURRENCY", 12))
 CREATE_EMBEDDING_INCLUDE_NON_INCIDENT = bool(os.getenv("CREATE_EMBEDDING_INCLUDE_NON_INCIDENT", False))
+
+# archived pdf conversion
+LIBREOFFICE_POOL_SIZE = int(os.getenv("LIBREOFFICE_POOL_SIZE", 1))
+LIBREOFFICE_POOL_COMMAND = os.getenv("LIBREOFFICE_POOL_COMMAND", "unoserver")
+LIBREOFFICE_POOL_MAX_CONVERSIONS = int(os.getenv("LIBREOFFICE_POOL_MAX_CONVERSIONS", 50))
+LIBREOFFICE_CONVERSION_TIMEOUT = int(os.getenv("LIBREOFFICE_CONVERSION_TIMEOUT", 300))
+PLAYWRIGHT_MAX_PAGES = int(os.getenv("PLAYWRIGHT_MAX_PAGES", 4))
+PLAYWRIGHT_RENDER_TIMEOUT = int(os.getenv("PLAYWRIGHT_RENDER_TIMEOUT", 120))
+
+# rate limits of the AI providers by `provider:model` (or `provider`), see `stixify.worker.ratelimit`
+AI_RATE_LIMITS = json.loads(os.getenv("AI_RATE_LIMITS") or "{}")
+
+# large documents
+LARGE_DOCUMENT_PAGE_THRESHOLD = int(os.getenv("LARGE_DOCUMENT_PAGE_THRESHOLD", 100))
+LARGE_DOCUMENT_CHUNK_PAGES = int(os.getenv("LARGE_DOCUMENT_CHUNK_PAGES", 25))
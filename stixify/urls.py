@@ -21,11 +21,12 @@ from rest_framework import routers
 from dogesec_commons.objects import views as arango_views
 from dogesec_commons.stixifier.views import ProfileView, ExtractorsView
 from stixify.web.topics import TopicView
-from .web.views import FileView, JobView, ReportView, SchemaViewCached, HealthCheckView, TasksView
+from .web.views import FileView, JobView, ReportView, SchemaViewCached, HealthCheckView, TasksView, job_events
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from django.conf.urls.static import static
 from stixify.web.identities import IdentityView
 from stixify.web.values import SDOValueView, SCOValueView, statistics
+from stixify.web.queue_metrics import QueueMetricsView
 
 from django.http import JsonResponse
 def handler404(*args, **kwargs):
@@ -63,9 +64,11 @@ router.register('extractors', ExtractorsView, "extractors-view")
 
 healthcheck = routers.SimpleRouter(use_regex_path=False)
 healthcheck.register('', HealthCheckView, "service-status-view")
+healthcheck.register('queues', QueueMetricsView, "queue-metrics-view")
 
 urlpatterns = [
     path(f'api/healthcheck/', include(healthcheck.urls)),
+    path(f'api/{API_VERSION}/jobs/<uuid:job_id>/events/', job_events, name='job-events'),
     path(f'api/{API_VERSION}/', include(router.urls)),
     path('admin/', admin.site.urls),
     # YOUR PATTERNS
@@ -5,3 +5,6 @@ class WebConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stixify.web'
     label = "stixify_core"
+
+    def ready(self):
+        from . import arango_indexes  # registers the index check
@@ -0,0 +1,238 @@
+"""
+Persistent indexes backing the ArangoDB queries of Stixify (see the `ensure_arango_indexes` command).
+
+stix2arango only indexes the fields it needs itself (`id`, `modified`, `_is_latest`...), the objects of a report
+are filtered on `type`, `created_by_ref` and `object_marking_refs` and the deletion of reports and identities on
+`_stixify_report_id` and `created_by_ref`. The cursor over the objects of a report reads them in
+`(_stixify_report_id, _key)` order. Queries over the view can not use these indexes, they run on the
+collections instead.
+
+The report list itself is served from the Files in Postgres, except for its `description` filter which uses the
+`REPORT_SEARCH_VIEW` ArangoSearch view, indexing the reports with a lowercased trigram analyzer. It is a separate
+view because the links of `VIEW_NAME` are reset by dogesec_commons on startup and on every upload.
+"""
+
+import logging
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core import checks
+from dogesec_commons.objects.helpers import ArangoDBHelper
+
+VERTEX_COLLECTION = settings.ARANGODB_COLLECTION + "_vertex_collection"
+EDGE_COLLECTION = settings.ARANGODB_COLLECTION + "_edge_collection"
+REPORT_ID_INDEX = "stixify_report_id"
+REPORT_OBJECTS_INDEX = "stixify_report_id_key"  # the objects of a report in `_key` order, for their cursor
+REPORT_SEARCH_VIEW = settings.ARANGODB_COLLECTION + "_report_search"
+NGRAM_ANALYZER = "stixify_ngram"
+NGRAM_SIZE = 3  # shorter search terms can not use the view
+
+ANALYZERS = [
+    dict(
+        name=NGRAM_ANALYZER,
+        analyzer_type="pipeline",
+        properties=dict(
+            pipeline=[
+                dict(type="norm", properties=dict(locale="en", case="lower", accent=False)),
+                dict(
+                    type="ngram",
+                    properties=dict(min=NGRAM_SIZE, max=NGRAM_SIZE, preserveOriginal=False, streamType="utf8"),
+                ),
+            ]
+        ),
+        # `frequency` and `norm` for BM25, `position` for NGRAM_MATCH
+        features=["frequency", "norm", "position"],
+    ),
+]
+
+REPORT_SEARCH_LINKS = {
+    VERTEX_COLLECTION: dict(
+        includeAllFields=False,
+        analyzers=["identity"],
+        fields={
+            "type": {},
+            "_is_latest": {},
+            **{name: dict(analyzers=[NGRAM_ANALYZER]) for name in ["name", "description", "labels"]},
+        },
+    ),
+}
+
+INDEXES = {
+    VERTEX_COLLECTION: [
+        dict(type="persistent", name="stixify_type_latest_created", fields=["type", "_is_latest", "created"]),
+        dict(type="persistent", name="stixify_created_by_ref", fields=["created_by_ref"], sparse=True),
+        dict(type="persistent", name="stixify_object_marking_refs", fields=["object_marking_refs[*]"], sparse=True),
+        dict(type="persistent", name=REPORT_ID_INDEX, fields=["_stixify_report_id"], sparse=True),
+        dict(type="persistent", name=REPORT_OBJECTS_INDEX, fields=["_stixify_report_id", "_key"], sparse=True),
+    ],
+    EDGE_COLLECTION: [
+        dict(type="persistent", name="stixify_created_by_ref", fields=["created_by_ref"], sparse=True),
+        dict(type="persistent", name=REPORT_ID_INDEX, fields=["_stixify_report_id"], sparse=True),
+        dict(type="persistent", name=REPORT_OBJECTS_INDEX, fields=["_stixify_report_id", "_key"], sparse=True),
+    ],
+}
+
+# the shape of the queries using the indexes, checked by `ensure_arango_indexes --explain`
+DIAGNOSTIC_QUERIES = {
+    "reports of a page": (
+        """
+        FOR doc IN @@collection
+        FILTER doc.id IN @report_ids AND doc._is_latest
+        RETURN doc._key
+        """,
+        {"@collection": VERTEX_COLLECTION, "report_ids": ["report--00000000-0000-0000-0000-000000000000"]},
+    ),
+    "reports by description": (
+        """
+        FOR doc IN @@view
+        SEARCH doc.type == "report" AND doc._is_latest == true
+            AND NGRAM_MATCH(doc.description, @description, 1, @analyzer)
+        SORT BM25(doc) DESC
+        RETURN doc.id
+        """,
+        {"@view": REPORT_SEARCH_VIEW, "description": "exploit", "analyzer": NGRAM_ANALYZER},
+    ),
+    **{
+        f"objects of a report ({collection})": (
+            """
+            FOR doc IN @@collection
+            FILTER doc._stixify_report_id == @report_id
+            RETURN doc._key
+            """,
+            {"@collection": collection, "report_id": "report--00000000-0000-0000-0000-000000000000"},
+        )
+        for collection in INDEXES
+    },
+    **{
+        f"objects of a report by cursor ({collection})": (
+            """
+            FOR doc IN @@collection
+            FILTER doc._stixify_report_id == @report_id AND doc._key > @after
+            SORT doc._key
+            LIMIT 50
+            RETURN doc._key
+            """,
+            {"@collection": collection, "report_id": "report--00000000-0000-0000-0000-000000000000", "after": ""},
+        )
+        for collection in INDEXES
+    },
+    **{
+        f"objects of an identity ({collection})": (
+            """
+            FOR doc IN @@collection
+            FILTER doc.id == @identity_id OR doc.created_by_ref == @identity_id
+            RETURN doc._key
+            """,
+            {"@collection": collection, "identity_id": "identity--00000000-0000-0000-0000-000000000000"},
+        )
+        for collection in INDEXES
+    },
+}
+
+
+@dataclass
+class QueryPlan:
+    name: str
+    indexes: list[str] = field(default_factory=list)
+    full_scans: list[str] = field(default_factory=list)  # collections and views iterated without an index
+
+
+def get_db():
+    return ArangoDBHelper(settings.VIEW_NAME, None).db
+
+
+def is_same_index(index: dict, existing: dict):
+    # an index with the same definition but another name is just as good
+    return existing["name"] == index["name"] or (
+        existing["type"] == index["type"]
+        and list(existing["fields"]) == index["fields"]
+        and bool(existing.get("sparse")) == bool(index.get("sparse"))
+    )
+
+
+def missing_indexes(db) -> list[tuple[str, dict]]:
+    """The `(collection, index)` of `INDEXES` that do not exist, collections that do not exist yet are skipped."""
+    missing = []
+    for collection, indexes in INDEXES.items():
+        if not db.has_collection(collection):
+            continue
+        existing = db.collection(collection).indexes()
+        for index in indexes:
+            if not any(is_same_index(index, other) for other in existing):
+                missing.append((collection, index))
+    return missing
+
+
+def ensure_indexes(db) -> list[tuple[str, dict]]:
+    """Create the missing indexes (in the background), returns the `(collection, index)` created."""
+    created = missing_indexes(db)
+    for collection, index in created:
+        logging.info(f"creating index {index['name']} on {collection}")
+        db.collection(collection).add_index(dict(index, inBackground=True))
+    return created
+
+
+def missing_search(db) -> list[tuple[str, str]]:
+    """The `(kind, name)` of the missing analyzers and report search view."""
+    analyzers = {analyzer["name"].rpartition("::")[2] for analyzer in db.analyzers()}
+    missing = [("analyzer", analyzer["name"]) for analyzer in ANALYZERS if analyzer["name"] not in analyzers]
+    if REPORT_SEARCH_VIEW not in {view["name"] for view in db.views()} and all(map(db.has_collection, REPORT_SEARCH_LINKS)):
+        missing.append(("view", REPORT_SEARCH_VIEW))
+    return missing
+
+
+def ensure_search(db) -> list[tuple[str, str]]:
+    """Create the missing analyzers and report search view, returns the `(kind, name)` created."""
+    created = missing_search(db)
+    for kind, name in created:
+        logging.info(f"creating {kind} {name}")
+        if kind == "analyzer":
+            db.create_analyzer(**next(analyzer for analyzer in ANALYZERS if analyzer["name"] == name))
+        else:
+            db.create_arangosearch_view(name, dict(links=REPORT_SEARCH_LINKS))
+    return created
+
+
+_report_search_ready = False
+
+
+def has_report_search(db):
+    """Whether the report search view exists, only a positive answer is remembered."""
+    global _report_search_ready
+    if not _report_search_ready:
+        _report_search_ready = REPORT_SEARCH_VIEW in {view["name"] for view in db.views()}
+    return _report_search_ready
+
+
+def explain(db) -> list[QueryPlan]:
+    plans = []
+    for name, (query, bind_vars) in DIAGNOSTIC_QUERIES.items():
+        plan = QueryPlan(name)
+        for node in db.aql.explain(query, bind_vars=bind_vars)["nodes"]:
+            if node["type"] == "IndexNode":
+                plan.indexes.extend(index["name"] for index in node["indexes"])
+            elif node["type"] == "EnumerateCollectionNode":
+                plan.full_scans.append(node["collection"])
+            elif node["type"] == "EnumerateViewNode":
+                (plan.indexes if node.get("condition") else plan.full_scans).append(node["view"])
+        plans.append(plan)
+    return plans
+
+
+@checks.register(checks.Tags.database)
+def check_indexes(app_configs=None, **kwargs):
+    # database checks only run with `migrate` (or `check --database default`)
+    try:
+        db = get_db()
+        missing = [f"index {index['name']} on {collection}" for collection, index in missing_indexes(db)]
+        missing += [f"{kind} {name}" for kind, name in missing_search(db)]
+    except Exception as e:
+        return [checks.Warning(f"Could not check the ArangoDB indexes: {e}", id="stixify.W001")]
+    return [
+        checks.Warning(
+            f"Missing ArangoDB {name}",
+            hint="Run `python manage.py ensure_arango_indexes`.",
+            id="stixify.W002",
+        )
+        for name in missing
+    ]
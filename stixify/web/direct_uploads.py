@@ -0,0 +1,138 @@
+"""
+Uploads made by clients straight to the object storage (`USE_S3_STORAGE=1`), without going through the web workers.
+
+1. `POST /api/v1/files/uploads/` returns a presigned `PUT` url for a new object under `uploads/`. The size,
+   content type and sha256 of the file are part of the signature, the storage rejects any other content.
+2. The client uploads the file to the url.
+3. `POST /api/v1/files/uploads/confirm/` checks the object (its sha256 is read back from the storage, or computed
+   from the content when the storage does not keep checksums), moves it (a copy within the bucket) to the location of
+   the File and creates the File and its Job like `POST /api/v1/files/` does.
+
+The pending upload is carried by the signed `upload_id`, nothing is stored until it is confirmed. Objects of
+uploads that are never confirmed are removed by `clear_expired_uploads`.
+"""
+
+import base64
+import functools
+import hashlib
+import uuid
+from datetime import UTC, datetime, timedelta
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.utils.text import get_valid_filename
+from rest_framework import exceptions
+from storages.backends.s3 import S3Storage
+
+UPLOAD_PREFIX = "uploads"
+SIGNING_SALT = "stixify.direct-upload"
+
+
+def is_enabled():
+    return isinstance(default_storage, S3Storage)
+
+
+def _key(name):
+    return default_storage._normalize_name(name)
+
+
+@functools.cache
+def get_presigning_client():
+    # signed for the endpoint the clients upload to, which can differ from the one the server uses
+    storage = default_storage
+    return boto3.session.Session(
+        aws_access_key_id=storage.access_key,
+        aws_secret_access_key=storage.secret_key,
+    ).client(
+        "s3",
+        endpoint_url=settings.DIRECT_UPLOAD_ENDPOINT_URL or storage.endpoint_url,
+        region_name=storage.region_name,
+        config=storage.client_config.merge(
+            Config(signature_version="s3v4", request_checksum_calculation="when_required")
+        ),
+    )
+
+
+def create_upload(filename, size, sha256, content_type) -> dict:
+    name = f"{UPLOAD_PREFIX}/{uuid.uuid4()}/{get_valid_filename(filename)}"
+    checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+    url = get_presigning_client().generate_presigned_url(
+        "put_object",
+        Params=dict(
+            Bucket=default_storage.bucket_name,
+            Key=_key(name),
+            ContentType=content_type,
+            ContentLength=size,
+            ChecksumSHA256=checksum,
+        ),
+        ExpiresIn=settings.DIRECT_UPLOAD_EXPIRY,
+    )
+    upload = dict(name=name, filename=filename, size=size, sha256=sha256.lower(), content_type=content_type)
+    return dict(
+        upload_id=signing.dumps(upload, salt=SIGNING_SALT),
+        url=url,
+        method="PUT",
+        headers={"Content-Type": content_type, "x-amz-checksum-sha256": checksum},
+        expires_at=datetime.now(UTC) + timedelta(seconds=settings.DIRECT_UPLOAD_EXPIRY),
+    )
+
+
+def get_upload(upload_id) -> dict:
+    """The upload of `upload_id` once its object is in the storage, raises a `ValidationError` otherwise."""
+    try:
+        upload = signing.loads(
+            upload_id, salt=SIGNING_SALT, max_age=2 * settings.DIRECT_UPLOAD_EXPIRY
+        )
+    except signing.BadSignature:
+        raise exceptions.ValidationError({"upload_id": ["Invalid or expired upload."]})
+    try:
+        head = default_storage.connection.meta.client.head_object(
+            Bucket=default_storage.bucket_name, Key=_key(upload["name"]), ChecksumMode="ENABLED"
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ["404", "NoSuchKey", "NotFound"]:
+            raise
+        raise exceptions.ValidationError({"upload_id": ["The file has not been uploaded."]})
+    if head["ContentLength"] != upload["size"] or get_sha256(upload, head) != upload["sha256"]:
+        raise exceptions.ValidationError({"upload_id": ["The uploaded file does not match the upload."]})
+    return upload
+
+
+def get_sha256(upload, head) -> str:
+    """The sha256 of the uploaded object, hashed from its content when the storage does not return it."""
+    if checksum := head.get("ChecksumSHA256"):
+        return base64.b64decode(checksum).hex()
+    digest = hashlib.sha256()
+    with default_storage.open(upload["name"]) as f:
+        for chunk in f.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def move_to_file(file, upload):
+    """Move the object of an upload to the location of `file` (see `upload_to_func`)."""
+    name = file._meta.get_field("file").generate_filename(file, upload["filename"])
+    default_storage.bucket.Object(_key(name)).copy(
+        {"Bucket": default_storage.bucket_name, "Key": _key(upload["name"])}
+    )
+    discard(upload)
+    file.file.name = name
+    file.save(update_fields=["file"])
+
+
+def discard(upload):
+    default_storage.delete(upload["name"])
+
+
+def clear_expired_uploads():
+    """Remove the objects of uploads that can no longer be confirmed."""
+    if not is_enabled():
+        return
+    cutoff = datetime.now(UTC) - timedelta(seconds=2 * settings.DIRECT_UPLOAD_EXPIRY)
+    for obj in default_storage.bucket.objects.filter(Prefix=_key(UPLOAD_PREFIX) + "/"):
+        if obj.last_modified < cutoff:
+            obj.delete()
@@ -0,0 +1,163 @@
+"""
+Downloads of stored files (original files, archived PDFs and images) that never load the whole file in memory.
+
+How a download is served depends on `FILE_DOWNLOAD_MODE`:
+
+* `stream`: the file is streamed in chunks by Django, with support for `Range` (a single range, used by PDF
+  viewers for progressive loading) and `If-None-Match`/`If-Range` requests. Under ASGI the chunks are read
+  by an async iterator, one `sync_to_async` call at a time.
+* `redirect`: a redirect to a short lived presigned url of the object (`USE_S3_STORAGE=1` only, falls back to
+  `stream` otherwise).
+* `x-accel`: an `X-Accel-Redirect` to `FILE_DOWNLOAD_X_ACCEL_PREFIX` + the name of the file, so nginx (or another
+  proxy supporting the header) serves it.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from enum import StrEnum
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag
+from storages.backends.s3 import S3Storage
+
+from stixify.web.direct_uploads import get_presigning_client
+
+CHUNK_SIZE = 256 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class DownloadMode(StrEnum):
+    STREAM = "stream"
+    REDIRECT = "redirect"
+    X_ACCEL = "x-accel"
+
+
+@dataclass
+class StoredObject:
+    size: int
+    etag: str
+    last_modified: datetime
+
+
+def stat(field_file) -> StoredObject:
+    storage, name = field_file.storage, field_file.name
+    if isinstance(storage, S3Storage):
+        head = storage.connection.meta.client.head_object(
+            Bucket=storage.bucket_name, Key=storage._normalize_name(name)
+        )
+        return StoredObject(head["ContentLength"], head["ETag"], head["LastModified"])
+    st = os.stat(storage.path(name))
+    return StoredObject(st.st_size, quote_etag(f"{st.st_size:x}-{st.st_mtime_ns:x}"), datetime.fromtimestamp(st.st_mtime))
+
+
+def parse_range(header, size) -> tuple[int, int] | None:
+    """
+    The `[start, end]` bytes of a single range `Range` header, `None` when the whole file should be sent.
+    Raises `ValueError` when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or not any(match.groups()):  # multiple ranges or other units are not supported
+        return None
+    first, last = match.groups()
+    if not first:  # the last `last` bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def iter_content(field_file, start, end):
+    storage, name = field_file.storage, field_file.name
+    if isinstance(storage, S3Storage):
+        body = storage.bucket.Object(storage._normalize_name(name)).get(Range=f"bytes={start}-{end}")["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+        return
+    with storage.open(name, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0 and (chunk := f.read(min(CHUNK_SIZE, remaining))):
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def aiter_content(field_file, start, end):
+    # under ASGI, Django reads a sync iterator whole (`sync_to_async(list)`) before sending anything
+    chunks = iter_content(field_file, start, end)
+    try:
+        while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+def redirect_url(field_file, content_type, filename, attachment):
+    storage = field_file.storage
+    return get_presigning_client().generate_presigned_url(
+        "get_object",
+        Params=dict(
+            Bucket=storage.bucket_name,
+            Key=storage._normalize_name(field_file.name),
+            ResponseContentType=content_type,
+            ResponseContentDisposition=content_disposition_header(attachment, filename),
+        ),
+        ExpiresIn=settings.FILE_DOWNLOAD_URL_EXPIRY,
+    )
+
+
+def serve(request, field_file, content_type, filename=None, attachment=True):
+    """The response downloading `field_file` (a `FieldFile`) according to `FILE_DOWNLOAD_MODE`."""
+    filename = filename or field_file.name.rpartition("/")[2]
+    mode = settings.FILE_DOWNLOAD_MODE
+    if mode == DownloadMode.REDIRECT and isinstance(field_file.storage, S3Storage):
+        return HttpResponseRedirect(redirect_url(field_file, content_type, filename, attachment))
+    if mode == DownloadMode.X_ACCEL:
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.FILE_DOWNLOAD_X_ACCEL_PREFIX + quote(field_file.name)
+        response["Content-Disposition"] = content_disposition_header(attachment, filename)
+        return response
+
+    obj = stat(field_file)
+    last_modified = int(obj.last_modified.timestamp())
+    if response := get_conditional_response(request, etag=obj.etag, last_modified=last_modified):
+        return response
+
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    if not if_range or if_range == obj.etag:
+        try:
+            byte_range = parse_range(request.headers.get("Range"), obj.size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{obj.size}"
+            return response
+
+    start, end = byte_range or (0, obj.size - 1)
+    content = iter([])
+    if obj.size:
+        is_asgi = isinstance(getattr(request, "_request", request), ASGIRequest)
+        content = (aiter_content if is_asgi else iter_content)(field_file, start, end)
+    response = StreamingHttpResponse(
+        content,
+        status=206 if byte_range else 200,
+        content_type=content_type,
+    )
+    if byte_range:
+        response["Content-Range"] = f"bytes {start}-{end}/{obj.size}"
+    response["Content-Length"] = end - start + 1
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = obj.etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Content-Disposition"] = content_disposition_header(attachment, filename)
+    return response
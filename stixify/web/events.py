@@ -0,0 +1,99 @@
+"""
+Job progress events.
+
+Workers publish job state transitions and stage progress to a redis pub/sub channel per job (on the celery broker),
+`GET /api/v1/jobs/{job_id}/events/` streams them to clients as server-sent events.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+CHANNEL_PREFIX = "stixify:job-events:"
+KEEPALIVE_INTERVAL = 15
+TERMINAL_STATES = ["completed", "failed"]
+
+
+def channel_name(job_id):
+    return CHANNEL_PREFIX + str(job_id)
+
+
+def is_enabled():
+    return settings.CELERY_BROKER_URL.startswith(("redis://", "rediss://"))
+
+
+@functools.cache
+def get_client():
+    return redis.Redis.from_url(settings.CELERY_BROKER_URL)
+
+
+def publish(job_id, event, **data):
+    """Publish an event for a job, never raises so that a redis failure does not fail the job."""
+    if not is_enabled():
+        return
+    try:
+        get_client().publish(
+            channel_name(job_id), json.dumps(dict(data, event=event, job_id=str(job_id)))
+        )
+    except Exception as e:
+        logging.warning("failed to publish %s event for job %s: %s", event, job_id, e)
+
+
+def publish_state(job_id, state, **data):
+    publish(job_id, "state", state=state, **data)
+
+
+def publish_stage(job_id, stage, status, **data):
+    publish(job_id, "stage", stage=stage, status=status, **data)
+
+
+def format_event(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+@contextlib.asynccontextmanager
+async def subscribe(job_id):
+    """Subscribe to the events of a job, yields an async iterator of events (`None` when no event arrived in time)."""
+    client = redis.asyncio.Redis.from_url(settings.CELERY_BROKER_URL)
+    pubsub = client.pubsub()
+    await pubsub.subscribe(channel_name(job_id))
+
+    async def events():
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=KEEPALIVE_INTERVAL
+            )
+            yield message and json.loads(message["data"])
+
+    try:
+        yield events()
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
+
+
+async def stream(job_id, get_snapshot):
+    """
+    Server-sent events for a job; the current state first (from `get_snapshot`, read after subscribing so no
+    transition is missed), then the published events until the job completes or fails.
+    """
+    if not is_enabled():  # nothing is published without a redis broker
+        yield format_event(await get_snapshot())
+        return
+    async with subscribe(job_id) as events:
+        snapshot = await get_snapshot()
+        yield format_event(snapshot)
+        if snapshot["state"] in TERMINAL_STATES:
+            return
+        async for event in events:
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(event)
+            if event["event"] == "state" and event["state"] in TERMINAL_STATES:
+                return
@@ -9,6 +9,8 @@ from dogesec_commons.identity.models import Identity
 from dogesec_commons.objects.helpers import ArangoDBHelper
 from django.conf import settings
 
+from .arango_indexes import EDGE_COLLECTION, VERTEX_COLLECTION
+
 if typing.TYPE_CHECKING:
     from .. import settings
 
@@ -31,32 +33,33 @@ def delete_identity_cleanup(identity: Identity):
     assert isinstance(identity_id, str)
 
     helper = ArangoDBHelper(settings.VIEW_NAME, None)
-    vertices = helper.execute_query(
-        """
-        FOR doc IN @@view
-        FILTER doc.id == @identity_id OR doc.created_by_ref == @identity_id
-        RETURN doc._id
-    """,
-        bind_vars={"identity_id": identity_id, "@view": settings.VIEW_NAME},
-        paginate=False,
-    )
+    # the collections are queried instead of the view so the indexes are used (see `arango_indexes`)
+    objects = []
+    for collection in [VERTEX_COLLECTION, EDGE_COLLECTION]:
+        objects.extend(
+            helper.execute_query(
+                """
+                FOR doc IN @@collection
+                FILTER doc.id == @identity_id OR doc.created_by_ref == @identity_id
+                RETURN doc._id
+            """,
+                bind_vars={"identity_id": identity_id, "@collection": collection},
+                paginate=False,
+            )
+        )
 
-    objects = helper.execute_query(
-        """
-        FOR doc IN @@view
-        FILTER
-                doc.id == @identity_id OR
-                doc.created_by_ref == @identity_id OR
-                doc._from IN @vertex_ids OR doc._to IN @vertex_ids
-        RETURN doc._id
-    """,
-        bind_vars={
-            "identity_id": identity_id,
-            "@view": settings.VIEW_NAME,
-            "vertex_ids": vertices,
-        },
-        paginate=False,
+    objects.extend(
+        helper.execute_query(
+            """
+            FOR doc IN @@collection
+            FILTER doc._from IN @object_ids OR doc._to IN @object_ids
+            RETURN doc._id
+        """,
+            bind_vars={"object_ids": objects, "@collection": EDGE_COLLECTION},
+            paginate=False,
+        )
     )
+    objects = list(dict.fromkeys(objects))
 
     logging.info(f"removing {len(objects)} objects")
     for collection, documents in classify_objects(objects).items():
@@ -40,6 +40,7 @@ class Command(BaseCommand):
             id=uuid.uuid4(),
             type=models.JobType.BUILD_EMBEDDINGS,
             state=models.JobState.PROCESSING,
+            priority=models.JobPriority.CLUSTERING,
         )
 
         self.stdout.write(f"Running embedding build for job {job.id}...")
@@ -0,0 +1,58 @@
+"""
+Management command creating the ArangoDB indexes, analyzers and search view used by Stixify's queries
+(see `stixify.web.arango_indexes`).
+
+Indexes that already exist are left alone, so it can be run on every deployment.
+
+Usage:
+    python manage.py ensure_arango_indexes
+    python manage.py ensure_arango_indexes --check
+    python manage.py ensure_arango_indexes --explain
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stixify.web import arango_indexes
+
+
+class Command(BaseCommand):
+    help = "Create the missing ArangoDB indexes used by Stixify"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only list the missing indexes, fails if there are any",
+        )
+        parser.add_argument(
+            "--explain",
+            action="store_true",
+            help="Show the indexes used by the main queries and the collections they still scan",
+        )
+
+    def handle(self, *args, **options):
+        db = arango_indexes.get_db()
+        if options["explain"]:
+            return self.explain(db)
+        if options["check"]:
+            missing = [f"index {index['name']} on {collection}" for collection, index in arango_indexes.missing_indexes(db)]
+            missing += [f"{kind} {name}" for kind, name in arango_indexes.missing_search(db)]
+            for name in missing:
+                self.stdout.write(self.style.WARNING(f"Missing {name}"))
+            if missing:
+                raise CommandError(f"{len(missing)} index(es) missing")
+            self.stdout.write(self.style.SUCCESS("All indexes exist"))
+            return
+
+        created = [f"index {index['name']} on {collection}" for collection, index in arango_indexes.ensure_indexes(db)]
+        created += [f"{kind} {name}" for kind, name in arango_indexes.ensure_search(db)]
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} index(es) created"))
+
+    def explain(self, db):
+        for plan in arango_indexes.explain(db):
+            if plan.full_scans:
+                self.stdout.write(self.style.WARNING(f"{plan.name}: full scan of {', '.join(plan.full_scans)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{plan.name}: uses {', '.join(plan.indexes)}"))
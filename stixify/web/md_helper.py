@@ -1,6 +1,10 @@
 ## markdown helper
+import hashlib
 import textwrap
+import uuid
 from urllib.parse import urljoin
+from django.conf import settings
+from django.core.cache import cache
 import mistune, hyperlink
 from mistune.renderers.markdown import MarkdownRenderer
 from mistune.util import unescape
@@ -29,3 +33,25 @@ class MarkdownImageReplacer(MarkdownRenderer):
     def get_markdown(cls, url, md_text, images):
         modify_links = mistune.create_markdown(escape=False, renderer=cls(url, images))
         return modify_links(md_text)
+
+
+# the markdown of a File rendered by `MarkdownImageReplacer` is cached by file, version and url (the base of
+# relative image urls). Changing the markdown or the images of a File changes its version.
+MARKDOWN_CACHE_PREFIX = "file-markdown"
+
+
+def _version_key(file_id):
+    return f"{MARKDOWN_CACHE_PREFIX}:{file_id}:version"
+
+
+def markdown_cache_keys(file_id, url):
+    """The `(etag, content)` cache keys of the markdown of a File rendered for `url`."""
+    version = cache.get_or_set(
+        _version_key(file_id), lambda: uuid.uuid4().hex, settings.MARKDOWN_CACHE_SECONDS
+    )
+    key = f"{MARKDOWN_CACHE_PREFIX}:{file_id}:{version}:{hashlib.sha256(url.encode()).hexdigest()[:16]}"
+    return f"{key}:etag", f"{key}:content"
+
+
+def invalidate_markdown_cache(file_id):
+    cache.delete(_version_key(file_id))
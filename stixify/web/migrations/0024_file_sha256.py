@@ -0,0 +1,25 @@
+# Generated by Django 5.2.15 on 2026-10-17 21:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0001_initial'),
+        ('dogesec_identity', '0001_initial'),
+        ('dogesec_stixifier', '0009_profile_include_embedded_relationships_attributes'),
+        ('stixify_core', '0023_objectvalue_stixify_ov_kb_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='sha256',
+            field=models.CharField(default=None, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['sha256', 'profile', 'mode'], name='stixify_file_sha256_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.15 on 2026-10-17 21:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stixify_core', '0024_file_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='batch_id',
+            field=models.UUIDField(db_index=True, default=None, null=True),
+        ),
+    ]
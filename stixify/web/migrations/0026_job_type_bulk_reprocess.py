@@ -0,0 +1,18 @@
+# Generated by Django 5.2.15 on 2026-10-17 21:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stixify_core', '0025_job_batch_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='type',
+            field=models.CharField(choices=[('import-file', 'Import File'), ('reprocess-posts', 'Reprocess Posts'), ('bulk-reprocess-posts', 'Bulk Reprocess Posts'), ('sync-knowledgebase', 'Sync Knowledgebase'), ('build-clusters', 'Build Clusters'), ('build-embeddings', 'Build Embeddings')], default='import-file', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.15 on 2026-10-17 21:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stixify_core', '0026_job_type_bulk_reprocess'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileimage',
+            name='sha256',
+            field=models.CharField(db_index=True, default=None, max_length=64, null=True),
+        ),
+    ]
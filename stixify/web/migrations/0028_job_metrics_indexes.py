@@ -0,0 +1,21 @@
+# Generated by Django 5.2.15 on 2026-10-17 22:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stixify_core', '0027_fileimage_sha256'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('state__in', ['pending', 'processing'])), fields=['state', 'run_datetime', 'type'], name='stixify_job_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('completion_time__isnull', False)), fields=['completion_time'], name='stixify_job_completion_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.15 on 2026-10-17 22:07
+
+from django.db import migrations, models
+
+def set_existing_priorities(apps, schema_editor):
+    Job = apps.get_model('stixify_core', 'Job')
+    Job.objects.filter(type__in=['reprocess-posts', 'bulk-reprocess-posts']).update(priority='reprocess')
+    Job.objects.filter(type='sync-knowledgebase').update(priority='sync')
+    Job.objects.filter(type__in=['build-clusters', 'build-embeddings']).update(priority='clustering')
+    Job.objects.filter(type='import-file', batch_id__isnull=False).update(priority='bulk')
+    # existing jobs were already queued, except the files of bulk reprocess jobs that are not dispatched yet
+    Job.objects.exclude(type='reprocess-posts', batch_id__isnull=False, state='pending').update(queued_time=models.F('run_datetime'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stixify_core', '0028_job_metrics_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='priority',
+            field=models.CharField(choices=[('interactive', 'Interactive'), ('bulk', 'Bulk'), ('reprocess', 'Reprocess'), ('sync', 'Sync'), ('clustering', 'Clustering')], default='interactive', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='queued_time',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.RunPython(
+            set_existing_priorities,
+            reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.15 on 2026-10-17 22:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+def move_navigator_layers(apps, schema_editor):
+    File = apps.get_model('stixify_core', 'File')
+    FileNavigatorLayer = apps.get_model('stixify_core', 'FileNavigatorLayer')
+    for file in File.objects.filter(txt2stix_data__has_key='navigator_layer').only('id', 'txt2stix_data').iterator(chunk_size=100):
+        layers = file.txt2stix_data.pop('navigator_layer') or []
+        FileNavigatorLayer.objects.bulk_create(
+            FileNavigatorLayer(file=file, domain=layer['domain'].removesuffix('-attack'), layer=layer)
+            for layer in layers
+        )
+        File.objects.filter(pk=file.pk).update(txt2stix_data=file.txt2stix_data)
+
+
+def restore_navigator_layers(apps, schema_editor):
+    File = apps.get_model('stixify_core', 'File')
+    FileNavigatorLayer = apps.get_model('stixify_core', 'FileNavigatorLayer')
+    layers = {}
+    for layer in FileNavigatorLayer.objects.order_by('domain').iterator():
+        layers.setdefault(layer.file_id, []).append(layer.layer)
+    for file in File.objects.filter(pk__in=layers).only('id', 'txt2stix_data').iterator(chunk_size=100):
+        File.objects.filter(pk=file.pk).update(txt2stix_data={**(file.txt2stix_data or {}), 'navigator_layer': layers[file.pk]})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stixify_core', '0029_job_priority'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileNavigatorLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=16)),
+                ('layer', models.JSONField()),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='navigator_layers', to='stixify_core.file')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('file', 'domain'), name='stixify_navigator_layer_domain_unique')],
+            },
+        ),
+        migrations.RunPython(move_navigator_layers, restore_navigator_layers),
+    ]
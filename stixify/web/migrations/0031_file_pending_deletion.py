@@ -0,0 +1,23 @@
+# Generated by Django 5.2.15 on 2026-10-17 22:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stixify_core', '0030_file_navigator_layer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='pending_deletion',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='type',
+            field=models.CharField(choices=[('import-file', 'Import File'), ('reprocess-posts', 'Reprocess Posts'), ('bulk-reprocess-posts', 'Bulk Reprocess Posts'), ('sync-knowledgebase', 'Sync Knowledgebase'), ('build-clusters', 'Build Clusters'), ('build-embeddings', 'Build Embeddings'), ('delete-report', 'Delete Report')], default='import-file', max_length=64),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.15 on 2026-10-17 22:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0001_initial'),
+        ('dogesec_identity', '0001_initial'),
+        ('dogesec_stixifier', '0009_profile_include_embedded_relationships_attributes'),
+        ('stixify_core', '0031_file_pending_deletion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['created', 'id'], name='stixify_file_created_idx'),
+        ),
+    ]
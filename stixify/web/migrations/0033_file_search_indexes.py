@@ -0,0 +1,49 @@
+# Generated by Django 5.2.15 on 2026-10-17 23:19
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+import stixify.web.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifier', '0001_initial'),
+        ('dogesec_identity', '0001_initial'),
+        ('dogesec_stixifier', '0009_profile_include_embedded_relationships_attributes'),
+        ('stixify_core', '0032_file_created_idx'),
+    ]
+
+    operations = [
+        # the trigram indexes use `pg_trgm`, enabled by 0014
+        migrations.RunSQL(
+            sql="""
+            CREATE OR REPLACE FUNCTION stixify_report_labels(labels varchar[], classifications varchar[])
+            RETURNS text
+            LANGUAGE sql
+            IMMUTABLE
+            PARALLEL SAFE
+            AS $$
+                SELECT array_to_string(
+                    COALESCE(labels::text[], '{}')
+                    || ARRAY(SELECT 'classification.' || c FROM unnest(classifications) AS c),
+                    E'\\n'
+                )
+            $$;
+            """,
+            reverse_sql="DROP FUNCTION IF EXISTS stixify_report_labels(varchar[], varchar[]);",
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='stixify_file_name_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(stixify.web.models.ReportLabels()), name='gin_trgm_ops'), name='stixify_file_labels_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ai_incident_classification'], name='stixify_file_classification_idx'),
+        ),
+    ]
@@ -1,13 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
 from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django_cleanup import cleanup
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db.models.fields.json import KeyTextTransform
 from django.db.models.functions import Upper
 from django.core.cache import cache
+import hashlib
 import uuid, typing
 from stixify.classifier.models import Cluster, DocumentEmbedding
 from stixify.classifier.tasks import compute_embedding_for_document, create_embedding_text
@@ -15,6 +21,7 @@ import txt2stix, txt2stix.extractions
 from django.core.exceptions import ValidationError
 from datetime import UTC, datetime, timezone
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.base import ContentFile
 import stix2
 from file2txt.parsers.core import BaseParser
 from dogesec_commons.stixifier.models import Profile
@@ -23,6 +30,8 @@ from dogesec_commons.identity.models import Identity
 from sklearn.metrics.pairwise import cosine_similarity
 from pgvector.django import CosineDistance
 
+from .md_helper import invalidate_markdown_cache
+
 
 if typing.TYPE_CHECKING:
     from .. import settings
@@ -97,6 +106,17 @@ def validate_file(file: InMemoryUploadedFile, mode: str):
         raise ValidationError(f"Unsupported file extension `{ext}`")
     return True
 
+class ReportLabels(models.Func):
+    """
+    The labels of the report of a File (its `labels` and a `classification.<x>` label for every AI classification),
+    one per line. `stixify_report_labels` is created by migration 0033, it is immutable so it can be indexed.
+    """
+    function = "stixify_report_labels"
+    output_field = models.TextField()
+
+    def __init__(self, **extra):
+        super().__init__("labels", "ai_incident_classification", **extra)
+
 class File(CommonSTIXProps):
     id = models.UUIDField(unique=True, max_length=64, primary_key=True, default=uuid.uuid4)
     file = models.FileField(max_length=1024, upload_to=upload_to_func)
@@ -116,7 +136,19 @@ class File(CommonSTIXProps):
     txt2stix_data = models.JSONField(default=None, null=True)
     sources = ArrayField(base_field=models.CharField(default=None, max_length=256), null=True, default=None)
     embedding = models.OneToOneField(DocumentEmbedding, on_delete=models.SET_NULL, null=True)
-    
+    sha256 = models.CharField(max_length=64, null=True, default=None)
+    pending_deletion = models.BooleanField(default=False)  # being deleted by a `delete-report` job
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["sha256", "profile", "mode"], name="stixify_file_sha256_idx"),
+            models.Index(fields=["created", "id"], name="stixify_file_created_idx"),
+            # `icontains` filters of the file and report lists
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="stixify_file_name_trgm_idx"),
+            GinIndex(OpClass(Upper(ReportLabels()), name="gin_trgm_ops"), name="stixify_file_labels_trgm_idx"),
+            GinIndex(fields=["ai_incident_classification"], name="stixify_file_classification_idx"),
+        ]
+
     @property
     def report_id(self):
         return 'report--'+str(self.id)
@@ -151,6 +183,51 @@ class File(CommonSTIXProps):
             return 'pdf'
         return self.mode
     
+    @staticmethod
+    def compute_sha256(file) -> str:
+        if sha256 := getattr(file, "sha256", None):  # set by `DigestUploadHandlerMixin`
+            return sha256
+        digest = hashlib.sha256()
+        for chunk in file.chunks():
+            digest.update(chunk)
+        file.seek(0)
+        return digest.hexdigest()
+
+    def find_duplicate(self) -> "File|None":
+        """Latest processed File with the same content, profile and mode."""
+        if not self.sha256:
+            return None
+        return (
+            File.objects.filter(sha256=self.sha256, profile_id=self.profile_id, mode=self.mode, pending_deletion=False)
+            .exclude(pk=self.pk)
+            .exclude(txt2stix_data=None)
+            .exclude(markdown_file="")
+            .exclude(markdown_file=None)
+            .order_by("-created")
+            .first()
+        )
+
+    def clone_processed_data(self, source: "File"):
+        """Copy the extraction data, markdown and archived pdf of `source` into this File, images are shared."""
+        self.txt2stix_data = source.txt2stix_data
+        self.set_navigator_layers([layer.layer for layer in source.navigator_layers.all()])
+        with source.markdown_file.open("rb") as f:
+            self.markdown_file.save("markdown.md", ContentFile(f.read()), save=False)
+        if source.pdf_file:
+            _, _, pdf_name = source.pdf_file.name.rpartition("/")
+            with source.pdf_file.open("rb") as f:
+                self.pdf_file.save(pdf_name.removeprefix(f"{source.id}_"), ContentFile(f.read()), save=False)
+        self.save(update_fields=["txt2stix_data", "markdown_file", "pdf_file"])
+        with transaction.atomic():
+            FileImage.objects.filter(report=self).delete()
+            # the images of `source` can be deleted meanwhile, they are only referenced if they still exist
+            for name in sorted(set(source.images.values_list("file", flat=True))):
+                lock_image(name)
+            FileImage.objects.bulk_create(
+                FileImage(report=self, file=image.file.name, name=image.name, sha256=image.sha256)
+                for image in source.images.all()
+            )
+
     def set_txt2stix_data(self, txt2stix_data):
         from txt2stix.txt2stix import Txt2StixData
         if txt2stix_data is None:
@@ -160,6 +237,7 @@ class File(CommonSTIXProps):
         self.txt2stix_data = txt2stix_data.model_dump(
             mode="json", exclude_unset=True, exclude_none=True
         )
+        self.set_navigator_layers(self.txt2stix_data.pop("navigator_layer", None) or [])
         if txt2stix_data.content_check:
             self.ai_describes_incident = txt2stix_data.content_check.describes_incident
             self.ai_incident_summary = txt2stix_data.content_check.explanation
@@ -178,6 +256,22 @@ class File(CommonSTIXProps):
             ]
         )
         
+    def get_txt2stix_data(self):
+        """`txt2stix_data` with the navigator layers (stored in `FileNavigatorLayer`) put back."""
+        if self.txt2stix_data is None:
+            return None
+        data = dict(self.txt2stix_data)
+        if layers := [layer.layer for layer in self.navigator_layers.order_by("domain")]:
+            data["navigator_layer"] = layers
+        return data
+
+    def set_navigator_layers(self, layers: list[dict]):
+        self.navigator_layers.all().delete()
+        FileNavigatorLayer.objects.bulk_create(
+            FileNavigatorLayer(file=self, domain=FileNavigatorLayer.get_domain(layer), layer=layer)
+            for layer in layers
+        )
+
     def similar_posts(file, visible_to=None):
         if not file.embedding:
             return []
@@ -232,16 +326,118 @@ class File(CommonSTIXProps):
             file.save(update_fields=["embedding"])
 
 
+class FileNavigatorLayer(models.Model):
+    """
+    An ATT&CK Navigator layer created by txt2stix. Layers can be large, they are kept out of
+    `File.txt2stix_data` so they are only loaded by the attack navigator endpoints.
+    """
+
+    file = models.ForeignKey(File, related_name="navigator_layers", on_delete=models.CASCADE)
+    domain = models.CharField(max_length=16)  # `enterprise`, `mobile` or `ics`
+    layer = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["file", "domain"], name="stixify_navigator_layer_domain_unique"),
+        ]
+
+    @staticmethod
+    def get_domain(layer: dict) -> str:
+        return layer["domain"].removesuffix("-attack")
+
+
+@receiver(post_save, sender=File)
+def invalidate_markdown_on_save(sender, instance: File, update_fields=None, **kwargs):
+    if update_fields is None or "markdown_file" in update_fields:
+        transaction.on_commit(lambda: invalidate_markdown_cache(instance.id))
+
+
 @receiver(post_delete, sender=File)
 def remove_reports_on_delete(sender, instance: File, **kwargs):
-    from .views import ReportView
-    ReportView.remove_report(instance.report_id)
+    if getattr(instance, "report_removed", False):  # deleted by a `delete-report` job
+        return
+    from stixify.worker import tasks
+    report_id = instance.report_id
+    transaction.on_commit(lambda: tasks.create_deletion_job(report_id=report_id))
 
 
+@cleanup.ignore  # stored images can be shared, see `delete_unreferenced_image`
 class FileImage(models.Model):
+    CONTENT_ROOT = "images"
+
     report = models.ForeignKey(File, related_name='images', on_delete=models.CASCADE)
     file = models.ImageField(upload_to=upload_to_func, max_length=1024)
     name = models.CharField(max_length=256)
+    sha256 = models.CharField(max_length=64, null=True, default=None, db_index=True)
+
+    @classmethod
+    def content_path(cls, sha256, name):
+        _, ext = os.path.splitext(name)
+        return f"{cls.CONTENT_ROOT}/{sha256[:2]}/{sha256}{ext}"
+
+    @classmethod
+    def store_images(cls, report: File, images: list) -> list["FileImage"]:
+        """
+        Upload `images` (named file-like objects) to the default storage, addressed by their content so that
+        byte-identical images are stored once. Uploads run concurrently, the returned (unsaved) FileImages
+        should be created with `create_stored`.
+        """
+        paths = {}
+        file_images = []
+        for image in images:
+            image.seek(0)
+            content = image.read()
+            sha256 = hashlib.sha256(content).hexdigest()
+            paths.setdefault(cls.content_path(sha256, image.name), content)
+            file_image = cls(report=report, file=cls.content_path(sha256, image.name), name=image.name, sha256=sha256)
+            file_image.content = content  # to upload it again in `create_stored` if needed
+            file_images.append(file_image)
+
+        def upload(path):
+            if not default_storage.exists(path):
+                default_storage.save(path, ContentFile(paths[path]))
+
+        with ThreadPoolExecutor(max_workers=settings.IMAGE_UPLOAD_CONCURRENCY) as executor:
+            list(executor.map(upload, paths))
+        return file_images
+
+    @classmethod
+    def create_stored(cls, file_images: list["FileImage"]) -> list["FileImage"]:
+        """
+        Create the FileImages returned by `store_images`. An image whose last reference was deleted since it was
+        checked by `store_images` may have been removed by then, it is uploaded again.
+        """
+        stored = {image.file.name: image.content for image in file_images}
+        with transaction.atomic():  # the images stay locked until the references are committed
+            for name in sorted(stored):
+                lock_image(name)
+                if not default_storage.exists(name):
+                    default_storage.save(name, ContentFile(stored[name]))
+            return cls.objects.bulk_create(file_images)
+
+
+def lock_image(name):
+    # serializes the references to a stored image and its deletion until the end of the transaction
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [f"stixify-image-{name}"])
+
+
+@receiver(post_delete, sender=FileImage)
+def delete_unreferenced_image(sender, instance: FileImage, **kwargs):
+    name = instance.file.name
+
+    @transaction.atomic
+    def delete_if_unreferenced():
+        # checked once committed, the same image may have been referenced again in the transaction,
+        # or concurrently by `FileImage.create_stored`
+        lock_image(name)
+        if not FileImage.objects.filter(file=name).exists():
+            default_storage.delete(name)
+
+    if name:
+        transaction.on_commit(delete_if_unreferenced)
+    # images are replaced (deleted then created again) when the markdown is
+    transaction.on_commit(lambda: invalidate_markdown_cache(instance.report_id))
 
 
 class JobState(models.TextChoices):
@@ -253,9 +449,19 @@ class JobState(models.TextChoices):
 class JobType(models.TextChoices):
     IMPORT_FILE = "import-file"
     REPROCESS_POSTS = "reprocess-posts"
+    BULK_REPROCESS_POSTS = "bulk-reprocess-posts"
     SYNC_KNOWLEDGEBASE = "sync-knowledgebase"
     BUILD_CLUSTERS = "build-clusters"
     BUILD_EMBEDDINGS = "build-embeddings"
+    DELETE_REPORT = "delete-report"
+
+class JobPriority(models.TextChoices):
+    """Priority classes of jobs, most urgent first (see `stixify.worker.celery.JOB_PRIORITIES`)."""
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+    REPROCESS = "reprocess"
+    SYNC = "sync"
+    CLUSTERING = "clustering"
 
 
 class Job(models.Model):
@@ -267,6 +473,24 @@ class Job(models.Model):
     error = models.CharField(max_length=65536, null=True)
     run_datetime = models.DateTimeField(auto_now_add=True)
     completion_time = models.DateTimeField(null=True, default=None)
+    batch_id = models.UUIDField(null=True, default=None, db_index=True)
+    priority = models.CharField(max_length=20, choices=JobPriority.choices, default=JobPriority.INTERACTIVE)
+    queued_time = models.DateTimeField(null=True, default=None)  # when the job was sent to the workers
+
+    class Meta:
+        indexes = [
+            # the (few) pending and processing jobs, counted by the queue metrics
+            models.Index(
+                fields=["state", "run_datetime", "type"],
+                name="stixify_job_active_idx",
+                condition=models.Q(state__in=["pending", "processing"]),
+            ),
+            models.Index(
+                fields=["completion_time"],
+                name="stixify_job_completion_idx",
+                condition=models.Q(completion_time__isnull=False),
+            ),
+        ]
 
     def save(self, *args, **kwargs) -> None:
         return super().save(*args, **kwargs)
@@ -0,0 +1,246 @@
+"""
+Backlog and throughput metrics for autoscaling, as JSON or in the Prometheus text format.
+
+Everything is read from the broker (queue depths) and from indexed queries on `Job` (the active jobs are
+covered by a partial index, finished jobs are found by their `completion_time`), and the result is cached for
+a few seconds so frequent scrapes don't add load.
+"""
+
+import logging
+import textwrap
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Aggregate, Count, F, FloatField, Min, Q
+from django.db.models.functions import Extract
+from django.utils import timezone
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiResponse, extend_schema, extend_schema_serializer
+from rest_framework import renderers, serializers, viewsets
+from rest_framework.response import Response
+
+from stixify.web.models import Job, JobPriority, JobState, JobType
+from stixify.worker import ratelimit
+from stixify.worker.celery import PIPELINE_QUEUES, app as celery_app
+
+CACHE_KEY = "queue-metrics-cache"
+CACHE_SECONDS = 10
+THROUGHPUT_WINDOW_MINUTES = 15
+ACTIVE_STATES = [JobState.PENDING, JobState.PROCESSING]
+FINISHED_STATES = [JobState.COMPLETED, JobState.FAILED]
+
+
+class Percentile(Aggregate):
+    function = "PERCENTILE_CONT"
+    template = "%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, percentile, **extra):
+        super().__init__(expression, percentile=percentile, **extra)
+
+
+def get_queues():
+    return [celery_app.conf.task_default_queue, *sorted(set(PIPELINE_QUEUES.values()))]
+
+
+def queue_depths():
+    """Messages waiting in every queue, queues that can't be read are left out."""
+    depths = {}
+    try:
+        with celery_app.connection_for_read() as connection:
+            connection.ensure_connection(max_retries=1)
+            for queue in get_queues():
+                with connection.channel() as channel:
+                    try:
+                        depths[queue] = channel.queue_declare(queue, passive=True).message_count
+                    except connection.channel_errors:  # not declared yet (or empty with redis)
+                        depths[queue] = 0
+    except Exception as e:
+        logging.warning("failed to read queue depths: %s", e)
+    return depths
+
+
+def active_jobs():
+    """Pending and processing jobs by type, and by priority class along with the jobs waiting to be queued."""
+    jobs = {job_type: {state: 0 for state in ACTIVE_STATES} for job_type in JobType.values}
+    priorities = {
+        priority: {state: 0 for state in [*ACTIVE_STATES, "waiting"]}
+        for priority in JobPriority.values
+    }
+    for row in (
+        Job.objects.filter(state__in=ACTIVE_STATES)
+        .values("type", "state", "priority")
+        .annotate(count=Count("id"), waiting=Count("id", filter=Q(queued_time__isnull=True)))
+        .order_by()
+    ):
+        by_type = jobs.setdefault(row["type"], {})
+        by_type[row["state"]] = by_type.get(row["state"], 0) + row["count"]
+        by_priority = priorities[row["priority"]]
+        by_priority[row["state"]] += row["count"]
+        if row["type"] in [JobType.IMPORT_FILE, JobType.REPROCESS_POSTS]:
+            by_priority["waiting"] += row["waiting"]
+    return jobs, priorities
+
+
+def oldest_pending_job_age(now):
+    oldest = Job.objects.filter(state=JobState.PENDING).aggregate(oldest=Min("run_datetime"))["oldest"]
+    return oldest and round((now - oldest).total_seconds(), 3)
+
+
+def finished_jobs(since):
+    completed = Q(state=JobState.COMPLETED)
+    latency = Extract(F("completion_time") - F("run_datetime"), "epoch")
+    jobs = {}
+    for row in (
+        Job.objects.filter(completion_time__gte=since, state__in=FINISHED_STATES)
+        .values("type")
+        .annotate(
+            completed=Count("id", filter=completed),
+            failed=Count("id", filter=Q(state=JobState.FAILED)),
+            latency_p50=Percentile(latency, 0.5, filter=completed),
+            latency_p95=Percentile(latency, 0.95, filter=completed),
+        )
+        .order_by()
+    ):
+        jobs[row.pop("type")] = row
+    return jobs
+
+
+def build_metrics():
+    now = timezone.now()
+    finished = finished_jobs(now - timedelta(minutes=THROUGHPUT_WINDOW_MINUTES))
+    files_completed = finished.get(JobType.IMPORT_FILE, {}).get("completed", 0)
+    jobs, priorities = active_jobs()
+    return {
+        "time": now,
+        "queues": queue_depths(),
+        "jobs": jobs,
+        "priorities": priorities,
+        "oldest_pending_job_age": oldest_pending_job_age(now),
+        "throughput": {
+            "window_minutes": THROUGHPUT_WINDOW_MINUTES,
+            "files_per_minute": round(files_completed / THROUGHPUT_WINDOW_MINUTES, 3),
+            "jobs": finished,
+        },
+        "ai_rate_limits": ratelimit.get_metrics(),
+    }
+
+
+def get_metrics():
+    return cache.get_or_set(CACHE_KEY, build_metrics, timeout=CACHE_SECONDS)
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+AI_RATE_LIMIT_METRICS = {
+    "requests": ("stixify_ai_requests_total", "counter"),
+    "tokens": ("stixify_ai_tokens_total", "counter"),
+    "wait_seconds": ("stixify_ai_rate_limit_wait_seconds_total", "counter"),
+    "rate_limited": ("stixify_ai_rate_limited_total", "counter"),
+    "rate_factor": ("stixify_ai_rate_factor", "gauge"),
+}
+
+
+def to_prometheus(data) -> str:
+    metrics = {}
+
+    def add(name, kind, value, **labels):
+        metrics.setdefault((name, kind), []).append(
+            f"{name}{_labels(**labels) if labels else ''} {value}"
+        )
+
+    for queue, depth in data["queues"].items():
+        add("stixify_queue_depth", "gauge", depth, queue=queue)
+    for job_type, states in data["jobs"].items():
+        for state, count in states.items():
+            add("stixify_jobs", "gauge", count, type=job_type, state=state)
+    for priority, states in data["priorities"].items():
+        for state, count in states.items():
+            add("stixify_jobs_by_priority", "gauge", count, priority=priority, state=state)
+    add("stixify_oldest_pending_job_age_seconds", "gauge", data["oldest_pending_job_age"] or 0)
+    throughput = data["throughput"]
+    add("stixify_files_per_minute", "gauge", throughput["files_per_minute"])
+    for job_type, finished in throughput["jobs"].items():
+        for state in ["completed", "failed"]:
+            add("stixify_jobs_finished", "gauge", finished[state], type=job_type, state=state)
+        for quantile, key in [("0.5", "latency_p50"), ("0.95", "latency_p95")]:
+            if (latency := finished[key]) is not None:
+                add("stixify_job_latency_seconds", "gauge", latency, type=job_type, quantile=quantile)
+    for limit, values in data["ai_rate_limits"].items():
+        for key, value in values.items():
+            if key in AI_RATE_LIMIT_METRICS:
+                add(*AI_RATE_LIMIT_METRICS[key], value, limit=limit)
+
+    lines = []
+    for (name, kind), samples in metrics.items():
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    media_type = "text/plain"
+    format = "prometheus"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = renderer_context and renderer_context.get("response")
+        if response is not None and response.status_code != 200:  # errors stay JSON-like
+            return renderers.JSONRenderer().render(data)
+        return to_prometheus(data).encode(self.charset)
+
+
+class FinishedJobsSerializer(serializers.Serializer):
+    completed = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    latency_p50 = serializers.FloatField(allow_null=True, help_text="Median seconds from `run_datetime` to `completion_time` of the completed jobs.")
+    latency_p95 = serializers.FloatField(allow_null=True)
+
+
+class ThroughputSerializer(serializers.Serializer):
+    window_minutes = serializers.IntegerField()
+    files_per_minute = serializers.FloatField(help_text="`import-file` jobs completed per minute over the window.")
+    jobs = serializers.DictField(child=FinishedJobsSerializer(), help_text="Jobs that finished within the window, by job type.")
+
+
+@extend_schema_serializer(many=False)
+class QueueMetricsSerializer(serializers.Serializer):
+    time = serializers.DateTimeField()
+    queues = serializers.DictField(child=serializers.IntegerField(), help_text="Messages waiting in every celery queue.")
+    jobs = serializers.DictField(child=serializers.DictField(child=serializers.IntegerField()), help_text="Pending and processing jobs by job type.")
+    priorities = serializers.DictField(child=serializers.DictField(child=serializers.IntegerField()), help_text="Pending and processing jobs by priority class, `waiting` are the pending import and reprocess jobs not queued yet (see `JOB_PRIORITY_MAX_IN_FLIGHT`).")
+    oldest_pending_job_age = serializers.FloatField(allow_null=True, help_text="Seconds since the oldest pending job was created.")
+    throughput = ThroughputSerializer()
+    ai_rate_limits = serializers.DictField(child=serializers.DictField(child=serializers.FloatField()), help_text="Usage of every configured `AI_RATE_LIMITS` limit.")
+
+
+class QueueMetricsView(viewsets.ViewSet):
+    openapi_tags = ["Server Status"]
+    renderer_classes = [renderers.JSONRenderer, PrometheusRenderer]
+
+    @extend_schema(
+        summary="Get queue depth and throughput metrics",
+        description=textwrap.dedent(
+            f"""
+            Metrics of the processing backlog, meant to drive autoscaling:
+
+            * the number of messages waiting in every worker queue
+            * pending and processing jobs by job type and by priority class, and the age of the oldest pending job
+            * jobs finished in the last {THROUGHPUT_WINDOW_MINUTES} minutes by type, with the p50/p95 latency (from `run_datetime` to `completion_time`) of the completed ones, and the files processed per minute
+            * usage of the AI provider rate limits
+
+            The metrics are refreshed at most every {CACHE_SECONDS} seconds. Use `?format=prometheus` (or `Accept: text/plain`) for the Prometheus text exposition format.
+            """
+        ),
+        responses={
+            (200, "application/json"): QueueMetricsSerializer,
+            (200, "text/plain"): OpenApiResponse(OpenApiTypes.STR, description="Prometheus text exposition format"),
+        },
+    )
+    def list(self, request, *args, **kwargs):
+        data = get_metrics()
+        if isinstance(request.accepted_renderer, PrometheusRenderer):
+            return Response(data)
+        return Response(QueueMetricsSerializer(data).data)
@@ -1,20 +1,22 @@
 from enum import StrEnum, auto
 import logging
+import mimetypes
+import posixpath
+import shutil
+import zipfile
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from rest_framework import serializers, validators
 from dogesec_commons.utils.serializers import JSONSchemaSerializer
 
 from dogesec_commons.stixifier.models import Profile
-from .models import File, FileImage, Job
+from .models import File, FileImage, Job, JobPriority, JobState, JobType
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils.translation import gettext_lazy as _
 from drf_spectacular.utils import extend_schema_field
 import file2txt.parsers.core as f2t_core
 from rest_framework.exceptions import ValidationError
 from django.utils.translation import gettext_lazy
-from stixify.worker import pdf_converter
-from django.core.files.base import ContentFile
-import tempfile
-from pathlib import Path
 
 F2T_PARSERS = list(f2t_core.BaseParser.PARSERS.keys())
 F2T_PARSERS.append("mhtml-pdf")
@@ -94,6 +96,12 @@ class ReportIDField(serializers.CharField):
     def to_representation(self, value):
         return "report--"+serializers.UUIDField().to_representation(value)
 
+class DuplicateMode(StrEnum):
+    PROCESS = auto()
+    RETURN_EXISTING = "return-existing"
+    REUSE_EXTRACTIONS = "reuse-extractions"
+
+
 class FileSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
     report_id = ReportIDField(source='id', help_text="If you want to define the UUID of the STIX Report object you can use this property. Pass the entire report id, e.g. `report--26dd4dcb-0ebc-4a71-8d37-ffd88faed163`. The UUID part will also be used for the file ID. If not passed, this UUID will be randomly generated. Must be unique.", validators=[
@@ -118,34 +126,142 @@ class FileSerializer(serializers.ModelSerializer):
         max_value=100,
         help_text="A value between `0`-`100`. This value is determined by the content check module of the profile used to process the file. If a confidence value is set on the File object, that value will be used instead.",
     )
+    sha256 = serializers.CharField(read_only=True, allow_null=True, help_text="The SHA-256 digest of the uploaded file.")
+    on_duplicate = serializers.ChoiceField(
+        choices=[m.value for m in DuplicateMode],
+        default=DuplicateMode.PROCESS,
+        write_only=True,
+        help_text="What to do when a File with the same content was already processed with the same `profile_id` and `mode`. `process` (default) processes the file again, `return-existing` does not create a new File and returns the Job of the existing File, `reuse-extractions` creates a new File reusing the markdown, images and extractions of the existing File so only the STIX bundle is created and uploaded.",
+    )
+
+    priority = serializers.ChoiceField(
+        choices=[JobPriority.INTERACTIVE, JobPriority.BULK],
+        default=JobPriority.INTERACTIVE,
+        write_only=True,
+        help_text="The priority of the processing Job. `interactive` (default) Jobs are processed before any other Job, use `bulk` for files that are not needed urgently (e.g. when uploading many files one by one) so they do not delay the files uploaded by analysts.",
+    )
 
     class Meta:
         model = File
-        exclude = ['profile', "markdown_file", "txt2stix_data", "pdf_file", "identity", "embedding"]
+        exclude = ['profile', "markdown_file", "txt2stix_data", "pdf_file", "identity", "embedding", "pending_deletion"]
         read_only_fields = []
 
     def validate(self, attrs):
         return super().validate(attrs)
 
-    def create(self, validated_data):
-        # Extract the uploaded file
-        uploaded_file = validated_data.get('file')
-        mode = validated_data.get('mode')
 
-        # Handle mhtml-pdf conversion
-        if mode == 'mhtml-pdf':
-            # Save uploaded file to temporary location
-            with tempfile.NamedTemporaryFile(delete=True, suffix='.mhtml') as temp_file:
-                for chunk in uploaded_file.chunks():
-                    temp_file.write(chunk)
-                temp_path = Path(temp_file.name)
+class FileBulkSerializer(FileSerializer):
+    files = serializers.ListField(
+        child=serializers.FileField(),
+        required=False,
+        write_only=True,
+        help_text="The files to be processed, send the field once per file. Cannot be used together with `archive`.",
+    )
+    archive = serializers.FileField(
+        required=False,
+        write_only=True,
+        help_text="A zip archive containing the files to be processed. Cannot be used together with `files`.",
+    )
+    priority = serializers.ChoiceField(
+        choices=[JobPriority.INTERACTIVE, JobPriority.BULK],
+        default=JobPriority.BULK,
+        write_only=True,
+        help_text="The priority of the processing Jobs, `bulk` (default) Jobs are processed after those of files uploaded one by one (`interactive`).",
+    )
 
-                # Convert mhtml to pdf
-                pdf_bytes = pdf_converter.convert_mhtml_to_pdf(temp_path)
-                # Replace the file with the converted PDF
-                pdf_filename = uploaded_file.name.rsplit('.', 1)[0] + '.pdf'
-                validated_data['pdf_file'] = ContentFile(pdf_bytes, name=pdf_filename)
-        return super().create(validated_data)
+    class Meta:
+        model = File
+        fields = ["files", "archive", "identity_id", "profile_id", "mode", "tlp_level", "confidence", "labels", "sources", "priority"]
+
+    def validate(self, attrs):
+        files = attrs.pop("files", None)
+        archive = attrs.pop("archive", None)
+        if bool(files) == bool(archive):
+            raise ValidationError({"non_field_errors": ["Exactly one of `files` or `archive` must be provided."]})
+        if archive:
+            files = self.extract_archive(archive)
+        if not files:
+            raise ValidationError({"archive": ["The archive does not contain any file."]})
+        if len(files) > settings.BULK_UPLOAD_MAX_FILES:
+            raise ValidationError(
+                {"non_field_errors": [f"Cannot upload more than {settings.BULK_UPLOAD_MAX_FILES} files at once, got {len(files)}."]}
+            )
+        attrs["files"] = files
+        return super().validate(attrs)
+
+    @staticmethod
+    def extract_archive(archive):
+        """
+        Extract the files of a zip `archive` to temporary files. The (uncompressed) sizes are checked before
+        extracting anything, a member can not be inflated past the size it declares.
+        """
+        try:
+            zf = zipfile.ZipFile(archive)
+        except zipfile.BadZipFile:
+            raise ValidationError({"archive": ["Not a valid zip archive."]})
+        files = []
+        with zf:
+            members = []
+            for info in zf.infolist():
+                name = posixpath.basename(info.filename)
+                if info.is_dir() or info.filename.startswith("__MACOSX/") or name.startswith("."):
+                    continue
+                if info.file_size > (max_size := settings.BULK_UPLOAD_MAX_ARCHIVE_MEMBER_SIZE):
+                    raise ValidationError(
+                        {"archive": [f"`{info.filename}` is larger than {max_size} bytes once extracted."]}
+                    )
+                members.append((name, info))
+            if sum(info.file_size for _, info in members) > (max_size := settings.BULK_UPLOAD_MAX_ARCHIVE_SIZE):
+                raise ValidationError({"archive": [f"The archive is larger than {max_size} bytes once extracted."]})
+            for name, info in members:
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                file = TemporaryUploadedFile(name, content_type, info.file_size, None)
+                try:
+                    with zf.open(info) as member:
+                        shutil.copyfileobj(member, file)
+                except zipfile.BadZipFile:
+                    raise ValidationError({"archive": [f"`{info.filename}` is corrupted."]})
+                file.seek(0)
+                files.append(file)
+        return files
+
+
+class DirectUploadSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255, help_text="The name of the file to be uploaded, e.g. `report.pdf`.")
+    size = serializers.IntegerField(min_value=1, help_text="The size of the file in bytes, the upload is rejected by the storage if it does not match.")
+    sha256 = serializers.RegexField(r"^[0-9a-fA-F]{64}$", help_text="The hex SHA-256 digest of the file, the upload is rejected by the storage if it does not match.")
+    content_type = serializers.CharField(default="application/octet-stream", help_text="The mimetype of the file, it must be sent as the `Content-Type` of the upload.")
+
+    def validate_size(self, size):
+        if size > settings.DIRECT_UPLOAD_MAX_SIZE:
+            raise ValidationError(f"Cannot upload files larger than {settings.DIRECT_UPLOAD_MAX_SIZE} bytes.")
+        return size
+
+
+class DirectUploadResponseSerializer(serializers.Serializer):
+    upload_id = serializers.CharField(help_text="Pass it to the confirm upload endpoint once the file is uploaded.")
+    url = serializers.URLField(help_text="The presigned url to upload the file to.")
+    method = serializers.CharField()
+    headers = serializers.DictField(child=serializers.CharField(), help_text="Headers that must be sent with the upload.")
+    expires_at = serializers.DateTimeField(help_text="The url cannot be used after this time.")
+
+
+class DirectUploadConfirmSerializer(FileSerializer):
+    file = None
+    upload_id = serializers.CharField(write_only=True, help_text="The `upload_id` returned when the upload was created.")
+
+    class Meta(FileSerializer.Meta):
+        exclude = [*FileSerializer.Meta.exclude, "file"]
+
+
+class JobBatchSerializer(serializers.Serializer):
+    batch_id = serializers.UUIDField()
+    state = serializers.ChoiceField(choices=JobState.choices, help_text="`completed` once every Job of the batch has finished, successfully or not.")
+    total_jobs = serializers.IntegerField()
+    pending_jobs = serializers.IntegerField()
+    processing_jobs = serializers.IntegerField()
+    completed_jobs = serializers.IntegerField()
+    failed_jobs = serializers.IntegerField()
 
 
 class FilePatchSerializer(FileSerializer):
@@ -183,6 +299,17 @@ class JobSerializer(BaseJobSerializer):
     file = RelatedObjectField(read_only=True,  serializer=FileSerializer(allow_null=True), required=False,)
 
 
+class JobMetricsSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=JobType.choices)
+    profile_id = serializers.UUIDField()
+    mode = serializers.CharField()
+    jobs = serializers.IntegerField(help_text="The number of completed Jobs aggregated.")
+    stages = serializers.DictField(
+        child=serializers.DictField(child=serializers.FloatField(allow_null=True)),
+        help_text="For every stage of the processing; the average `wall_time` and `cpu_time` (in seconds) and `peak_rss_delta` (in kilobytes), and the total `llm_calls`, `llm_prompt_tokens` and `llm_completion_tokens`.",
+    )
+
+
 class AttackNavigatorSerializer(serializers.Serializer):
     mobile = serializers.BooleanField(default=False)
     ics = serializers.BooleanField(default=False)
@@ -195,9 +322,22 @@ class ReprocessSingleFileSerializer(serializers.Serializer):
         default=True,
         help_text="Default true. If false, the extraction process will be run again on the file.",
     )
+    skip_conversion = serializers.BooleanField(
+        write_only=True,
+        default=False,
+        help_text="Default false. Only used when `skip_extraction` is false. If true, the markdown (and images) stored for the file will be used for the extraction instead of converting the file again. Note, the `defang` and `extract_text_from_image` settings of the new Profile are not applied to the stored markdown.",
+    )
 
     def validate(self, attrs):
         profile_id = attrs.get("profile_id", None)
+        if attrs["skip_conversion"] and attrs["skip_extraction"]:
+            raise serializers.ValidationError(
+                {
+                    "non_field_errors": [
+                        "Cannot specify skip_conversion when skip_extraction is true (or not set)"
+                    ]
+                }
+            )
         if profile_id and attrs["skip_extraction"]:
             raise serializers.ValidationError(
                 {
@@ -217,6 +357,47 @@ class ReprocessSingleFileSerializer(serializers.Serializer):
         return super().validate(attrs)
 
 
+class BulkReprocessSerializer(ReprocessSingleFileSerializer):
+    FILTER_FIELDS = ["file_ids", "current_profile_id", "identity_id", "created_min", "created_max", "last_job_failed"]
+
+    file_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        required=False,
+        help_text="Only reprocess the Files with these `id`s.",
+    )
+    current_profile_id = serializers.UUIDField(
+        required=False,
+        help_text="Only reprocess the Files that were last processed with this Profile `id`.",
+    )
+    identity_id = IdentityIDField(
+        required=False,
+        help_text="Only reprocess the Files created by this Identity `id`.",
+    )
+    created_min = serializers.DateTimeField(required=False, help_text="Only reprocess the Files uploaded on or after this time.")
+    created_max = serializers.DateTimeField(required=False, help_text="Only reprocess the Files uploaded on or before this time.")
+    last_job_failed = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text="If true, only reprocess the Files whose last Job failed.",
+    )
+    max_in_flight = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        help_text="The maximum number of Files processed at the same time. Defaults to the `BULK_REPROCESS_MAX_IN_FLIGHT` setting.",
+    )
+
+    def validate(self, attrs):
+        if not any(attrs.get(field) for field in self.FILTER_FIELDS):
+            raise serializers.ValidationError(
+                {
+                    "non_field_errors": [
+                        f"At least one of {', '.join(f'`{field}`' for field in self.FILTER_FIELDS)} must be provided"
+                    ]
+                }
+            )
+        return super().validate(attrs)
+
+
 class AttackNavigatorDomainSerializer(JSONSchemaSerializer):
     json_schema = {
         "$schema": "http://json-schema.org/draft-07/schema#",
@@ -10,6 +10,7 @@ from stixify.web.serializers import BaseJobSerializer
 
 from stixify.classifier.models import Cluster
 from stixify.worker.topics import build_topic_clusters
+from stixify.worker.celery import JOB_PRIORITIES
 
 from . import autoschema as api_schema
 from . import models
@@ -44,6 +45,7 @@ class TopicDetailSerializer(TopicSerializer):
     def get_files(self, obj):
         files = (
             models.File.objects.filter(embedding__in=obj.members.all())
+            .only("id", "name", "identity_id")
             .distinct()
         )
         return TopicPostSerializer(files, many=True).data
@@ -152,11 +154,12 @@ class TopicView(
             id=uuid.uuid4(),
             type=models.JobType.BUILD_CLUSTERS,
             state=models.JobState.PROCESSING,
+            priority=models.JobPriority.CLUSTERING,
         )
         t = build_topic_clusters.si(
             job.id,
             force=s.validated_data["force"],
         )
-        t.apply_async()
+        t.apply_async(priority=JOB_PRIORITIES[job.priority])
         obj = models.Job.objects.get(id=job.id)
         return Response(JobSerializer(obj).data, status=status.HTTP_201_CREATED)
@@ -0,0 +1,34 @@
+import hashlib
+
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+
+
+class DigestUploadHandlerMixin:
+    """Compute the sha256 of an uploaded file while it streams, exposed as `uploaded_file.sha256`."""
+
+    def new_file(self, *args, **kwargs):
+        self.digest = hashlib.sha256()
+        return super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        data = super().receive_data_chunk(raw_data, start)
+        if data is None:  # chunk consumed by this handler, later handlers will never see it
+            self.digest.update(raw_data)
+        return data
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.digest.hexdigest()
+        return file
+
+
+class DigestMemoryFileUploadHandler(DigestUploadHandlerMixin, MemoryFileUploadHandler):
+    pass
+
+
+class DigestTemporaryFileUploadHandler(DigestUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
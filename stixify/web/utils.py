@@ -2,10 +2,11 @@ from django.conf import settings
 from rest_framework import pagination, response, serializers
 from rest_framework.filters import OrderingFilter, BaseFilterBackend
 from django.utils.encoding import force_str
-from django.db.models import Q
+from django.db.models import BooleanField, Func, Q, Value
 from datetime import datetime
 from rest_framework import response
 from rest_framework.renderers import BaseRenderer
+from rest_framework.negotiation import BaseContentNegotiation
 
 
 class MinMaxDateFilter(BaseFilterBackend):
@@ -55,6 +56,23 @@ class MinMaxDateFilter(BaseFilterBackend):
 
 
 
+class ArrayElementContains(Func):
+    """Whether an element of an array field, after `prefix`, contains `term` (case insensitive)."""
+
+    output_field = BooleanField()
+
+    def __init__(self, expression, term, prefix=""):
+        super().__init__(expression, Value(prefix), Value(term))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        (array_sql, array_params), (prefix_sql, prefix_params), (_, term_params) = [
+            compiler.compile(expression) for expression in self.get_source_expressions()
+        ]
+        pattern = "%%%s%%" % connection.ops.prep_for_like_query(term_params[0])
+        sql = f"EXISTS (SELECT FROM unnest({array_sql}) AS element WHERE {prefix_sql} || element ILIKE %s)"
+        return sql, (*array_params, *prefix_params, pattern)
+
+
 class Response(response.Response):
     DEFAULT_HEADERS = {
         'Access-Control-Allow-Origin': '*',
@@ -78,3 +96,12 @@ class PDFRenderer(BaseRenderer):
 
     def render(self, data, media_type=None, renderer_context=None):
         return data  # You must return raw bytes here (PDF content)
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Always use the first renderer, for views returning their own response whatever the `Accept` (e.g. downloads)."""
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
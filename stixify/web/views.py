@@ -1,6 +1,10 @@
 from functools import reduce
+import base64
+import hashlib
 import io
+import json
 import logging
+import mimetypes
 import operator
 import re
 import textwrap
@@ -9,6 +13,9 @@ from django import forms
 from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from rest_framework import (
     viewsets,
     parsers,
@@ -16,22 +23,28 @@ from rest_framework import (
     decorators,
     status,
     exceptions,
+    renderers,
     request,
     validators,
 )
-from django.http import FileResponse, HttpRequest, HttpResponseNotFound
+from django.http import FileResponse, HttpResponseNotFound, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from django.utils.text import slugify
 from dogesec_commons.objects.helpers import OBJECT_TYPES
-from django.db.models import F, Value, CharField, Func, Q
+from django.db.models import Avg, F, FloatField, IntegerField, UUIDField, Value, CharField, Count, Exists, Func, OuterRef, Q, Subquery, Sum
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+from django.db.models.functions import Cast, Coalesce
+from django.contrib.postgres.fields import ArrayField
+from dogesec_commons.identity.models import Identity
 
-from stixify.classifier.models import Cluster, DocumentEmbedding
+from stixify.classifier.models import DocumentEmbedding
 from stixify.worker import tasks
-from .md_helper import MarkdownImageReplacer
+from stixify.web import arango_indexes, direct_uploads, downloads, events
+from .md_helper import MarkdownImageReplacer, markdown_cache_keys
 from django.http.response import HttpResponse
 
 from drf_spectacular.utils import OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
-from stix2arango.services import ArangoDBService
 from stix2.utils import format_datetime as stix2_format_datetime
 
 import typing
@@ -48,7 +61,9 @@ from .models import (
     File,
     FileImage,
     Job,
+    JobPriority,
     JobType,
+    ReportLabels,
     TLP_Levels,
     JobState,
 )
@@ -56,20 +71,30 @@ from .serializers import (
     AttackNavigatorDomainSerializer,
     AttackNavigatorSerializer,
     BaseJobSerializer,
+    BulkReprocessSerializer,
+    DirectUploadConfirmSerializer,
+    DirectUploadResponseSerializer,
+    DirectUploadSerializer,
+    DuplicateMode,
+    FileBulkSerializer,
     FileSerializer,
     FilePatchSerializer,
     HealthCheckSerializer,
     ImageSerializer,
+    JobBatchSerializer,
+    JobMetricsSerializer,
     JobSerializer,
     ReprocessSingleFileSerializer,
 )
 from .topics import SimilarFileSerializer
-from .utils import PDFRenderer, Response, MinMaxDateFilter
+from .utils import ArrayElementContains, IgnoreClientContentNegotiation, PDFRenderer, Response, MinMaxDateFilter
 from dogesec_commons.utils import Pagination, Ordering
+from dogesec_commons.utils.pagination import CompositeCursorPagination, CursorPagination
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet, Filter
 import django_filters.rest_framework as filters
 from django_filters import fields as django_filters_fields
 from stixify.worker.tasks import new_task
+from stixify.worker.celery import JOB_PRIORITIES
 from drf_spectacular.utils import extend_schema, extend_schema_view
 
 from drf_spectacular.views import SpectacularAPIView
@@ -161,12 +186,14 @@ ATTACK_DOMAINS = ["ics", "mobile", "enterprise"]
             This endpoint will delete a File using its ID. It will also delete the markdown, images and original file stored for this File.
 
             IMPORTANT: this request WILL also delete any STIX objects created from this file.
+
+            The deletion runs in the background: the File is hidden from the API straight away and the response contains the `delete-report` Job removing its STIX objects and then the File. The Job `id` can be used with the GET Jobs by ID endpoint to monitor its progress (`extra.removed_objects` and `extra.updated_objects`).
             """
         ),
-        responses={204: {}, 404: DEFAULT_404_ERROR},
+        responses={202: JobSerializer, 404: DEFAULT_404_ERROR},
     ),
     create=extend_schema(
-        responses={201: JobSerializer, 400: DEFAULT_400_ERROR},
+        responses={201: JobSerializer, 200: JobSerializer, 400: DEFAULT_400_ERROR},
         summary="Upload a new File",
         description=textwrap.dedent(
             """
@@ -177,6 +204,8 @@ ATTACK_DOMAINS = ["ics", "mobile", "enterprise"]
             If you need to reprocess a file, you must upload it again. If you have lost a copy of the original file that you want to re-process, you can re-download it using the `download_url` value in the GET Files response.
 
             The response will contain the Job information, including the Job `id`. This can be used with the GET Jobs by ID endpoint to monitor the status of the Job.
+
+            Stixify stores the SHA-256 digest of every uploaded file. Use `on_duplicate` to control what happens when the same file was already processed with the same `profile_id` and `mode`; `return-existing` returns the Job of the existing File (with a 200 response) instead of creating a new File, `reuse-extractions` creates a new File but skips conversion and extraction by reusing the output of the existing File.
             """
         ),
     ),
@@ -190,6 +219,8 @@ ATTACK_DOMAINS = ["ics", "mobile", "enterprise"]
 
             If you send `skip_extraction`, Stixify will reuse existing extractions and rerun the remaining steps. This is useful when you want to avoid calling AI extraction endpoints again.
 
+            If you send `skip_conversion` (with `skip_extraction` set to false), Stixify will reuse the markdown created when the File was uploaded and only rerun the extractions with the Profile passed in `profile_id`. This is useful when you have changed the extractors of a Profile and do not want to convert the file again.
+
             `profile_id` and `skip_extraction` are mutually exclusive.
             """
         ),
@@ -200,6 +231,60 @@ ATTACK_DOMAINS = ["ics", "mobile", "enterprise"]
         },
         request=ReprocessSingleFileSerializer,
     ),
+    bulk_reprocess=extend_schema(
+        summary="Reprocess many Files",
+        description=textwrap.dedent(
+            """
+            Reprocess all the Files matching the filters passed with the same processing options as the reprocess File endpoint (`profile_id`, `skip_extraction` and `skip_conversion`). At least one filter must be passed. Files that cannot be reprocessed with the options passed (e.g. Files without extractions when `skip_extraction` is true) are ignored.
+
+            A parent Job of type `bulk-reprocess-posts` is returned and a `reprocess-posts` Job is created for every File. The File Jobs are not all started at once, at most `max_in_flight` are processed at the same time so the AI providers and the database are not overloaded.
+
+            The File Jobs have their `batch_id` set to the `id` of the parent Job, so you can use the GET Job Batch by ID endpoint to monitor the aggregate progress, or the `batch_id` filter of the GET Jobs endpoint to list them.
+            """
+        ),
+        request=BulkReprocessSerializer,
+        responses={201: JobSerializer, 400: DEFAULT_400_ERROR},
+    ),
+    bulk=extend_schema(
+        summary="Upload many Files at once",
+        description=textwrap.dedent(
+            """
+            Upload many files to be processed by Stixify in a single request. Files can either be sent as multiple `files` fields or as a single zip `archive`. The metadata (`profile_id`, `identity_id`, `mode`, `tlp_level`, `confidence`, `labels` and `sources`) is shared by every File created, and the `name` of each File is its filename.
+
+            A Job is created for every File. All Jobs share the same `batch_id`, which can be used with the GET Job Batch by ID endpoint to monitor the aggregate progress, or with the `batch_id` filter of the GET Jobs endpoint to list the individual Jobs.
+            """
+        ),
+        request=FileBulkSerializer,
+        responses={201: JobBatchSerializer, 400: DEFAULT_400_ERROR},
+    ),
+    create_upload=extend_schema(
+        summary="Create a direct upload",
+        description=textwrap.dedent(
+            """
+            Large files can be uploaded straight to the storage instead of through the POST File endpoint. This is only available when Stixify stores files in S3 compatible storage (`USE_S3_STORAGE=1`).
+
+            1. Create the upload with the `filename`, `size`, `sha256` and `content_type` of the file. A presigned `url` is returned.
+            2. `PUT` the file content to the `url` with the `headers` returned, before `expires_at`. The storage rejects a file whose size or SHA-256 digest do not match.
+            3. Use the POST Confirm direct upload endpoint with the `upload_id` returned and the File metadata to create the File and start its processing.
+
+            Files that are uploaded but never confirmed are deleted.
+            """
+        ),
+        request=DirectUploadSerializer,
+        responses={201: DirectUploadResponseSerializer, 400: DEFAULT_400_ERROR},
+    ),
+    confirm_upload=extend_schema(
+        summary="Confirm a direct upload",
+        description=textwrap.dedent(
+            """
+            Create a File from a file uploaded with the POST Create direct upload endpoint. The request takes the same metadata as the POST File endpoint (as JSON), with the `upload_id` instead of the `file`.
+
+            The response is the same as the response of the POST File endpoint. A 400 error is returned when the file has not been uploaded yet or when the uploaded file does not match the upload.
+            """
+        ),
+        request=DirectUploadConfirmSerializer,
+        responses={201: JobSerializer, 200: JobSerializer, 400: DEFAULT_400_ERROR},
+    ),
 )
 class FileView(
     mixins.CreateModelMixin,
@@ -227,7 +312,16 @@ class FileView(
     minmax_date_fields = ["created"]
 
     def get_queryset(self):
-        return File.objects.all()
+        queryset = File.objects.all()
+        if getattr(self, "action", None) != "destroy":  # files being deleted can be deleted again (e.g after a failure)
+            queryset = queryset.filter(pending_deletion=False)
+            # the file of a failed import is kept so the job can be resumed, it is listed again once the import succeeds
+            queryset = queryset.exclude(
+                Exists(Job.objects.filter(file=OuterRef("pk"), type=JobType.IMPORT_FILE, state=JobState.FAILED))
+            )
+        if getattr(self, "action", None) != "extractions":
+            queryset = queryset.defer("txt2stix_data")  # can be large, only returned by `extractions`
+        return queryset
 
     class filterset_class(FilterSet):
         id = filters.BaseCSVFilter(
@@ -286,17 +380,110 @@ class FileView(
     def perform_create(self, serializer):
         return super().perform_create(serializer)
 
-    @extend_schema(responses={201: JobSerializer}, request=FileSerializer)
+    @extend_schema(responses={201: JobSerializer, 200: JobSerializer}, request=FileSerializer)
     def create(self, request, *args, **kwargs):
         serializer = FileSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         temp_file = request.FILES["file"]
-        file_instance = serializer.save(mimetype=temp_file.content_type)
-        job_instance = Job.objects.create(file=file_instance)
-        job_serializer = JobSerializer(job_instance, context={"request": request})
+        return self.create_file_job(
+            serializer, sha256=File.compute_sha256(temp_file), mimetype=temp_file.content_type
+        )
+
+    def create_file_job(self, serializer, sha256, mimetype, upload=None):
+        """Create the File of a valid upload serializer and start its Job, `upload` is set for direct uploads."""
+        on_duplicate = serializer.validated_data.pop("on_duplicate")
+        priority = serializer.validated_data.pop("priority")
+
+        duplicate = None
+        if on_duplicate != DuplicateMode.PROCESS:
+            duplicate = File(
+                sha256=sha256,
+                profile_id=serializer.validated_data["profile_id"],
+                mode=serializer.validated_data["mode"],
+            ).find_duplicate()
+        if duplicate and on_duplicate == DuplicateMode.RETURN_EXISTING:
+            if existing_job := duplicate.job_set.order_by("-run_datetime").first():
+                if upload:
+                    direct_uploads.discard(upload)
+                job_serializer = JobSerializer(existing_job, context={"request": self.request})
+                return Response(job_serializer.data, status=status.HTTP_200_OK)
+
+        if upload:
+            file_instance = serializer.save(mimetype=mimetype, sha256=sha256, file=upload["name"])
+            direct_uploads.move_to_file(file_instance, upload)
+        else:
+            file_instance = serializer.save(mimetype=mimetype, sha256=sha256)
+        job_extra = None
+        if duplicate:
+            file_instance.clone_processed_data(duplicate)
+            job_extra = dict(skip_extraction=True, duplicate_of=str(duplicate.id))
+        job_instance = Job.objects.create(file=file_instance, extra=job_extra, priority=priority)
+        job_serializer = JobSerializer(job_instance, context={"request": self.request})
         new_task(job_instance)
         return Response(job_serializer.data, status=status.HTTP_201_CREATED)
 
+    def destroy(self, request, *args, **kwargs):
+        job = tasks.create_deletion_job(self.get_object())
+        return Response(JobSerializer(job, context={"request": request}).data, status=status.HTTP_202_ACCEPTED)
+
+    @decorators.action(methods=["POST"], detail=False, url_path="uploads")
+    def create_upload(self, request, *args, **kwargs):
+        if not direct_uploads.is_enabled():
+            raise exceptions.ValidationError("Direct uploads are only available when the files are stored in S3 compatible storage.")
+        serializer = DirectUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = direct_uploads.create_upload(**serializer.validated_data)
+        return Response(DirectUploadResponseSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+    @decorators.action(methods=["POST"], detail=False, url_path="uploads/confirm")
+    def confirm_upload(self, request, *args, **kwargs):
+        if not direct_uploads.is_enabled():
+            raise exceptions.ValidationError("Direct uploads are only available when the files are stored in S3 compatible storage.")
+        serializer = DirectUploadConfirmSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = direct_uploads.get_upload(serializer.validated_data.pop("upload_id"))
+        return self.create_file_job(
+            serializer, sha256=upload["sha256"], mimetype=upload["content_type"], upload=upload
+        )
+
+    @decorators.action(methods=["POST"], detail=False)
+    def bulk(self, request, *args, **kwargs):
+        serializer = FileBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        uploads = serializer.validated_data.pop("files")
+        identity_id = serializer.validated_data.pop("identity_id")
+        priority = serializer.validated_data.pop("priority")
+        identity = Identity.objects.get(pk=identity_id)
+        batch_id = uuid.uuid4()
+
+        files = []
+        try:
+            for upload in uploads:
+                file = File(
+                    **serializer.validated_data,
+                    identity=identity,
+                    name=upload.name,
+                    mimetype=upload.content_type,
+                    sha256=File.compute_sha256(upload),
+                )
+                file.file.save(upload.name, upload, save=False)
+                files.append(file)
+            with transaction.atomic():
+                File.objects.bulk_create(files)
+                jobs = Job.objects.bulk_create(
+                    [Job(file=file, batch_id=batch_id, priority=priority) for file in files]
+                )
+                transaction.on_commit(lambda: tasks.new_batch_task(jobs))
+        except Exception:
+            # the files are stored before they are created, none of them is referenced
+            for file in files:
+                file.file.delete(save=False)
+            raise
+        return Response(
+            JobBatchSerializer(JobView.get_batch_progress(batch_id)).data,
+            status=status.HTTP_201_CREATED,
+        )
+
     @transaction.atomic
     def partial_update(self, request, *args, **kwargs):
         file_obj = self.get_object()
@@ -324,12 +511,12 @@ class FileView(
     @decorators.action(detail=True, methods=["GET"])
     def extractions(self, request, file_id=None, **kwargs):
         obj = self.get_object()
-        return Response(obj.txt2stix_data or {})
+        return Response(obj.get_txt2stix_data() or {})
 
     def get_parsers(self):
         if not hasattr(self, "action"):
             return [parsers.JSONParser(), parsers.MultiPartParser()]
-        if self.action == "create":
+        if self.action in ["create", "bulk"]:
             return [parsers.MultiPartParser()]
         return [parsers.JSONParser()]
 
@@ -362,20 +549,33 @@ class FileView(
         if not obj.markdown_file:
             raise exceptions.NotFound({"error": "No markdown for this file"})
 
-        images = {
-            img.name: img.file.url
-            for img in FileImage.objects.filter(report_id=file_id)
-        }
-        resp_text = MarkdownImageReplacer.get_markdown(
-            request.build_absolute_uri(),
-            obj.markdown_file.read().decode(),
-            images,
-        )
-        return FileResponse(
-            streaming_content=resp_text,
+        url = request.build_absolute_uri()
+        etag_key, content_key = markdown_cache_keys(obj.id, url)
+        etag = cache.get(etag_key)
+        if etag and (response := get_conditional_response(request, etag=etag)):
+            return response
+        content = cache.get(content_key) if etag else None
+        if content is None:
+            images = {
+                img.name: img.file.url
+                for img in FileImage.objects.filter(report_id=file_id)
+            }
+            content = MarkdownImageReplacer.get_markdown(
+                url,
+                obj.markdown_file.read().decode(),
+                images,
+            ).encode()
+            etag = quote_etag(hashlib.sha256(content).hexdigest())
+            cache.set_many({etag_key: etag, content_key: content}, settings.MARKDOWN_CACHE_SECONDS)
+            if response := get_conditional_response(request, etag=etag):
+                return response
+        response = FileResponse(
+            io.BytesIO(content),
             content_type="text/markdown",
             filename="markdown.md",
         )
+        response["ETag"] = etag
+        return response
 
     @extend_schema(
         responses={
@@ -396,10 +596,33 @@ class FileView(
         obj: File = self.get_object()
         if not obj.archived_pdf:
             raise exceptions.NotFound({"error": "No archived PDF for this file"})
-        _, _, name = obj.archived_pdf.name.rpartition("/")
-        response = HttpResponse(obj.archived_pdf.open(), content_type="application/pdf")
-        response["Content-Disposition"] = f'attachment; filename="{name}"'
-        return response
+        return downloads.serve(request, obj.archived_pdf, "application/pdf")
+
+    @extend_schema(
+        responses={
+            (200, "application/octet-stream"): OpenApiTypes.BINARY,
+            (404, "application/json"): DEFAULT_404_ERROR,
+        },
+        summary="Download the original File",
+        description=textwrap.dedent(
+            """
+            Download the file that was uploaded, with the mimetype it was uploaded with. Like the archived PDF endpoint, this supports `Range` requests.
+            """
+        ),
+    )
+    @decorators.action(
+        detail=True,
+        methods=["GET"],
+        renderer_classes=[renderers.JSONRenderer],
+        content_negotiation_class=IgnoreClientContentNegotiation,
+    )
+    def download(self, request, *args, file_id=None, **kwargs):
+        obj: File = self.get_object()
+        if not obj.file:
+            raise exceptions.NotFound({"error": "The original file is no longer stored"})
+        return downloads.serve(
+            request, obj.file, obj.mimetype or "application/octet-stream", filename=obj.file.name.rpartition("/")[2]
+        )
 
     @extend_schema(
         responses={
@@ -429,6 +652,40 @@ class FileView(
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @extend_schema(
+        responses={
+            (200, "image/*"): OpenApiTypes.BINARY,
+            (404, "application/json"): DEFAULT_404_ERROR,
+        },
+        summary="Get an image found in a File",
+        description=textwrap.dedent(
+            """
+            Download one of the images listed by the File images endpoint, by its `name`.
+            """
+        ),
+        parameters=[
+            OpenApiParameter(
+                "image_name",
+                location=OpenApiParameter.PATH,
+                type=OpenApiTypes.STR,
+                description="The `name` of the image, e.g. `_page_0_Figure_1.jpeg`.",
+            ),
+        ],
+    )
+    @decorators.action(
+        detail=True,
+        methods=["GET"],
+        url_path="images/(?P<image_name>[^/]+)",
+        renderer_classes=[renderers.JSONRenderer],
+        content_negotiation_class=IgnoreClientContentNegotiation,
+        pagination_class=None,
+        filter_backends=[],
+    )
+    def image(self, request, file_id=None, image_name=None):
+        image = get_object_or_404(self.get_object().images, name=image_name)
+        content_type = mimetypes.guess_type(image.name)[0] or "application/octet-stream"
+        return downloads.serve(request, image.file, content_type, filename=image.name, attachment=False)
+
     @extend_schema(
         responses={200: {}, 404: DEFAULT_404_ERROR},
         summary="Get summary of the file content",
@@ -497,12 +754,82 @@ class FileView(
             raise exceptions.ValidationError(
                 {"error": "Cannot skip extraction on unprocessed file"}
             )
+        if s.validated_data["skip_conversion"] and not file_obj.markdown_file:
+            raise exceptions.ValidationError(
+                {"error": "Cannot skip conversion on unprocessed file"}
+            )
         job = tasks.create_reprocessing_job(file_obj, s.validated_data)
         return Response(
             JobSerializer(job, context={"request": request}).data,
             status=status.HTTP_201_CREATED,
         )
 
+    @decorators.action(methods=["POST"], detail=False, url_path="reprocess")
+    def bulk_reprocess(self, request, *args, **kwargs):
+        s = BulkReprocessSerializer(data=request.data)
+        s.is_valid(raise_exception=True)
+        filters = {
+            field: s.validated_data.pop(field, None)
+            for field in BulkReprocessSerializer.FILTER_FIELDS
+        }
+        max_in_flight = s.validated_data.pop("max_in_flight", None)
+
+        queryset = File.objects.filter(pending_deletion=False)
+        if filters["file_ids"]:
+            queryset = queryset.filter(id__in=filters["file_ids"])
+        if filters["current_profile_id"]:
+            queryset = queryset.filter(profile_id=filters["current_profile_id"])
+        if filters["identity_id"]:
+            queryset = queryset.filter(identity_id=filters["identity_id"])
+        if filters["created_min"]:
+            queryset = queryset.filter(created__gte=filters["created_min"])
+        if filters["created_max"]:
+            queryset = queryset.filter(created__lte=filters["created_max"])
+        if filters["last_job_failed"]:
+            last_job_state = (
+                Job.objects.filter(file=OuterRef("pk"))
+                .order_by("-run_datetime")
+                .values("state")[:1]
+            )
+            queryset = queryset.alias(last_job_state=Subquery(last_job_state)).filter(
+                last_job_state=JobState.FAILED
+            )
+        if s.validated_data["skip_extraction"]:
+            queryset = queryset.exclude(txt2stix_data=None)
+        if s.validated_data["skip_conversion"]:
+            queryset = queryset.exclude(markdown_file="").exclude(markdown_file=None)
+
+        job = tasks.create_bulk_reprocessing_job(
+            queryset.order_by("id").values_list("id", flat=True).iterator(),
+            s.validated_data,
+            max_in_flight=max_in_flight,
+        )
+        return Response(
+            JobSerializer(job, context={"request": request}).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+@require_GET
+async def job_events(request, job_id):
+    """
+    Stream the progress of a Job as server-sent events, see the GET Job by ID endpoint.
+    This is a plain (async) django view as DRF does not support streaming asynchronously, it must be served by an ASGI server.
+    """
+    if not await Job.objects.filter(pk=job_id).aexists():
+        return JsonResponse(dict(code=404, message="Job not found"), status=404)
+
+    async def get_snapshot():
+        job = await Job.objects.aget(pk=job_id)
+        return dict(event="state", job_id=str(job.id), state=job.state, error=job.error)
+
+    response = StreamingHttpResponse(
+        events.stream(job_id, get_snapshot), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # disable proxy buffering (nginx)
+    return response
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -519,6 +846,8 @@ class FileView(
         description=textwrap.dedent(
             """
             Using a Job ID you can retrieve information about its state via this endpoint. This is useful to see if a Job is still processing, if an error has occurred (and at what stage), or if it has completed.
+
+            Instead of polling this endpoint, you can follow the progress of a Job with [server-sent events](https://developer.mozilla.org/en-US/docs/Web/API/Server-sent_events) at `GET /api/v1/jobs/{job_id}/events/`. The stream starts with a `state` event containing the current state of the Job, followed by a `stage` event every time a processing stage starts or ends and a `state` event on every state change. The stream is closed once the Job is `completed` or `failed`.
             """
         ),
         parameters=[
@@ -531,6 +860,56 @@ class FileView(
         ],
         responses={200: JobSerializer, 404: DEFAULT_404_ERROR},
     ),
+    batch=extend_schema(
+        summary="Get a Job Batch by ID",
+        description=textwrap.dedent(
+            """
+            Files uploaded with the bulk upload endpoint create one Job each, all sharing the same `batch_id`. This endpoint returns the aggregate progress of all the Jobs in a batch.
+            """
+        ),
+        parameters=[
+            OpenApiParameter(
+                "batch_id",
+                location=OpenApiParameter.PATH,
+                type=OpenApiTypes.UUID,
+                description="The `batch_id` returned by the bulk upload endpoint.",
+            ),
+        ],
+        responses={200: JobBatchSerializer, 404: DEFAULT_404_ERROR},
+    ),
+    metrics=extend_schema(
+        summary="Get the resources used to process Files",
+        description=textwrap.dedent(
+            """
+            Every stage of the processing of a File records the time and memory it used (and for extractions, the number of AI calls and tokens) in the `extra.metrics` property of its Job. This endpoint aggregates the metrics of completed Jobs by Job `type`, Profile and `mode`, this is useful to find the Profiles and file types that are the most expensive to process.
+            """
+        ),
+        parameters=[
+            OpenApiParameter("profile_id", type=OpenApiTypes.UUID, description="Only aggregate the Jobs of Files processed with this Profile."),
+            OpenApiParameter("mode", description="Only aggregate the Jobs of Files with this `mode`."),
+        ],
+        responses={200: JobMetricsSerializer(many=True), 400: DEFAULT_400_ERROR},
+    ),
+    resume=extend_schema(
+        summary="Resume a failed Job",
+        description=textwrap.dedent(
+            """
+            The output of every processing stage of an import or reprocess Job is saved as soon as the stage completes. When such a Job fails (e.g. an AI provider returned an error during the extraction), it can be resumed with this endpoint: the Job is processed again starting from the stage that failed, the stages that already completed (e.g. the conversion of the file) are not run again.
+
+            A failed Job can be resumed for `FAILED_JOB_RESUME_HOURS` (24 hours by default) after it failed, the File of a failed import is deleted after that.
+            """
+        ),
+        parameters=[
+            OpenApiParameter(
+                "job_id",
+                location=OpenApiParameter.PATH,
+                type=OpenApiTypes.UUID,
+                description="The `id` of the Job.",
+            ),
+        ],
+        request=None,
+        responses={200: JobSerializer, 400: DEFAULT_400_ERROR, 404: DEFAULT_404_ERROR},
+    ),
 )
 class JobView(
     mixins.ListModelMixin,
@@ -547,13 +926,115 @@ class JobView(
     filter_backends = [DjangoFilterBackend, Ordering]
 
     def get_queryset(self):
-        return Job.objects.all()
+        return Job.objects.select_related("file").defer("file__txt2stix_data")
 
     class filterset_class(FilterSet):
         file_id = Filter("file_id", label="Filter Jobs by File `id`")
         state = filters.BaseCSVFilter(
             help_text="Filter Jobs by their state.", lookup_expr="in"
         )
+        batch_id = filters.UUIDFilter(
+            help_text="Filter Jobs by the `batch_id` returned by the bulk upload endpoint."
+        )
+
+    @decorators.action(
+        methods=["GET"],
+        detail=False,
+        url_path=r"batches/(?P<batch_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})",
+        pagination_class=None,
+        filter_backends=[],
+    )
+    def batch(self, request, *args, batch_id=None, **kwargs):
+        progress = self.get_batch_progress(batch_id)
+        if not progress["total_jobs"]:
+            raise exceptions.NotFound(f"No Job with batch_id `{batch_id}`")
+        return Response(JobBatchSerializer(progress).data)
+
+    @decorators.action(methods=["POST"], detail=True)
+    def resume(self, request, *args, **kwargs):
+        job = self.get_object()
+        if not tasks.is_resumable(job):
+            raise exceptions.ValidationError(
+                {"error": "Only failed import and reprocess Jobs can be resumed, within FAILED_JOB_RESUME_HOURS of failing"}
+            )
+        with transaction.atomic():
+            tasks.resume_job(job)
+        return Response(JobSerializer(job, context={"request": request}).data)
+
+    METRIC_AGGREGATES = dict(
+        wall_time=Avg,
+        cpu_time=Avg,
+        peak_rss_delta=Avg,
+        llm_calls=Sum,
+        llm_prompt_tokens=Sum,
+        llm_completion_tokens=Sum,
+    )
+
+    @decorators.action(methods=["GET"], detail=False, pagination_class=None, filter_backends=[])
+    def metrics(self, request, *args, **kwargs):
+        queryset = Job.objects.filter(
+            state=JobState.COMPLETED,
+            type__in=[JobType.IMPORT_FILE, JobType.REPROCESS_POSTS],
+            file__isnull=False,
+        )
+        if profile_id := request.query_params.get("profile_id"):
+            queryset = queryset.filter(file__profile_id=profile_id)
+        if mode := request.query_params.get("mode"):
+            queryset = queryset.filter(file__mode=mode)
+
+        aggregates = {}
+        for stage in tasks.PIPELINE_STAGES:
+            stage_metrics = KeyTransform(stage, KeyTransform("metrics", "extra"))
+            for metric, aggregate in self.METRIC_AGGREGATES.items():
+                aggregates[f"{stage}.{metric}"] = aggregate(
+                    Cast(KeyTextTransform(metric, stage_metrics), FloatField())
+                )
+        rows = (
+            queryset.values("type", profile_id=F("file__profile_id"), mode=F("file__mode"))
+            .annotate(jobs=Count("id"), **aggregates)
+            .order_by("type", "profile_id", "mode")
+        )
+        data = []
+        for row in rows:
+            stages = {stage: {} for stage in tasks.PIPELINE_STAGES}
+            for key in aggregates:
+                stage, metric = key.split(".")
+                stages[stage][metric] = row.pop(key)
+            data.append(dict(row, stages=stages))
+        return Response(JobMetricsSerializer(data, many=True).data)
+
+    @staticmethod
+    def get_batch_progress(batch_id):
+        counts = dict(
+            Job.objects.filter(batch_id=batch_id)
+            .values_list("state")
+            .annotate(count=Count("id"))
+            .order_by()
+        )
+        progress = dict(batch_id=batch_id, total_jobs=sum(counts.values()))
+        for state in JobState:
+            progress[f"{state}_jobs"] = counts.get(state, 0)
+        if progress["pending_jobs"] == progress["total_jobs"]:
+            progress["state"] = JobState.PENDING
+        elif progress["pending_jobs"] or progress["processing_jobs"]:
+            progress["state"] = JobState.PROCESSING
+        else:
+            progress["state"] = JobState.COMPLETED
+        return progress
+
+
+def cursor_paginated_response_schema(result_key="objects"):
+    """The responses of `ArangoDBHelper`, or of `CursorPagination` when the `cursor` parameter is passed."""
+    responses = ArangoDBHelper.get_paginated_response_schema(result_key)
+    offset_schema = responses[200]
+    cursor_schema = CursorPagination(result_key).get_paginated_response_schema(offset_schema["properties"][result_key])
+    return {**responses, 200: {"anyOf": [offset_schema, cursor_schema]}}
+
+
+CURSOR_PARAMETER = OpenApiParameter(
+    "cursor",
+    description="Page through the results with a cursor instead of `page`, pass it empty for the first page and then the `next` value of the previous page. Unlike `page`, deep pages are as fast as the first one.",
+)
 
 
 @extend_schema_view(
@@ -634,7 +1115,20 @@ class ReportView(viewsets.ViewSet):
         "name_ascending",
         "confidence_descending",
         "confidence_ascending",
+        "relevance_descending",
     ]
+    # the same direction for all the fields, as the cursor compares them as a tuple
+    REPORT_ORDERING = {
+        "created_descending": ("-created", "-id"),
+        "created_ascending": ("created", "id"),
+        "name_descending": ("-name", "-id"),
+        "name_ascending": ("name", "id"),
+        "confidence_descending": ("-report_confidence", "-id"),
+        "confidence_ascending": ("report_confidence", "id"),
+        "relevance_descending": ("relevance", "id"),  # position in the description search results
+    }
+    REPORT_OBJECT_COLLECTIONS = [arango_indexes.VERTEX_COLLECTION, arango_indexes.EDGE_COLLECTION]
+    minmax_date_fields = ["created"]
 
     @extend_schema()
     def retrieve(self, request, *args, **kwargs):
@@ -649,9 +1143,10 @@ class ReportView(viewsets.ViewSet):
         )
 
     @extend_schema(
-        responses=ArangoDBHelper.get_paginated_response_schema(),
+        responses=cursor_paginated_response_schema(),
         parameters=ArangoDBHelper.get_schema_operation_parameters()
         + [
+            CURSOR_PARAMETER,
             OpenApiParameter(
                 "identity",
                 description="Filter the result by only the reports created by this identity. Pass in the format `identity--b1ae1a15-6f4b-431e-b990-1b9678f35e15`",
@@ -700,7 +1195,7 @@ class ReportView(viewsets.ViewSet):
             ),
             OpenApiParameter(
                 "sort",
-                description="Sort the results by selected property",
+                description="Sort the results by selected property. `relevance_descending` ranks the reports by how well they match the `description` filter (by `created` without it).",
                 enum=SORT_PROPERTIES,
             ),
             OpenApiParameter(
@@ -714,9 +1209,10 @@ class ReportView(viewsets.ViewSet):
         return self.get_reports()
 
     @extend_schema(
-        responses=ArangoDBHelper.get_paginated_response_schema(),
+        responses=cursor_paginated_response_schema(),
         parameters=ArangoDBHelper.get_schema_operation_parameters()
         + [
+            CURSOR_PARAMETER,
             OpenApiParameter(
                 "visible_to",
                 description="Only show reports that are visible to the Identity `id` passed. e.g. passing `identity--b1ae1a15-6f4b-431e-b990-1b9678f35e15` would only show reports created by that identity (with any TLP level) or reports created by another identity ID but only if they are marked with `TLP:CLEAR` or `TLP:GREEN`.",
@@ -796,125 +1292,130 @@ class ReportView(viewsets.ViewSet):
         )
         return returned == [None]
 
-    @classmethod
-    def remove_report(cls, report_id):
-        db_service = ArangoDBService(
-            settings.ARANGODB_DATABASE,
-            [],
-            [],
-            create=False,
-            username=settings.ARANGODB_USERNAME,
-            password=settings.ARANGODB_PASSWORD,
-            host_url=settings.ARANGODB_HOST_URL,
-        )
-        helper = ArangoDBHelper(settings.VIEW_NAME, request.Request(HttpRequest()))
-        report_id = cls.fix_report_id(report_id)
-        bind_vars = {
-            "@collection": helper.collection,
-            "report_id": report_id,
-        }
-        query = """
-            FOR doc in @@collection
-            FILTER doc._stixify_report_id == @report_id
-            RETURN doc._id
+    def get_reports(self):
         """
-        collections: dict[str, list] = {}
-        out = helper.execute_query(query, bind_vars=bind_vars, paginate=False)
-        for key in out:
-            collection, key = key.split("/", 2)
-            collections[collection] = collections.get(collection, [])
-            collections[collection].append(dict(_key=key))
-
-        for collection, objects in collections.items():
-            helper.db.collection(collection).delete_many(objects, silent=True)
-            db_service.update_is_latest_several_chunked(
-                [object_key["_key"].split("+")[0] for object_key in objects],
-                collection,
-                collection.removesuffix("_vertex_collection").removesuffix(
-                    "_edge_collection"
-                )
-                + "_edge_collection",
-            )
-
-    def get_reports(self, id=None):
-        helper = ArangoDBHelper(settings.VIEW_NAME, self.request)
-        filters = []
-        bind_vars = {
-            "@collection": helper.collection,
-            "type": "report",
-        }
+        The reports are filtered, sorted and paginated from their Files in Postgres, only the objects of the page
+        are then read from ArangoDB. Passing `cursor` (empty for the first page) pages by keyset instead of offset.
+        """
+        files = self.get_report_files()
+        if "cursor" in self.request.query_params:
+            paginator = CompositeCursorPagination("objects")
+            paginator.ordering = files.query.order_by
+        else:
+            paginator = Pagination("objects")
+        page = paginator.paginate_queryset(files, self.request, self)
+        return paginator.get_paginated_response(self.hydrate_reports([file.report_id for file in page]))
+
+    def get_report_files(self):
+        query = self.request.query_params
+        queryset = File.objects.filter(pending_deletion=False, txt2stix_data__isnull=False).only(
+            "id", "name", "confidence", "created"
+        )
 
-        if q := helper.query_as_array("identity"):
-            bind_vars["identities"] = q
-            filters.append("FILTER doc.created_by_ref IN @identities")
+        if identities := [x for x in query.get("identity", "").split(",") if x]:
+            queryset = queryset.filter(identity_id__in=identities)
 
-        if topic_ids := helper.query_as_array("topic_id"):
-            members = Cluster.objects.filter(id__in=topic_ids).values_list("members__id", flat=True)
-            bind_vars["topic_id_matches"] = ["report--" + str(file_id) for file_id in members]
-            filters.append("FILTER doc.id IN @topic_id_matches")
+        if topic_ids := [x for x in query.get("topic_id", "").split(",") if x]:
+            queryset = queryset.filter(embedding__in=DocumentEmbedding.objects.filter(clusters__in=topic_ids))
 
-        if q := helper.query.get("visible_to"):
-            bind_vars["visible_to"] = q
-            bind_vars["marking_visible_to_all"] = (
-                TLP_LEVEL_STIX_ID_MAPPING[TLP_Levels.GREEN],
-                TLP_LEVEL_STIX_ID_MAPPING[TLP_Levels.CLEAR],
-            )
-            filters.append(
-                "FILTER doc.created_by_ref == @visible_to OR @marking_visible_to_all ANY IN doc.object_marking_refs"
-            )
+        if q := query.get("visible_to"):
+            queryset = queryset.filter(Q(identity_id=q) | Q(tlp_level__in=[TLP_Levels.GREEN, TLP_Levels.CLEAR]))
 
-        if tlp_level := helper.query.get("tlp_level"):
-            bind_vars["tlp_level_stix_id"] = TLP_LEVEL_STIX_ID_MAPPING.get(tlp_level)
-            filters.append("FILTER @tlp_level_stix_id IN doc.object_marking_refs")
+        if tlp_level := query.get("tlp_level"):
+            queryset = queryset.filter(tlp_level=tlp_level)
 
-        if q := helper.query.get("name"):
-            bind_vars["name"] = q.lower()
-            filters.append("FILTER CONTAINS(LOWER(doc.name), @name)")
+        if q := query.get("name"):
+            queryset = queryset.filter(name__icontains=q)
 
-        if q := helper.query.get("description"):
-            bind_vars["description"] = q.lower()
-            filters.append("FILTER CONTAINS(LOWER(doc.description), @description)")
+        if term := query.get("labels"):
+            # the labels of the report also have a `classification.<x>` label for every AI classification,
+            # the trigram index on all of them narrows the files before every label is matched on its own
+            queryset = queryset.alias(report_labels=ReportLabels()).filter(
+                Q(report_labels__icontains=term),
+                ArrayElementContains("labels", term)
+                | ArrayElementContains("ai_incident_classification", term, prefix="classification."),
+            )
 
-        if term := helper.query.get("labels"):
-            bind_vars["labels"] = term.lower()
-            filters.append(
-                "FILTER doc.labels[? ANY FILTER CONTAINS(LOWER(CURRENT), @labels)]"
+        if classifications := [x for x in query.get("ai_incident_classification", "").split(",") if x]:
+            queryset = queryset.filter(
+                ai_incident_classification__overlap=[x.lower().replace(" ", "_") for x in classifications]
             )
 
-        if term := helper.query.get("confidence_min"):
+        sort = query.get("sort")
+        term = query.get("confidence_min", "")
+        if term.replace(".", "").isdigit() or sort in ["confidence_descending", "confidence_ascending"]:
+            # without a confidence of its own, the report has the threat score of the content check
+            # and reports without any come first when ascending (like in ArangoDB), as -1 to be usable in a cursor
+            queryset = queryset.annotate(
+                report_confidence=Coalesce(
+                    "confidence",
+                    Cast(KeyTextTransform("threat_score", KeyTransform("content_check", "txt2stix_data")), FloatField()),
+                    Value(-1.0),
+                    output_field=FloatField(),
+                )
+            )
             if term.replace(".", "").isdigit():
-                bind_vars["confidence_min"] = float(term)
-                filters.append("FILTER doc.confidence >= @confidence_min")
-
-        if term := helper.query.get("created_max"):
-            bind_vars["created_max"] = term
-            filters.append("FILTER doc.created <= @created_max")
-        if term := helper.query.get("created_min"):
-            bind_vars["created_min"] = term
-            filters.append("FILTER doc.created >= @created_min")
-
-        if classifications := helper.query_as_array("ai_incident_classification"):
-            bind_vars["classifications"] = [
-                "classification." + x.lower().replace(" ", "_") for x in classifications
-            ]
-            filters.append("FILTER @classifications ANY IN doc.labels")
+                queryset = queryset.filter(report_confidence__gte=float(term))
+
+        queryset = MinMaxDateFilter().filter_queryset(self.request, queryset, self)
+
+        if term := query.get("description"):
+            description_ids = self.search_descriptions(term)
+            queryset = queryset.filter(id__in=description_ids).annotate(
+                relevance=Func(
+                    Value(description_ids, output_field=ArrayField(UUIDField())),
+                    F("id"),
+                    function="array_position",
+                    output_field=IntegerField(),
+                )
+            )
+        elif sort == "relevance_descending":
+            sort = None
+
+        return queryset.order_by(*self.REPORT_ORDERING.get(sort, self.REPORT_ORDERING["created_descending"]))
 
+    def search_descriptions(self, term):
+        """
+        The ids of the Files whose report description contains `term`, by relevance when the report search view
+        can be used.
+        """
+        helper = ArangoDBHelper(settings.VIEW_NAME, None)
+        bind_vars = {"@collection": arango_indexes.VERTEX_COLLECTION, "description": term.lower()}
         query = """
-            FOR doc in @@collection
-            FILTER doc.type == @type AND doc._is_latest
-            // <other filters>
-            #more_filters
-            // </other filters>
-            #sort_statement
-            LIMIT @offset, @count
-            RETURN KEEP(doc, KEYS(doc, true))
+            FOR doc IN @@collection
+            FILTER doc.type == "report" AND doc._is_latest
+            FILTER CONTAINS(LOWER(doc.description), @description)
+            RETURN doc.id
         """
-        return helper.execute_query(
-            query.replace("#more_filters", "\n".join(filters)).replace(
-                "#sort_statement", helper.get_sort_stmt(self.SORT_PROPERTIES)
-            ),
-            bind_vars=bind_vars,
+        if len(term) >= arango_indexes.NGRAM_SIZE and arango_indexes.has_report_search(helper.db):
+            bind_vars["@collection"] = arango_indexes.REPORT_SEARCH_VIEW
+            bind_vars["analyzer"] = arango_indexes.NGRAM_ANALYZER
+            query = """
+                FOR doc IN @@collection
+                SEARCH doc.type == "report" AND doc._is_latest == true
+                    AND NGRAM_MATCH(doc.description, @description, 1, @analyzer)
+                FILTER CONTAINS(LOWER(doc.description), @description)
+                SORT BM25(doc) DESC
+                RETURN doc.id
+            """
+        report_ids = helper.execute_query(query, bind_vars=bind_vars, paginate=False)
+        return [uuid.UUID(report_id.removeprefix("report--")) for report_id in report_ids]
+
+    @staticmethod
+    def hydrate_reports(report_ids):
+        """The report objects of `report_ids` (in this order), read from ArangoDB in one lookup."""
+        helper = ArangoDBHelper(settings.VIEW_NAME, None)
+        reports = helper.execute_query(
+            """
+            FOR doc IN @@collection
+            FILTER doc.id IN @report_ids AND doc._is_latest
+            RETURN KEEP(doc, KEYS(doc, true))
+            """,
+            bind_vars={"@collection": arango_indexes.VERTEX_COLLECTION, "report_ids": report_ids},
+            paginate=False,
         )
+        reports = {report["id"]: report for report in reports}
+        return [reports[report_id] for report_id in report_ids if report_id in reports]
 
     def get_report_objects(self, report_id):
         helper = ArangoDBHelper(settings.VIEW_NAME, self.request)
@@ -940,6 +1441,9 @@ class ReportView(viewsets.ViewSet):
         if q := helper.query_as_bool("ignore_embedded_sro", default=False):
             filters.append("FILTER doc._is_ref != TRUE")
 
+        if "cursor" in helper.query:
+            return self.get_report_objects_after(helper, bind_vars, visible_to_filter, filters)
+
         query = """
             LET report = FIRST(
                 FOR doc in @@collection
@@ -960,17 +1464,85 @@ class ReportView(viewsets.ViewSet):
         )
         return helper.execute_query(query, bind_vars=bind_vars)
 
+    def get_report_objects_after(self, helper, bind_vars, visible_to_filter, filters):
+        """
+        Keyset pagination of the objects of a report: they are read from the vertex then the edge collection in
+        `_key` order, resuming after the `(collection, _key)` of the last object of the previous page, so deep
+        pages cost as much as the first one.
+        """
+        start, after = self.decode_objects_cursor(helper.query["cursor"])
+        query = """
+            LET report = FIRST(
+                FOR doc IN @@vertex_collection
+                FILTER doc.id == @report_id
+                #visible_to
+                RETURN doc.id
+            )
+            FOR doc IN @@collection
+            FILTER report != NULL AND doc._stixify_report_id == @report_id AND doc._key > @after
+            FILTER NOT @types OR doc.type IN @types
+            #more_filters
+            SORT doc._key
+            LIMIT @count
+            RETURN {key: doc._key, object: KEEP(doc, KEYS(doc, TRUE))}
+        """.replace(
+            "#visible_to", visible_to_filter
+        ).replace(
+            "#more_filters", "\n".join(filters)
+        )
+        bind_vars["@vertex_collection"] = arango_indexes.VERTEX_COLLECTION
+        rows = []
+        for index in range(start, len(self.REPORT_OBJECT_COLLECTIONS)):
+            bind_vars.update(
+                {
+                    "@collection": self.REPORT_OBJECT_COLLECTIONS[index],
+                    "after": after if index == start else "",
+                    "count": helper.count - len(rows) + 1,  # one more to know if there is a next page
+                }
+            )
+            results = helper.execute_query(query, bind_vars=bind_vars, paginate=False)
+            rows.extend((index, row["key"], row["object"]) for row in results)
+            if len(rows) > helper.count:
+                break
+
+        next_cursor = None
+        if len(rows) > helper.count:
+            rows = rows[: helper.count]
+            next_cursor = self.encode_objects_cursor(*rows[-1][:2])
+        return Response(
+            {
+                "next": next_cursor,
+                "previous": None,
+                "size": len(rows),
+                "objects": [obj for _, _, obj in rows],
+            }
+        )
+
+    @staticmethod
+    def encode_objects_cursor(index, key):
+        return base64.urlsafe_b64encode(json.dumps([index, key]).encode()).decode()
+
+    @classmethod
+    def decode_objects_cursor(cls, cursor):
+        """`(collection index, _key)` of the cursor, the start of the vertex collection for an empty cursor."""
+        if not cursor:
+            return 0, ""
+        try:
+            index, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            assert isinstance(key, str) and index in range(len(cls.REPORT_OBJECT_COLLECTIONS))
+        except Exception:
+            raise exceptions.NotFound(CursorPagination.invalid_cursor_message)
+        return index, key
+
     @decorators.action(
         detail=True,
         methods=["GET"],
         url_path="attack-navigator",
     )
     def list_attack_navigators(self, request, report_id=None, **kwargs):
-        post_file: File = get_object_or_404(File, pk=report_id[8:])
-        layers = (post_file.txt2stix_data or {}).get("navigator_layer") or []
-        s = AttackNavigatorSerializer(
-            data={layer["domain"].removesuffix("-attack"): True for layer in layers}
-        )
+        post_file: File = get_object_or_404(File.objects.only("id"), pk=report_id[8:])
+        domains = post_file.navigator_layers.values_list("domain", flat=True)
+        s = AttackNavigatorSerializer(data={domain: True for domain in domains})
         s.is_valid()
         return Response(s.data)
 
@@ -982,16 +1554,16 @@ class ReportView(viewsets.ViewSet):
     def retrieve_attack_navigators(
         self, request, report_id=None, attack_domain=None, **kwargs
     ):
-        post_file: File = get_object_or_404(File, pk=report_id[8:])
+        post_file: File = get_object_or_404(File.objects.only("id"), pk=report_id[8:])
         if attack_domain not in ATTACK_DOMAINS:
             raise exceptions.NotFound({"error": "unknown attack domain"})
-        layers = (post_file.txt2stix_data or {}).get("navigator_layer") or []
-        layers = {layer["domain"].removesuffix("-attack"): layer for layer in layers}
-        if not layers.get(attack_domain):
+        layer = post_file.navigator_layers.filter(domain=attack_domain).first()
+        if not layer:
+            domains = post_file.navigator_layers.order_by("domain").values_list("domain", flat=True)
             raise exceptions.NotFound(
-                {"error": "no navigator for this domain", "domains": list(layers)}
+                {"error": "no navigator for this domain", "domains": list(domains)}
             )
-        return Response(layers[attack_domain])
+        return Response(layer.layer)
 
 
 @extend_schema_view(
@@ -1055,9 +1627,10 @@ class TasksView(viewsets.GenericViewSet):
             type=JobType.SYNC_KNOWLEDGEBASE,
             state=JobState.PROCESSING,
             extra=dict(knowledgebase=knowledgebase),
+            priority=JobPriority.SYNC,
         )
         t = tasks.update_knowledgebase.si(job.id) | tasks.job_completed_with_error.si(job.id)
-        t.apply_async()
+        t.apply_async(priority=JOB_PRIORITIES[job.priority])
         self.kwargs.update(job_id=job.id)
         obj = Job.objects.get(id=job.id)
         s = self.get_serializer(obj)
@@ -1,6 +1,7 @@
 from datetime import timedelta
 import os
 from celery import Celery
+from django.conf import settings
 # Set the default Django settings module for the 'celery' program.
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'stixify.settings')
@@ -10,6 +11,28 @@ app = Celery('stixify')
 
 app.config_from_object('os:environ', namespace='CELERY')
 
+# the file pipeline joins its branches with a chord, which needs a result backend.
+# use the (redis) broker unless `CELERY_RESULT_BACKEND` is set
+if not app.conf.result_backend and app.conf.broker_url.startswith(("redis://", "rediss://")):
+    app.conf.result_backend = app.conf.broker_url
+
+# every task of a job is sent with the broker priority of the job's class (see `JOB_PRIORITIES`) and the
+# tasks queued by a task (the next stages of the pipeline) keep the priority of their parent.
+# redis delivers lower values first, with a step per value
+app.conf.task_inherit_parent_priority = True
+app.conf.broker_transport_options = dict(
+    {"priority_steps": list(range(10))}, **(app.conf.broker_transport_options or {})
+)
+# tasks are acknowledged once they finish (see `tasks.pipeline_stage`), redis redelivers the unacknowledged ones
+# after `visibility_timeout`: it must be longer than a stage can run (the hard time limit of the stages) or
+# the stages longer than that would run again on another worker while still running
+PIPELINE_STAGE_HARD_TIME_LIMIT = settings.PIPELINE_STAGE_TIME_LIMIT + 5 * 60
+app.conf.broker_transport_options.setdefault("visibility_timeout", PIPELINE_STAGE_HARD_TIME_LIMIT + 10 * 60)
+
+# workers only reserve the task they are about to run, so a more urgent task queued meanwhile runs first
+if "CELERY_WORKER_PREFETCH_MULTIPLIER" not in os.environ:
+    app.conf.worker_prefetch_multiplier = 1
+
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
@@ -17,5 +40,49 @@ app.conf.beat_schedule = {
     "auto_refresh_statistics_data": {
         "task": "stixify.worker.tasks.auto_refresh_statistics_data",
         "schedule": timedelta(minutes=10),
-    }
+    },
+    "dispatch_bulk_reprocess_jobs": {
+        "task": "stixify.worker.tasks.dispatch_bulk_reprocess_jobs",
+        "schedule": timedelta(seconds=settings.BULK_REPROCESS_DISPATCH_INTERVAL),
+    },
+    "dispatch_waiting_jobs": {
+        "task": "stixify.worker.tasks.dispatch_waiting_jobs",
+        "schedule": timedelta(seconds=settings.BULK_REPROCESS_DISPATCH_INTERVAL),
+    },
+    "clear_expired_checkpoints": {
+        "task": "stixify.worker.tasks.clear_expired_checkpoints",
+        "schedule": timedelta(hours=1),
+    },
+    "clear_expired_uploads": {
+        "task": "stixify.worker.tasks.clear_expired_uploads",
+        "schedule": timedelta(hours=1),
+    },
+}
+
+# every stage of the file processing pipeline gets its own queue so that
+# cpu bound (render, convert, archive_pdf) and io bound (extract, upload, embed) stages
+# can be consumed by separately scaled workers, e.g `celery -A stixify.worker worker -Q archive_pdf -c 2`
+PIPELINE_QUEUES = {
+    "stixify.worker.tasks.render_mhtml_pdf": "render",
+    "stixify.worker.tasks.convert_file": "convert",
+    "stixify.worker.tasks.convert_file_chunk": "convert",
+    "stixify.worker.tasks.merge_file_chunks": "convert",
+    "stixify.worker.tasks.extract_file": "extract",
+    "stixify.worker.tasks.upload_file": "upload",
+    "stixify.worker.tasks.delete_report": "upload",  # also writes to arangodb
+    "stixify.worker.tasks.embed_file": "embed",
+    "stixify.worker.tasks.archive_pdf": "archive_pdf",
+}
+
+app.conf.task_routes = {
+    task_name: {"queue": queue} for task_name, queue in PIPELINE_QUEUES.items()
+}
+
+# broker priority of every job priority class (`JobPriority`)
+JOB_PRIORITIES = {
+    "interactive": 0,
+    "bulk": 3,
+    "reprocess": 5,
+    "sync": 7,
+    "clustering": 9,
 }
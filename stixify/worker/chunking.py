@@ -0,0 +1,72 @@
+"""
+Split large PDFs into page ranges that are converted separately, and merge the converted ranges back.
+
+file2txt numbers the pages of every conversion from 1 and names the images it extracts after their
+(0 based) page, so both are shifted by the first page of the range when merging. The merged markdown
+is the same as the markdown of the whole document converted at once.
+"""
+
+import io
+import re
+
+from pypdf import PdfReader, PdfWriter
+
+PAGE_MARKER_RE = re.compile(r"\(===(START|END)_PAGE (\d+)===\)")
+IMAGE_PAGE_RE = re.compile(r"_page_(\d+)_")
+MARKDOWN_IMAGE_LINK_RE = re.compile(r"(!\[[^\]]*\]\()([^)\s]+)")
+
+
+def count_pages(file) -> int:
+    return len(PdfReader(file).pages)
+
+
+def page_ranges(page_count, pages_per_chunk) -> list[tuple[int, int]]:
+    """0 based `[start, end)` page ranges of at most `pages_per_chunk` pages."""
+    return [
+        (start, min(start + pages_per_chunk, page_count))
+        for start in range(0, page_count, pages_per_chunk)
+    ]
+
+
+def split_pdf(file, ranges: list[tuple[int, int]]) -> list[bytes]:
+    reader = PdfReader(file)
+    chunks = []
+    for start, end in ranges:
+        writer = PdfWriter()
+        for page in reader.pages[start:end]:
+            writer.add_page(page)
+        output = io.BytesIO()
+        writer.write(output)
+        chunks.append(output.getvalue())
+    return chunks
+
+
+def shift_pages(markdown: str, offset: int) -> str:
+    return PAGE_MARKER_RE.sub(
+        lambda m: f"(==={m[1]}_PAGE {int(m[2]) + offset}===)", markdown
+    )
+
+
+def merge_chunks(
+    chunks: list[tuple[str, list[io.BytesIO]]], first_pages: list[int]
+) -> tuple[str, list[io.BytesIO]]:
+    """
+    Merge the `(markdown, images)` converted from every page range, `first_pages` is the
+    (0 based) first page of every range.
+    """
+    markdowns, merged_images, names = [], [], set()
+    for index, ((markdown, images), offset) in enumerate(zip(chunks, first_pages)):
+        renames = {}
+        for image in images:
+            name = IMAGE_PAGE_RE.sub(lambda m: f"_page_{int(m[1]) + offset}_", image.name)
+            if name in names:  # not named after its page, keep it unique
+                name = f"chunk{index}_{image.name}"
+            names.add(name)
+            renames[image.name] = name
+            image.name = name
+            merged_images.append(image)
+        markdown = MARKDOWN_IMAGE_LINK_RE.sub(
+            lambda m: m[1] + renames.get(m[2], m[2]), markdown
+        )
+        markdowns.append(shift_pages(markdown, offset))
+    return "".join(markdowns), merged_images
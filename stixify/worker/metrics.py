@@ -0,0 +1,87 @@
+import contextlib
+import contextvars
+import resource
+import threading
+import time
+
+from llama_index.core.callbacks.token_counting import get_tokens_from_response
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import (
+    LLMChatEndEvent,
+    LLMCompletionEndEvent,
+)
+
+_current_metrics: contextvars.ContextVar["dict|None"] = contextvars.ContextVar(
+    "stixify_stage_metrics", default=None
+)
+_handler_lock = threading.Lock()
+_handler_registered = False
+
+
+class LLMUsageHandler(BaseEventHandler):
+    """Add the token usage of every LLM call made by llama-index (i.e txt2stix) to the metrics of the running stage."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StixifyLLMUsageHandler"
+
+    def handle(self, event, **kwargs):
+        if not isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)):
+            return
+        if not event.response:
+            return
+        prompt_tokens, completion_tokens = get_tokens_from_response(event.response)
+        increment(
+            llm_calls=1,
+            llm_prompt_tokens=prompt_tokens,
+            llm_completion_tokens=completion_tokens,
+        )
+
+
+def register_llm_usage_handler():
+    global _handler_registered
+    with _handler_lock:
+        if not _handler_registered:
+            get_dispatcher().add_event_handler(LLMUsageHandler())
+            _handler_registered = True
+
+
+def record(**values):
+    """Set values on the metrics of the running stage, does nothing outside of `stage_metrics`."""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.update(values)
+
+
+def increment(**values):
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        for key, value in values.items():
+            metrics[key] = metrics.get(key, 0) + value
+
+
+def _max_rss_kb():
+    # linux reports kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@contextlib.contextmanager
+def stage_metrics():
+    """
+    Measure the wall time, cpu time (of the worker process) and peak memory growth of the block.
+    The yielded dict is filled in when the block exits, even if it raises.
+    """
+    register_llm_usage_handler()
+    metrics = {}
+    token = _current_metrics.set(metrics)
+    wall_start, cpu_start, rss_start = time.perf_counter(), time.process_time(), _max_rss_kb()
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+        metrics.update(
+            wall_time=round(time.perf_counter() - wall_start, 3),
+            cpu_time=round(time.process_time() - cpu_start, 3),
+            peak_rss_delta=_max_rss_kb() - rss_start,
+        )
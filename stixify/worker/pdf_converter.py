@@ -1,7 +1,18 @@
+import asyncio
+import atexit
+import http.client
+import logging
 from pathlib import Path
+import queue
+import shlex
 import shutil
+import socket
 import subprocess
 import sys
+import threading
+import time
+import xmlrpc.client
+from django.conf import settings
 from mistune import markdown
 import pandas as pd
 from PIL import Image
@@ -11,7 +22,205 @@ class ConversionError(Exception):
     pass
 
 
+class OfficePoolUnavailable(Exception):
+    pass
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        return connection
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class OfficeServer:
+    """
+    A long-lived headless LibreOffice instance, driven through unoserver's XML-RPC interface on a local port.
+
+    unoserver exits by itself after `max_conversions` conversions or when a conversion exceeds `timeout`,
+    the pool then replaces it with a fresh instance. The conversions are counted so the pool retires the instance
+    as soon as it is `exhausted`, without waiting for the process to exit.
+    """
+
+    STARTUP_TIMEOUT = 60
+
+    def __init__(self, command: str, max_conversions: int, timeout: int):
+        self.port = _free_port()
+        self.uno_port = _free_port()
+        self.timeout = timeout
+        self.max_conversions = max_conversions
+        self.conversions = 0
+        self.process = subprocess.Popen(
+            [
+                *shlex.split(command),
+                "--interface", "127.0.0.1",
+                "--port", str(self.port),
+                "--uno-port", str(self.uno_port),
+                "--stop-after", str(max_conversions),
+                "--conversion-timeout", str(timeout),
+                "--quiet",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.wait_until_ready()
+        except Exception:
+            self.close()
+            raise
+
+    def proxy(self, timeout):
+        return xmlrpc.client.ServerProxy(
+            f"http://127.0.0.1:{self.port}",
+            allow_none=True,
+            transport=_TimeoutTransport(timeout),
+        )
+
+    def wait_until_ready(self):
+        deadline = time.monotonic() + self.STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if not self.alive:
+                raise OfficePoolUnavailable("office server exited during startup")
+            try:
+                self.proxy(timeout=5).info()
+                return
+            except (OSError, http.client.HTTPException, xmlrpc.client.Error):
+                time.sleep(0.5)
+        raise OfficePoolUnavailable("office server did not start in time")
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    @property
+    def exhausted(self):
+        return self.conversions >= self.max_conversions
+
+    def convert(self, input_file: Path, output_file: Path):
+        self.conversions += 1
+        # give unoserver a chance to enforce --conversion-timeout itself before giving up on the socket
+        self.proxy(timeout=self.timeout + 10).convert(
+            str(Path(input_file).resolve()), None, str(Path(output_file).resolve()), None
+        )
+
+    def close(self):
+        if not self.alive:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class OfficePool:
+    """Bounded pool of `OfficeServer`s, servers are started lazily and replaced once they exit or fail."""
+
+    def __init__(self, size: int, command: str, max_conversions: int, timeout: int):
+        self.size = size
+        self.command = command
+        self.max_conversions = max_conversions
+        self.timeout = timeout
+        self.idle: queue.LifoQueue[OfficeServer] = queue.LifoQueue()
+        self.started = 0
+        self.lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self.size > 0 and shutil.which(shlex.split(self.command)[0]) is not None
+
+    def acquire(self) -> OfficeServer:
+        with self.lock:
+            if self.idle.empty() and self.started < self.size:
+                self.started += 1
+                try:
+                    return OfficeServer(self.command, self.max_conversions, self.timeout)
+                except Exception:
+                    self.started -= 1
+                    raise
+        try:
+            server = self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise OfficePoolUnavailable("timed out waiting for an idle office server")
+        if server.alive:
+            return server
+        self.discard(server)
+        return self.acquire()
+
+    def release(self, server: OfficeServer):
+        # an exhausted server is still shutting down (--stop-after), it would refuse the next conversion
+        if server.alive and not server.exhausted:
+            self.idle.put(server)
+        else:
+            self.discard(server)
+
+    def discard(self, server: OfficeServer):
+        server.close()
+        with self.lock:
+            self.started -= 1
+
+    def convert(self, input_file: Path, output_file: Path, retry=True):
+        server = self.acquire()
+        try:
+            server.convert(input_file, output_file)
+        except TimeoutError:
+            self.discard(server)
+            raise
+        except (OSError, http.client.HTTPException, xmlrpc.client.Error) as e:
+            # the instance crashed or exited since its last conversion, try once more on another one
+            self.discard(server)
+            if not retry:
+                raise OfficePoolUnavailable(f"office server failed: {e}") from e
+            return self.convert(input_file, output_file, retry=False)
+        except Exception:
+            # a failed or timed out conversion can leave the instance hung, never reuse it
+            self.discard(server)
+            raise
+        self.release(server)
+
+    def close(self):
+        while not self.idle.empty():
+            self.discard(self.idle.get_nowait())
+
+
+_office_pool: OfficePool = None
+
+
+def get_office_pool() -> OfficePool:
+    global _office_pool
+    if _office_pool is None:
+        _office_pool = OfficePool(
+            settings.LIBREOFFICE_POOL_SIZE,
+            settings.LIBREOFFICE_POOL_COMMAND,
+            settings.LIBREOFFICE_POOL_MAX_CONVERSIONS,
+            settings.LIBREOFFICE_CONVERSION_TIMEOUT,
+        )
+        atexit.register(_office_pool.close)
+    return _office_pool
+
+
 def convert_with_libreoffice(input_file: Path, output_file: Path):
+    pool = get_office_pool()
+    if pool.available:
+        try:
+            return pool.convert(input_file, output_file)
+        except OfficePoolUnavailable as e:
+            logging.warning(f"office pool unavailable, falling back to libreoffice subprocess: {e}")
+    return convert_with_libreoffice_subprocess(input_file, output_file)
+
+
+def convert_with_libreoffice_subprocess(input_file: Path, output_file: Path):
     subprocess.run(
         [
             "libreoffice",
@@ -23,6 +232,7 @@ def convert_with_libreoffice(input_file: Path, output_file: Path):
             str(input_file),
         ],
         check=True,
+        timeout=settings.LIBREOFFICE_CONVERSION_TIMEOUT,
     )
     # LibreOffice writes to <same-name>.pdf in same dir
     converted_file = output_file.parent / (input_file.stem + ".pdf")
@@ -82,14 +292,96 @@ def make_conversion(input_file: Path, output_file: Path):
     return output_file
 
 
+class BrowserPool:
+    """
+    A long-lived headless Chromium used to print mhtml files to PDF.
+
+    Playwright runs on an asyncio loop in a background thread so that renders from any thread share
+    the same browser context, concurrent pages are capped at `max_pages` and a hung render is
+    cancelled after `timeout` seconds. The browser is relaunched if it crashes.
+    """
+
+    def __init__(self, max_pages: int, timeout: int):
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.loop: asyncio.AbstractEventLoop = None
+        self.lock = threading.Lock()
+        self.playwright = None
+        self.browser = None
+        self.context = None
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.pages = asyncio.Semaphore(self.max_pages)
+                self.context_lock = asyncio.Lock()
+                threading.Thread(
+                    target=self.loop.run_forever, name="stixify-browser-pool", daemon=True
+                ).start()
+        return self.loop
+
+    async def _get_context(self):
+        from playwright.async_api import async_playwright
+
+        async with self.context_lock:
+            if self.browser is None or not self.browser.is_connected():
+                if self.playwright is None:
+                    self.playwright = await async_playwright().start()
+                self.browser = await self.playwright.chromium.launch(headless=True)
+                self.context = await self.browser.new_context()
+            return self.context
+
+    async def _render(self, input_file: Path):
+        async with self.pages:
+            context = await self._get_context()
+            page = await context.new_page()
+            try:
+                await page.goto(
+                    input_file.resolve().as_uri(),
+                    wait_until="domcontentloaded",
+                    timeout=self.timeout * 1000,
+                )
+                return await page.pdf(format="A4", margin=dict(top='0px', bottom='0px'), tagged=True, outline=True)
+            finally:
+                await page.close()
+
+    def render(self, input_file: Path) -> bytes:
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(
+            asyncio.wait_for(self._render(Path(input_file)), self.timeout), loop
+        )
+        try:
+            return bytes(future.result())
+        except (asyncio.TimeoutError, TimeoutError) as e:
+            raise ConversionError(f"rendering {Path(input_file).name} timed out after {self.timeout}s") from e
+
+    async def _close(self):
+        if self.browser:
+            await self.browser.close()
+        if self.playwright:
+            await self.playwright.stop()
+        self.browser = self.context = self.playwright = None
+
+    def close(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result(timeout=30)
+
+
+_browser_pool: BrowserPool = None
+
+
+def get_browser_pool() -> BrowserPool:
+    global _browser_pool
+    if _browser_pool is None:
+        _browser_pool = BrowserPool(
+            settings.PLAYWRIGHT_MAX_PAGES,
+            settings.PLAYWRIGHT_RENDER_TIMEOUT,
+        )
+        atexit.register(_browser_pool.close)
+    return _browser_pool
+
+
 def convert_mhtml_to_pdf(input_file: Path):
-    from playwright.sync_api import sync_playwright
-    input_file = Path(input_file)
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        url = f"file://{input_file.resolve()}"
-        page.goto(url, wait_until="domcontentloaded")
-        pdf_bytes = page.pdf(format="A4", margin=dict(top='0px', bottom='0px'), tagged=True, outline=True)
-        browser.close()
-        return bytes(pdf_bytes)
+    return get_browser_pool().render(input_file)
@@ -0,0 +1,289 @@
+"""
+Rate limits of the calls made to AI providers, shared by every worker through redis (the celery broker).
+
+Limits are configured per provider and model in `AI_RATE_LIMITS`, e.g
+`{"openai:gpt-5-mini": {"requests_per_minute": 500, "tokens_per_minute": 200000}, "anthropic": {...}}`.
+Each limit is a pair of token buckets (requests and tokens). The tokens of a call are estimated before it is made
+and corrected with the usage reported by the provider once it returns.
+
+When a provider still answers with a rate limit error, the rate of the limit is lowered (multiplicative decrease)
+and it grows back slowly on every successful call (additive increase). Throughput then settles just under the
+actual quota instead of oscillating around it.
+"""
+
+import functools
+import logging
+import random
+import threading
+import time
+
+import redis
+from django.conf import settings
+from llama_index.core.callbacks.token_counting import get_tokens_from_response
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import (
+    LLMChatEndEvent,
+    LLMChatStartEvent,
+    LLMCompletionEndEvent,
+    LLMCompletionStartEvent,
+)
+from llama_index.core.instrumentation.span_handlers import NullSpanHandler
+from llama_index.core.llms import LLM
+
+from stixify.worker import metrics
+
+KEY_PREFIX = "stixify:ratelimit:"
+BURST_SECONDS = 10  # a bucket holds this many seconds of quota
+TARGET_UTILISATION = 0.95
+RATE_DECREASE = 0.7
+RATE_INCREASE = 0.01
+MIN_RATE_FACTOR = 0.1
+MAX_RETRIES = 5
+MAX_BACKOFF = 60
+
+# KEYS: bucket. ARGV: capacity, refill per second, amount, force.
+# Returns the seconds to wait before `amount` is available (nothing is taken then), `force` always takes it
+# (possibly going below 0) and is used to correct the estimated tokens of a call.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'level', 'updated')
+local level = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+level = math.min(capacity, level + math.max(0, now - updated) * rate)
+local wait = 0
+if ARGV[4] == '1' or level >= math.min(amount, capacity) then
+    level = math.min(capacity, level - amount)
+else
+    wait = (math.min(amount, capacity) - level) / rate
+end
+redis.call('HSET', KEYS[1], 'level', level, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+def is_enabled():
+    return bool(settings.AI_RATE_LIMITS) and settings.CELERY_BROKER_URL.startswith(
+        ("redis://", "rediss://")
+    )
+
+
+@functools.cache
+def get_client():
+    return redis.Redis.from_url(settings.CELERY_BROKER_URL)
+
+
+@functools.cache
+def get_token_bucket_script():
+    return get_client().register_script(TOKEN_BUCKET_SCRIPT)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for english text, corrected once the call returns
+    return len(text) // 4
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error: BaseException, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    try:
+        return min(float(response.headers["retry-after"]), MAX_BACKOFF)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return min(2**attempt + random.random(), MAX_BACKOFF)
+
+
+class RateLimit:
+    def __init__(self, key, requests_per_minute=None, tokens_per_minute=None):
+        self.key = key
+        self.limits = dict(requests=requests_per_minute, tokens=tokens_per_minute)
+
+    def rate_factor(self) -> float:
+        factor = get_client().get(self._redis_key("factor"))
+        return float(factor) if factor is not None else 1.0
+
+    def _redis_key(self, *parts):
+        return KEY_PREFIX + ":".join([self.key, *parts])
+
+    def _take(self, kind, amount, force=False) -> float:
+        per_minute = self.limits[kind]
+        rate = per_minute / 60 * TARGET_UTILISATION * self.rate_factor()
+        capacity = max(1, per_minute * BURST_SECONDS / 60)
+        wait = get_token_bucket_script()(
+            keys=[self._redis_key(kind)], args=[capacity, rate, amount, int(force)]
+        )
+        return float(wait)
+
+    def acquire(self, tokens=0) -> float:
+        """Wait until the call can be made, returns the time waited."""
+        waited = 0.0
+        for kind, amount in [("requests", 1), ("tokens", tokens)]:
+            if not self.limits[kind] or not amount:
+                continue
+            while wait := self._take(kind, amount):
+                time.sleep(wait)
+                waited += wait
+        self.record(requests=1, tokens=tokens, wait_seconds=waited)
+        metrics.increment(rate_limit_wait=waited)
+        return waited
+
+    def adjust(self, tokens):
+        """Correct the tokens taken for a call once its actual usage is known."""
+        if self.limits["tokens"] and tokens:
+            self._take("tokens", tokens, force=True)
+        self.record(tokens=tokens)
+
+    def succeeded(self):
+        factor = self.rate_factor()
+        if factor < 1:
+            get_client().set(self._redis_key("factor"), min(1.0, factor + RATE_INCREASE))
+
+    def rate_limited(self):
+        factor = max(MIN_RATE_FACTOR, self.rate_factor() * RATE_DECREASE)
+        logging.warning(f"rate limited by {self.key}, lowering its rate to {factor:.0%}")
+        get_client().set(self._redis_key("factor"), factor)
+        self.record(rate_limited=1)
+        metrics.increment(rate_limited=1)
+
+    def record(self, **values):
+        key = self._redis_key("metrics")
+        pipeline = get_client().pipeline()
+        for name, value in values.items():
+            pipeline.hincrbyfloat(key, name, value)
+        pipeline.execute()
+
+
+def get_limit(provider, model=None) -> RateLimit | None:
+    """The limit of `provider:model`, falls back to the limit of `provider`."""
+    if not is_enabled():
+        return None
+    for key in [f"{provider}:{model}", provider]:
+        if limits := settings.AI_RATE_LIMITS.get(key):
+            return RateLimit(key, **limits)
+    return None
+
+
+def call(provider, model, fn, tokens=0, get_tokens=None):
+    """
+    Call `fn` (a request to `provider`) within its rate limit, retrying with backoff when it is rate limited.
+    `tokens` is the estimated usage of the call, `get_tokens(response)` returns its actual usage.
+    """
+    limit = get_limit(provider, model)
+    if not limit:
+        return fn()
+    for attempt in range(MAX_RETRIES + 1):
+        limit.acquire(tokens)
+        try:
+            response = fn()
+        except Exception as e:
+            limit.adjust(-tokens)
+            if not is_rate_limit_error(e) or attempt == MAX_RETRIES:
+                raise
+            limit.rate_limited()
+            time.sleep(retry_after(e, attempt))
+            continue
+        if get_tokens:
+            limit.adjust(get_tokens(response) - tokens)
+        limit.succeeded()
+        return response
+
+
+def get_metrics() -> dict[str, dict[str, float]]:
+    """Usage of every configured limit since redis was last flushed, keyed by `provider:model`."""
+    if not is_enabled():
+        return {}
+    data = {}
+    for key, limits in settings.AI_RATE_LIMITS.items():
+        limit = RateLimit(key, **limits)
+        values = get_client().hgetall(limit._redis_key("metrics"))
+        data[key] = {name.decode(): float(value) for name, value in values.items()}
+        data[key]["rate_factor"] = limit.rate_factor()
+    return data
+
+
+# llama-index LLM class names of the txt2stix providers
+LLM_PROVIDERS = {
+    "openai_llm": "openai",
+    "Anthropic_LLM": "anthropic",
+    "GenAI": "gemini",
+    "DeepSeek": "deepseek",
+    "OpenRouter_LLM": "openrouter",
+}
+
+
+def llm_provider_model(class_name: str, model: str):
+    return LLM_PROVIDERS.get(class_name, class_name.lower().removesuffix("_llm")), model
+
+
+# (limit, estimated tokens) of the LLM calls in progress, by llama-index span id
+_pending_calls: dict[str, tuple[RateLimit, int]] = {}
+
+
+class LLMRateLimitHandler(BaseEventHandler):
+    """Make the LLM calls of llama-index (i.e txt2stix) wait for their rate limit."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StixifyLLMRateLimitHandler"
+
+    def handle(self, event, **kwargs):
+        if isinstance(event, (LLMChatStartEvent, LLMCompletionStartEvent)):
+            limit = get_limit(
+                *llm_provider_model(event.model_dict.get("class_name", ""), event.model_dict.get("model"))
+            )
+            if not limit:
+                return
+            if isinstance(event, LLMChatStartEvent):
+                text = "".join(str(message.content or "") for message in event.messages)
+            else:
+                text = event.prompt
+            tokens = estimate_tokens(text)
+            limit.acquire(tokens)
+            _pending_calls[event.span_id] = (limit, tokens)
+        elif isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)):
+            limit, tokens = _pending_calls.pop(event.span_id, (None, 0))
+            if not limit:
+                return
+            if event.response:
+                prompt_tokens, completion_tokens = get_tokens_from_response(event.response)
+                limit.adjust(prompt_tokens + completion_tokens - tokens)
+            limit.succeeded()
+
+
+class LLMRateLimitSpanHandler(NullSpanHandler):
+    """Lower the rate of a limit when one of its LLM calls fails with a rate limit error."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StixifyLLMRateLimitSpanHandler"
+
+    def span_drop(self, id_, bound_args, instance=None, err=None, **kwargs):
+        pending = _pending_calls.pop(id_, None)
+        if not isinstance(instance, LLM) or not err or not is_rate_limit_error(err):
+            return
+        limit = get_limit(*llm_provider_model(instance.class_name(), instance.metadata.model_name))
+        if limit:
+            if pending:
+                limit.adjust(-pending[1])
+            limit.rate_limited()
+
+
+_handler_lock = threading.Lock()
+_handler_registered = False
+
+
+def register_llm_rate_limiter():
+    global _handler_registered
+    with _handler_lock:
+        if not _handler_registered:
+            dispatcher = get_dispatcher()
+            dispatcher.add_event_handler(LLMRateLimitHandler())
+            dispatcher.add_span_handler(LLMRateLimitSpanHandler())
+            _handler_registered = True
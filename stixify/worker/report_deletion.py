@@ -0,0 +1,97 @@
+"""
+Removal of the objects of a report from ArangoDB, run by `delete-report` jobs (see `tasks.delete_report`).
+
+Objects are found through a sparse persistent index on `_stixify_report_id` in every collection and removed
+by batches of AQL `REMOVE` statements, so no statement scans the whole view or holds a large transaction.
+The `_is_latest` flags of the other versions of the removed objects are then recomputed in bounded chunks.
+"""
+
+import logging
+
+from django.conf import settings
+from stix2arango.services import ArangoDBService
+
+from stixify.web.arango_indexes import EDGE_COLLECTION, REPORT_ID_INDEX, VERTEX_COLLECTION, is_same_index
+
+REMOVE_BATCH_SIZE = 1000
+IS_LATEST_CHUNK_SIZE = 1000
+REPORT_ID_INDEX_DEFINITION = dict(type="persistent", name=REPORT_ID_INDEX, fields=["_stixify_report_id"], sparse=True)
+
+REMOVE_QUERY = """
+FOR doc IN @@collection OPTIONS {indexHint: @index, forceIndexHint: true}
+    FILTER doc._stixify_report_id == @report_id
+    LIMIT @batch_size
+    REMOVE doc IN @@collection OPTIONS {ignoreErrors: true}
+    RETURN OLD.id
+"""
+
+
+def get_db_service():
+    return ArangoDBService(
+        settings.ARANGODB_DATABASE,
+        [],
+        [],
+        create=False,
+        username=settings.ARANGODB_USERNAME,
+        password=settings.ARANGODB_PASSWORD,
+        host_url=settings.ARANGODB_HOST_URL,
+    )
+
+
+def ensure_report_id_index(db, collection_name) -> str:
+    """
+    The name of the index on `_stixify_report_id` forced by `REMOVE_QUERY`, created if it does not exist.
+    It is normally created by `ensure_arango_indexes` already, maybe under another name (see `is_same_index`).
+    """
+    collection = db.collection(collection_name)
+    for existing in collection.indexes():
+        if is_same_index(REPORT_ID_INDEX_DEFINITION, existing):
+            return existing["name"]
+    collection.add_persistent_index(
+        fields=REPORT_ID_INDEX_DEFINITION["fields"], sparse=True, name=REPORT_ID_INDEX, in_background=True
+    )
+    return REPORT_ID_INDEX
+
+
+def remove_report_objects(report_id, progress=None):
+    """
+    Remove the objects of `report_id` (`report--<uuid>`) and update the `_is_latest` flags of their other versions.
+    `progress(removed_objects=..., updated_objects=...)` is called after every batch.
+    """
+    db_service = get_db_service()
+    counts = dict(removed_objects=0, updated_objects=0)
+
+    def report(**increments):
+        for key, value in increments.items():
+            counts[key] += value
+        if progress:
+            progress(**counts)
+
+    for collection in [VERTEX_COLLECTION, EDGE_COLLECTION]:
+        index = ensure_report_id_index(db_service.db, collection)
+        object_ids = set()
+        while True:
+            removed = db_service.execute_raw_query(
+                REMOVE_QUERY,
+                bind_vars={
+                    "@collection": collection,
+                    "index": index,
+                    "report_id": report_id,
+                    "batch_size": REMOVE_BATCH_SIZE,
+                },
+            )
+            object_ids.update(removed)
+            report(removed_objects=len(removed))
+            if len(removed) < REMOVE_BATCH_SIZE:
+                break
+
+        logging.info(f"removed {len(object_ids)} objects of {report_id} from {collection}, updating _is_latest")
+        object_ids = sorted(object_ids)
+        deprecated = []
+        for i in range(0, len(object_ids), IS_LATEST_CHUNK_SIZE):
+            chunk = object_ids[i : i + IS_LATEST_CHUNK_SIZE]
+            deprecated.extend(db_service.update_is_latest_several(chunk, collection))
+            report(updated_objects=len(chunk))
+        if deprecated:
+            db_service.deprecate_relationships(deprecated, EDGE_COLLECTION)
+    return counts
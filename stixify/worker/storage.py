@@ -0,0 +1,101 @@
+import io
+import json
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+
+class JobStorage:
+    """Intermediate pipeline state for a single job, kept in the default storage under `jobs/<job_id>/`."""
+
+    ROOT = "jobs"
+    MARKDOWN = "markdown.md"
+    TXT2STIX_DATA = "txt2stix_data.json"
+    BUNDLE = "bundle.json"
+    IMAGES_DIR = "images"
+    CHECKPOINTS_DIR = "checkpoints"
+    CHUNKS = "chunks.json"
+    CHUNKS_DIR = "chunks"
+    CHUNK_INPUT = "input.pdf"
+
+    def __init__(self, job_id, storage=None):
+        self.job_id = str(job_id)
+        self.storage = storage or default_storage
+        self.location = posixpath.join(self.ROOT, self.job_id)
+
+    def chunk(self, index) -> "JobStorage":
+        """Storage of a page range of a large document, see `stixify.worker.chunking`."""
+        chunk = JobStorage(self.job_id, self.storage)
+        chunk.location = self.path(self.CHUNKS_DIR, str(index))
+        return chunk
+
+    def path(self, *parts):
+        return posixpath.join(self.location, *parts)
+
+    def exists(self, name):
+        return self.storage.exists(self.path(name))
+
+    def write_bytes(self, name, content: bytes):
+        path = self.path(name)
+        if self.storage.exists(path):
+            self.storage.delete(path)
+        self.storage.save(path, ContentFile(content))
+
+    def read_bytes(self, name) -> bytes:
+        with self.storage.open(self.path(name), "rb") as f:
+            return f.read()
+
+    def write_text(self, name, text: str):
+        self.write_bytes(name, text.encode())
+
+    def read_text(self, name) -> str:
+        return self.read_bytes(name).decode()
+
+    def write_json(self, name, data):
+        self.write_text(name, json.dumps(data))
+
+    def read_json(self, name):
+        return json.loads(self.read_text(name))
+
+    def write_images(self, images: list[io.BytesIO]):
+        for image in images:
+            image.seek(0)
+            self.write_bytes(posixpath.join(self.IMAGES_DIR, image.name), image.read())
+
+    def read_images(self) -> list[io.BytesIO]:
+        images = []
+        _, names = self._listdir(self.path(self.IMAGES_DIR))
+        for name in sorted(names):
+            image = io.BytesIO(self.read_bytes(posixpath.join(self.IMAGES_DIR, name)))
+            image.name = name
+            images.append(image)
+        return images
+
+    def mark_completed(self, stage):
+        """Checkpoint a stage, written once its output is stored so a retried job can skip it."""
+        self.write_bytes(posixpath.join(self.CHECKPOINTS_DIR, stage), b"")
+
+    def is_completed(self, stage) -> bool:
+        return self.exists(posixpath.join(self.CHECKPOINTS_DIR, stage))
+
+    def completed_stages(self) -> list[str]:
+        _, names = self._listdir(self.path(self.CHECKPOINTS_DIR))
+        return sorted(names)
+
+    def clear(self):
+        self._remove_tree(self.location)
+
+    def _remove_tree(self, path):
+        dirs, files = self._listdir(path)
+        for name in files:
+            self.storage.delete(posixpath.join(path, name))
+        for name in dirs:
+            self._remove_tree(posixpath.join(path, name))
+
+    def _listdir(self, path):
+        # FileSystemStorage raises for missing directories, object storages just return nothing
+        try:
+            return self.storage.listdir(path)
+        except FileNotFoundError:
+            return [], []
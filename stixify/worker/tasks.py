@@ -1,35 +1,105 @@
-from datetime import UTC, datetime
+from datetime import UTC, datetime, timedelta
+import functools
+import io
+import json
 import logging
 import os
 from pathlib import Path
+import tempfile
 import uuid
 from django.utils import timezone
 from stixify.web.models import Job, File
-from stixify.web import models
-from celery import shared_task
+from stixify.web import direct_uploads, events, models
+from celery import group, shared_task
+from dogesec_commons.stixifier.models import Profile
 from dogesec_commons.stixifier.stixifier import StixifyProcessor, ReportProperties
 from stixify.web.values.statistics import build_data_and_add_to_cache
 
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.core.files.storage import default_storage
 from django.core.files.base import File as DjangoFile
-from django.core.files.base import File as DjangoFile
-from django.db import transaction
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Q
 import stix2
 
-from stixify.worker import helpers, pdf_converter
+from stixify.worker import chunking, helpers, metrics, pdf_converter, ratelimit, report_deletion
+from stixify.worker.storage import JobStorage
+from stixify.worker.celery import JOB_PRIORITIES, PIPELINE_STAGE_HARD_TIME_LIMIT
 from django.conf import settings
 from txt2stix.txt2stix import Txt2StixData
 
 
 POLL_INTERVAL = 1
+DELETE_REPORT_WAIT_INTERVAL = 60  # seconds between two checks of the jobs a report deletion waits for
+PIPELINE_STAGES = [
+    "render_mhtml_pdf",
+    "convert_file",
+    "extract_file",
+    "upload_file",
+    "embed_file",
+    "archive_pdf",
+]
+
+
+def job_pipeline(job: Job):
+    if job.type == models.JobType.DELETE_REPORT:
+        return delete_report.si(job.id) | job_completed_with_error.si(job.id)
+    # the archived pdf does not depend on the extraction, so it is converted alongside it
+    # and both branches are joined (as a chord) before the job is completed
+    return (
+        render_mhtml_pdf.si(job.id)
+        | group(
+            archive_pdf.si(job.id),
+            convert_file.si(job.id)
+            | extract_file.si(job.id)
+            | upload_file.si(job.id)
+            | embed_file.si(job.id),
+        )
+        | job_completed_with_error.si(job.id)
+    )
 
 
 def new_task(job: Job):
-    (process_post.s(job.id) | job_completed_with_error.si(job.id)).apply_async(
-        countdown=POLL_INTERVAL, root_id=str(job.id), task_id=str(job.id)
+    """
+    Queue the pipeline of a job, or leave it waiting when its priority class already has
+    `JOB_PRIORITY_MAX_IN_FLIGHT` jobs in flight (it is then queued by `dispatch_waiting_jobs`).
+    """
+    if is_throttled(job):
+        dispatch_waiting_jobs.delay(job.priority)
+        return
+    send_job(job)
+
+
+def new_batch_task(jobs: list[Job]):
+    for priority in {job.priority for job in jobs if is_throttled(job)}:
+        dispatch_waiting_jobs.delay(priority)
+    jobs = [job for job in jobs if not is_throttled(job)]
+    if not jobs:
+        return
+    Job.objects.filter(pk__in=[job.pk for job in jobs]).update(queued_time=timezone.now())
+    # the priority is set on every pipeline, nothing requires the jobs of a batch to share one
+    group(job_pipeline(job).set(priority=JOB_PRIORITIES[job.priority]) for job in jobs).apply_async(
+        countdown=POLL_INTERVAL
     )
 
+
+def send_job(job: Job):
+    Job.objects.filter(pk=job.pk).update(queued_time=timezone.now())
+    job_pipeline(job).apply_async(
+        countdown=POLL_INTERVAL,
+        root_id=str(job.id),
+        task_id=str(job.id),
+        priority=JOB_PRIORITIES[job.priority],
+    )
+
+
+def is_throttled(job: Job):
+    # files of a bulk reprocess are throttled by their parent (see `dispatch_bulk_reprocess`)
+    if job.type == models.JobType.REPROCESS_POSTS and job.batch_id:
+        return False
+    return bool(settings.JOB_PRIORITY_MAX_IN_FLIGHT.get(job.priority))
+
 def create_reprocessing_job(file: File, options: dict = None):
     options = options or {}
     job  = models.Job.objects.create(
@@ -38,117 +108,580 @@ def create_reprocessing_job(file: File, options: dict = None):
         file=file,
         state=models.JobState.PENDING,
         extra=options,
+        priority=models.JobPriority.REPROCESS,
     )
     new_task(job)
     return job
 
-@shared_task
-def process_post(job_id, *args):
-    job = Job.objects.get(id=job_id)
-    file = job.file
-    try:
-        job.state = models.JobState.PROCESSING
-        job.save()
-        processor = StixifyProcessor(
-            file.process_file,
-            job.profile,
-            job_id=job.id,
-            file2txt_mode=file.process_mode,
-            report_id=file.id,
+
+def create_deletion_job(file: File = None, report_id: str = None):
+    """
+    Queue a `delete-report` job removing the objects of a report from ArangoDB, then `file` (if any).
+    `file` is hidden from the API right away, an existing deletion job of the file is returned instead of a new one.
+    `report_id` alone is used for files that are already deleted (e.g with their identity).
+    """
+    with transaction.atomic():
+        if file:
+            report_id = file.report_id
+            File.objects.filter(pk=file.pk).update(pending_deletion=True)
+            file.pending_deletion = True
+            job = Job.objects.filter(
+                file=file,
+                type=models.JobType.DELETE_REPORT,
+                state__in=[models.JobState.PENDING, models.JobState.PROCESSING],
+            ).first()
+            if job:
+                return job
+        job = Job.objects.create(
+            type=models.JobType.DELETE_REPORT,
+            file=file,
+            state=models.JobState.PENDING,
+            priority=models.JobPriority.BULK,
+            extra=dict(report_id=report_id, removed_objects=0, updated_objects=0),
         )
-        external_refs = [
-            dict(
-                source_name="stixify_profile_id",
-                external_id=str(job.profile.id),
-            )
-        ]
-        for source in file.sources or []:
-            source_ref = dict(source_name="stixify_source")
-            if source.startswith("http://") or source.startswith("https://"):
-                source_ref.update(url=source)
-            else:
-                source_ref.update(description=source)
-            external_refs.append(source_ref)
-
-        report_props = ReportProperties(
-            name=file.name,
-            identity=file.identity.identity,
-            tlp_level=file.tlp_level,
-            confidence=file.confidence,
-            labels=file.labels,
-            created=file.created,
-            kwargs=dict(external_references=external_refs),
+        transaction.on_commit(lambda: new_task(job))
+    return job
+
+
+def create_bulk_reprocessing_job(file_ids, options: dict, max_in_flight: int = None):
+    """
+    Create a parent job with one (pending) reprocess job per file, the children are linked with `batch_id=parent.id`.
+    Children are queued by `dispatch_bulk_reprocess` so that at most `max_in_flight` are processed at the same time.
+    """
+    with transaction.atomic():
+        parent = models.Job.objects.create(
+            type=models.JobType.BULK_REPROCESS_POSTS,
+            state=models.JobState.PENDING,
+            priority=models.JobPriority.REPROCESS,
+            extra=dict(
+                options,
+                max_in_flight=max_in_flight or settings.BULK_REPROCESS_MAX_IN_FLIGHT,
+                dispatched=0,
+                dispatched_until=None,
+            ),
+        )
+        models.Job.objects.bulk_create(
+            (
+                models.Job(
+                    type=models.JobType.REPROCESS_POSTS,
+                    file_id=file_id,
+                    extra=options,
+                    batch_id=parent.id,
+                    priority=models.JobPriority.REPROCESS,
+                )
+                for file_id in file_ids
+            ),
+            batch_size=1000,
+        )
+        transaction.on_commit(lambda: dispatch_bulk_reprocess.delay(parent.id))
+    return parent
+
+
+def pipeline_stage(stage_fn):
+    """
+    Wrap a pipeline stage into a celery task.
+
+    Stages are chained by `new_task`, each one receives the job id and stores its output in `JobStorage`.
+    Once a stage fails, `job.error` is set and every following stage is skipped up to `job_completed_with_error`.
+    The resources used by every stage that ran are saved in `job.extra["metrics"][<stage name>]`.
+
+    A stage is checkpointed once it succeeds, stages that are already checkpointed are skipped. Tasks are only
+    acknowledged once they finish, so when a worker dies the stage is redelivered and the job carries on from
+    the last completed stage, a failed job does the same when it is resumed (see `resume_job`).
+    The broker redelivers a task not acknowledged after its `visibility_timeout`, whether its worker died or not,
+    so stages are limited to `PIPELINE_STAGE_TIME_LIMIT` (they fail once it is reached) and the timeout is longer.
+
+    Extra task arguments are passed to the stage and are part of its name (e.g `convert_file_chunk.2`).
+    A stage can return a signature to replace itself with (e.g to process a large document in parallel),
+    it is then up to the replacement to checkpoint the stage.
+    """
+
+    @functools.wraps(stage_fn)
+    def run_stage(self, job_id, *args):
+        job = Job.objects.get(id=job_id)
+        if job.error:
+            return job_id
+        being_deleted = File.objects.filter(pk=job.file_id, pending_deletion=True)
+        if job.type != models.JobType.DELETE_REPORT and being_deleted.exists():
+            # the report is being removed, the job would upload its objects again
+            job.error = "file is being deleted"
+            job.save(update_fields=["error"])
+            return job_id
+        if job.state == models.JobState.PENDING:
+            job.state = models.JobState.PROCESSING
+            job.save(update_fields=["state"])
+            events.publish_state(job_id, job.state)
+        stage_name = ".".join([stage_fn.__name__, *map(str, args)])
+        storage = JobStorage(job_id)
+        if storage.is_completed(stage_name):
+            logging.info(f"skipping {stage_name} for job {job_id}, already completed")
+            events.publish_stage(job_id, stage_name, "skipped")
+            return job_id
+        events.publish_stage(job_id, stage_name, "started")
+        replacement = None
+        with metrics.stage_metrics() as stage_metrics:
+            try:
+                replacement = stage_fn(job, *args)
+            except Exception as e:
+                error = str(e)
+                job.error = "failed to process report"
+                if error:
+                    job.error += f": {error}"
+                logging.error(job.error)
+                logging.exception(e)
+                job.save(update_fields=["error"])
+        save_stage_metrics(job_id, stage_name, stage_metrics)
+        if replacement and not job.error:
+            events.publish_stage(job_id, stage_name, "replaced", metrics=stage_metrics)
+            return self.replace(replacement)
+        if not job.error:
+            storage.mark_completed(stage_name)
+        events.publish_stage(
+            job_id, stage_name, "failed" if job.error else "completed", metrics=stage_metrics
         )
-        processor.setup(
-            report_prop=report_props, extra=dict(_stixify_file_id=str(file.id))
+        return job_id
+
+    return shared_task(
+        run_stage,
+        bind=True,
+        acks_late=True,
+        reject_on_worker_lost=True,
+        soft_time_limit=settings.PIPELINE_STAGE_TIME_LIMIT,
+        time_limit=PIPELINE_STAGE_HARD_TIME_LIMIT,
+    )
+
+
+def save_stage_metrics(job_id, stage_name, stage_metrics: dict):
+    # stages of the same job can run concurrently, lock the job so their metrics are not overwritten
+    with transaction.atomic():
+        extra = Job.objects.select_for_update().values_list("extra", flat=True).get(pk=job_id) or {}
+        extra.setdefault("metrics", {})[stage_name] = stage_metrics
+        Job.objects.filter(pk=job_id).update(extra=extra)
+
+
+def get_profile(job: Job) -> Profile:
+    # reprocess jobs can switch profile, the file is only updated once the new bundle is uploaded
+    if profile_id := (job.extra or {}).get("profile_id"):
+        return Profile.objects.get(pk=profile_id)
+    return job.profile
+
+
+def make_processor(job: Job, input_file=None) -> StixifyProcessor:
+    file = job.file
+    profile = get_profile(job)
+    processor = StixifyProcessor(
+        input_file or file.process_file,
+        profile,
+        job_id=job.id,
+        file2txt_mode=file.process_mode,
+        report_id=file.id,
+    )
+    external_refs = [
+        dict(
+            source_name="stixify_profile_id",
+            external_id=str(profile.id),
         )
-        skip_extraction = bool((job.extra or {}).get("skip_extraction"))
-
-        # remove existing values for this file that are not in the new upload (handles deletions and modifications)
-        models.ObjectValue.objects.filter(file_id=file.id).delete()
-        if job.type == models.JobType.REPROCESS_POSTS and skip_extraction:
-            processor.output_md = file.markdown_file.open().read().decode()
-            txt2stix_data = None
-            if not file.txt2stix_data:
-                raise Exception("no existing extraction data to use for reprocess with skip_extraction=true")
-            txt2stix_data = Txt2StixData.model_validate(file.txt2stix_data)
-            processor.txt2stix(txt2stix_data)
-            processor.write_bundle(processor.bundler)
-            processor.upload_to_arango()
+    ]
+    for source in file.sources or []:
+        source_ref = dict(source_name="stixify_source")
+        if source.startswith("http://") or source.startswith("https://"):
+            source_ref.update(url=source)
         else:
-            processor.process()
-        
-        with transaction.atomic(): # revert to old file if something goes wrong during processing
-            new_profile_id = (job.extra or {}).get("profile_id")
-            if new_profile_id:
-                file.profile_id = new_profile_id
-                file.save(update_fields=["profile"])
-            file.set_txt2stix_data(processor.txt2stix_data)
-            file.create_embedding(include_non_incident=settings.CREATE_EMBEDDING_INCLUDE_NON_INCIDENT)
-
-            if job.type == models.JobType.IMPORT_FILE: # only update files for import jobs, reprocess jobs should keep the same file references
-                file.markdown_file.save("markdown.md", processor.md_file.open(), save=True)
-                models.FileImage.objects.filter(report=file).delete()  # remove old references
-
-                for image in processor.md_images:
-                    models.FileImage.objects.create(
-                        report=file, file=DjangoFile(image, image.name), name=image.name
-                    )
-
-                converted_file_path = processor.tmpdir / "converted_pdf.pdf"
-                pdf_converter.make_conversion(processor.filename, converted_file_path)
-                file.pdf_file.save(
-                    converted_file_path.name, open(converted_file_path, mode="rb")
-                )
-                file.save(update_fields=['markdown_file', 'pdf_file'])
-    except Exception as e:
-        error = str(e)
-        job.error = "failed to process report"
-        if error:
-            job.error += f": {error}"
-        logging.error(job.error)
-        logging.exception(e)
-    job.save()
-    return job_id
+            source_ref.update(description=source)
+        external_refs.append(source_ref)
+
+    report_props = ReportProperties(
+        name=file.name,
+        identity=file.identity.identity,
+        tlp_level=file.tlp_level,
+        confidence=file.confidence,
+        labels=file.labels,
+        created=file.created,
+        kwargs=dict(external_references=external_refs),
+    )
+    processor.setup(
+        report_prop=report_props, extra=dict(_stixify_file_id=str(file.id))
+    )
+    return processor
+
+
+def should_skip_extraction(job: Job):
+    # set for reprocess jobs with skip_extraction=true and for imports of duplicated files
+    return bool((job.extra or {}).get("skip_extraction"))
+
+
+def should_skip_conversion(job: Job):
+    # reusing the extractions also reuses the markdown they were made from
+    return should_skip_extraction(job) or bool((job.extra or {}).get("skip_conversion"))
+
+
+@pipeline_stage
+def render_mhtml_pdf(job: Job):
+    file = job.file
+    if file.mode != "mhtml-pdf" or file.pdf_file: # reprocess jobs reuse the pdf rendered on import
+        return
+    with tempfile.TemporaryDirectory(prefix="stixify-") as tmpdir:
+        input_path = Path(tmpdir) / "input.mhtml"
+        with file.file.open("rb") as f:
+            input_path.write_bytes(f.read())
+        pdf_bytes = pdf_converter.convert_mhtml_to_pdf(input_path)
+    pdf_filename = Path(file.file.name).stem.removeprefix(f"{file.id}_") + ".pdf"
+    file.pdf_file.save(pdf_filename, ContentFile(pdf_bytes), save=True)
+
+
+def split_large_document(job: Job, storage: JobStorage) -> int:
+    """
+    Split pdfs of more than `LARGE_DOCUMENT_PAGE_THRESHOLD` pages into ranges of `LARGE_DOCUMENT_CHUNK_PAGES` pages
+    stored in `JobStorage.chunk(<index>)`, returns the number of ranges (0 when the document is not split).
+    """
+    file = job.file
+    if not settings.LARGE_DOCUMENT_PAGE_THRESHOLD or file.process_mode != "pdf":
+        return 0
+    with file.process_file as f:
+        pdf = io.BytesIO(f.read())
+    page_count = chunking.count_pages(pdf)
+    if page_count <= settings.LARGE_DOCUMENT_PAGE_THRESHOLD:
+        return 0
+    ranges = chunking.page_ranges(page_count, settings.LARGE_DOCUMENT_CHUNK_PAGES)
+    for index, content in enumerate(chunking.split_pdf(pdf, ranges)):
+        storage.chunk(index).write_bytes(JobStorage.CHUNK_INPUT, content)
+    storage.write_json(JobStorage.CHUNKS, ranges)
+    metrics.record(pages=page_count, chunks=len(ranges))
+    logging.info(f"split {file.id} into {len(ranges)} chunks of {page_count} pages")
+    return len(ranges)
+
+
+@pipeline_stage
+def convert_file(job: Job):
+    storage = JobStorage(job.id)
+    if should_skip_conversion(job):
+        if not job.file.markdown_file:
+            raise Exception("no existing markdown to use for reprocess with skip_conversion=true")
+        storage.write_bytes(JobStorage.MARKDOWN, job.file.markdown_file.open().read())
+        return
+
+    if chunk_count := split_large_document(job, storage):
+        return group(
+            convert_file_chunk.si(job.id, index) for index in range(chunk_count)
+        ) | merge_file_chunks.si(job.id)
+
+    processor = make_processor(job)
+    logging.info(f"running file2txt on {processor.task_name}")
+    processor.file2txt()
+    storage.write_text(JobStorage.MARKDOWN, processor.output_md)
+    storage.write_images(processor.md_images)
+    metrics.record(markdown_length=len(processor.output_md), images=len(processor.md_images))
+
+
+@pipeline_stage
+def convert_file_chunk(job: Job, index):
+    chunk = JobStorage(job.id).chunk(index)
+    input_file = io.BytesIO(chunk.read_bytes(JobStorage.CHUNK_INPUT))
+    input_file.name = JobStorage.CHUNK_INPUT
+    processor = make_processor(job, input_file)
+    logging.info(f"running file2txt on {processor.task_name} chunk {index}")
+    processor.file2txt()
+    chunk.write_text(JobStorage.MARKDOWN, processor.output_md)
+    chunk.write_images(processor.md_images)
+    metrics.record(markdown_length=len(processor.output_md), images=len(processor.md_images))
+
+
+@pipeline_stage
+def merge_file_chunks(job: Job):
+    storage = JobStorage(job.id)
+    ranges = storage.read_json(JobStorage.CHUNKS)
+    chunks = []
+    for index in range(len(ranges)):
+        chunk = storage.chunk(index)
+        chunks.append((chunk.read_text(JobStorage.MARKDOWN), chunk.read_images()))
+    markdown, images = chunking.merge_chunks(chunks, [start for start, _ in ranges])
+    storage.write_text(JobStorage.MARKDOWN, markdown)
+    storage.write_images(images)
+    storage.mark_completed("convert_file")  # `convert_file` was replaced by the chunks
+    metrics.record(markdown_length=len(markdown), images=len(images))
+
+
+@pipeline_stage
+def extract_file(job: Job):
+    storage = JobStorage(job.id)
+    txt2stix_data = None
+    if should_skip_extraction(job):
+        if not job.file.txt2stix_data:
+            raise Exception("no existing extraction data to use for reprocess with skip_extraction=true")
+        txt2stix_data = Txt2StixData.model_validate(job.file.get_txt2stix_data())
+
+    processor = make_processor(job)
+    processor.output_md = storage.read_text(JobStorage.MARKDOWN)
+    logging.info(f"running txt2stix on {processor.task_name}")
+    processor.txt2stix(txt2stix_data)
+    processor.write_bundle(processor.bundler)
+    storage.write_json(
+        JobStorage.TXT2STIX_DATA,
+        processor.txt2stix_data.model_dump(mode="json", exclude_unset=True, exclude_none=True),
+    )
+    storage.write_text(JobStorage.BUNDLE, processor.bundle)
+    metrics.record(bundle_objects=len(json.loads(processor.bundle).get("objects", [])))
+
+
+@pipeline_stage
+def upload_file(job: Job):
+    file = job.file
+    storage = JobStorage(job.id)
+    processor = make_processor(job)
+    processor.bundle_file = processor.tmpdir / f"bundle_{processor.report_id}.json"
+    processor.bundle_file.write_bytes(storage.read_bytes(JobStorage.BUNDLE))
+    processor.extra_data["_stixify_report_id"] = file.report_id
+
+    # remove existing values for this file that are not in the new upload (handles deletions and modifications)
+    # new values are indexed by the stix2arango post upload hook (`process_uploaded_objects_hook`)
+    models.ObjectValue.objects.filter(file_id=file.id).delete()
+    logging.info(f"uploading {processor.task_name} to arangodb via stix2arango")
+    processor.upload_to_arango()
+    metrics.record(object_values=models.ObjectValue.objects.filter(file_id=file.id).count())
+
+    txt2stix_data = Txt2StixData.model_validate(storage.read_json(JobStorage.TXT2STIX_DATA))
+    # only update files for import jobs, reprocess jobs should keep the same file references
+    # and duplicated files already have a copy of the markdown and images
+    update_file_content = job.type == models.JobType.IMPORT_FILE and not should_skip_conversion(job)
+    if update_file_content:
+        # upload the images before the transaction, they are only referenced once it commits
+        images = models.FileImage.store_images(file, storage.read_images())
+        metrics.record(images=len(images))
+    with transaction.atomic(): # revert to old file if something goes wrong during processing
+        new_profile_id = (job.extra or {}).get("profile_id")
+        if new_profile_id:
+            file.profile_id = new_profile_id
+            file.save(update_fields=["profile"])
+        file.set_txt2stix_data(txt2stix_data)
+
+        if update_file_content:
+            # `archive_pdf` runs concurrently and saves `pdf_file`, only update the fields owned by this stage
+            file.markdown_file.save("markdown.md", ContentFile(storage.read_bytes(JobStorage.MARKDOWN)), save=False)
+            file.save(update_fields=["markdown_file"])
+            models.FileImage.objects.filter(report=file).delete()  # remove old references
+            models.FileImage.create_stored(images)
+
+
+@pipeline_stage
+def embed_file(job: Job):
+    job.file.create_embedding(include_non_incident=settings.CREATE_EMBEDDING_INCLUDE_NON_INCIDENT)
+
+
+def processing_jobs(file_id):
+    """The import and reprocess jobs of the file that are queued or running."""
+    return Job.objects.filter(
+        file_id=file_id,
+        type__in=[models.JobType.IMPORT_FILE, models.JobType.REPROCESS_POSTS],
+    ).filter(
+        Q(state=models.JobState.PROCESSING) | Q(state=models.JobState.PENDING, queued_time__isnull=False)
+    )
+
+
+@pipeline_stage
+def delete_report(job: Job):
+    # jobs started before the deletion was requested could upload the objects again once they are removed,
+    # those queued after it fail (see `pipeline_stage`)
+    if job.file_id and processing_jobs(job.file_id).exists():
+        logging.info(f"waiting for the jobs of {job.extra['report_id']} to finish before removing it")
+        return delete_report.si(job.id).set(countdown=DELETE_REPORT_WAIT_INTERVAL)
+    def progress(**counts):
+        Job.objects.filter(pk=job.pk).update(extra=dict(job.extra, **counts))
+        events.publish_stage(job.id, "delete_report", "progress", **counts)
+
+    counts = report_deletion.remove_report_objects(job.extra["report_id"], progress=progress)
+    logging.info(f"removed {counts['removed_objects']} objects of {job.extra['report_id']}")
+    if file := File.objects.filter(pk=job.file_id).first():
+        file.report_removed = True  # the objects are gone, see `models.remove_reports_on_delete`
+        file.delete()
+
+
+@pipeline_stage
+def archive_pdf(job: Job):
+    if job.type != models.JobType.IMPORT_FILE: # reprocess jobs should keep the same file references
+        return
+    file = job.file
+    if file.pdf_file: # already rendered by `render_mhtml_pdf` or copied from a duplicate
+        return
+    with tempfile.TemporaryDirectory(prefix="stixify-") as tmpdir:
+        tmpdir = Path(tmpdir)
+        with file.process_file as f:
+            input_path = tmpdir / Path(f.name).name
+            input_path.write_bytes(f.read())
+        converted_file_path = tmpdir / "converted_pdf.pdf"
+        pdf_converter.make_conversion(input_path, converted_file_path)
+        with open(converted_file_path, mode="rb") as f:
+            file.pdf_file.save(converted_file_path.name, f, save=False)
+    file.save(update_fields=["pdf_file"])
+
+
+def is_resumable(job: Job):
+    return job.state == models.JobState.FAILED and bool((job.extra or {}).get("resumable"))
+
+
+def resume_job(job: Job):
+    """
+    Restart a failed job from its last completed stage.
+    """
+    job.extra = {k: v for k, v in (job.extra or {}).items() if k != "resumable"}
+    job.state = models.JobState.PENDING
+    job.error = None
+    job.completion_time = None
+    job.queued_time = None
+    job.save(update_fields=["extra", "state", "error", "completion_time", "queued_time"])
+    transaction.on_commit(lambda: new_task(job))
+    return job
 
 
 @shared_task
 def job_completed_with_error(job_id):
     job = Job.objects.get(pk=job_id)
     state = models.JobState.COMPLETED
+    extra = job.extra
     if job.error:
         state = models.JobState.FAILED
+        if job.type in [models.JobType.IMPORT_FILE, models.JobType.REPROCESS_POSTS, models.JobType.DELETE_REPORT]:
+            # keep the checkpoints (and the file of imports) so the job can be resumed,
+            # they are removed by `clear_expired_checkpoints` if it is not
+            extra = dict(extra or {}, resumable=True)
+    Job.objects.filter(pk=job_id).update(
+        state=state, extra=extra, completion_time=datetime.now(UTC)
+    )
+    events.publish_state(job_id, state, error=job.error)
+    if state == models.JobState.COMPLETED:
+        JobStorage(job_id).clear()
+    if job.type == models.JobType.REPROCESS_POSTS and job.batch_id:
+        dispatch_bulk_reprocess.delay(job.batch_id)
+    elif is_throttled(job):
+        dispatch_waiting_jobs.delay(job.priority)
+
+
+@shared_task
+def dispatch_bulk_reprocess(job_id):
+    """
+    Queue the next children of a bulk reprocess job, keeping at most `max_in_flight` of them queued or processing.
+
+    Runs when the job is created, every time one of its children completes and periodically from celery beat.
+    Children are queued in `id` order and the last queued id is stored on the parent, so this is safe to run
+    concurrently and resumes where it stopped.
+    """
+    with transaction.atomic():
+        parent = (
+            Job.objects.select_for_update()
+            .filter(pk=job_id, type=models.JobType.BULK_REPROCESS_POSTS)
+            .first()
+        )
+        if not parent or parent.state == models.JobState.COMPLETED:
+            return
+        children = Job.objects.filter(batch_id=parent.id).order_by("id")
+        dispatched_until = parent.extra["dispatched_until"]
+        if dispatched_until:
+            queued = children.filter(id__gt=dispatched_until)
+            in_flight = children.filter(
+                id__lte=dispatched_until,
+                state__in=[models.JobState.PENDING, models.JobState.PROCESSING],
+            ).count()
+        else:
+            queued, in_flight = children, 0
+        next_jobs = list(queued[: max(0, parent.extra["max_in_flight"] - in_flight)])
+
+        if next_jobs:
+            parent.state = models.JobState.PROCESSING
+            parent.extra.update(
+                dispatched=parent.extra["dispatched"] + len(next_jobs),
+                dispatched_until=str(next_jobs[-1].id),
+            )
+            transaction.on_commit(lambda: [new_task(job) for job in next_jobs])
+        elif not in_flight:
+            parent.state = models.JobState.COMPLETED
+            parent.completion_time = datetime.now(UTC)
+        parent.save(update_fields=["state", "extra", "completion_time"])
+
+
+def lock_priority(priority):
+    # serializes the dispatches of a priority class until the end of the transaction
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [f"stixify-job-priority-{priority}"])
+
+
+@shared_task
+def dispatch_waiting_jobs(priority=None):
+    """
+    Queue the import, reprocess and delete jobs of a priority class that are waiting for room, keeping at most
+    `JOB_PRIORITY_MAX_IN_FLIGHT[priority]` of them queued or processing. Waiting jobs are queued oldest first.
+
+    Runs when a job of the class is created or finishes and periodically from celery beat (for every class).
+    """
+    if priority is None:
+        for priority in settings.JOB_PRIORITY_MAX_IN_FLIGHT:
+            dispatch_waiting_jobs(priority)
+        return
+    max_in_flight = settings.JOB_PRIORITY_MAX_IN_FLIGHT.get(priority)
+    with transaction.atomic():
+        lock_priority(priority)
+        jobs = Job.objects.filter(
+            priority=priority,
+            type__in=[models.JobType.IMPORT_FILE, models.JobType.REPROCESS_POSTS, models.JobType.DELETE_REPORT],
+        )
+        in_flight = jobs.filter(
+            state__in=[models.JobState.PENDING, models.JobState.PROCESSING],
+            queued_time__isnull=False,
+        ).count()
+        waiting = (
+            jobs.filter(state=models.JobState.PENDING, queued_time__isnull=True)
+            .exclude(type=models.JobType.REPROCESS_POSTS, batch_id__isnull=False)
+            .order_by("run_datetime")
+        )
+        if max_in_flight:
+            waiting = waiting[: max(0, max_in_flight - in_flight)]
+        next_jobs = list(waiting)
+        Job.objects.filter(pk__in=[job.pk for job in next_jobs]).update(queued_time=timezone.now())
+        transaction.on_commit(lambda: [send_job(job) for job in next_jobs])
+
+
+@shared_task
+def clear_expired_checkpoints():
+    """
+    Failed jobs that were not resumed within `FAILED_JOB_RESUME_HOURS` are no longer resumable,
+    their checkpoints are removed along with the file of imports (as it was never processed).
+    """
+    cutoff = datetime.now(UTC) - timedelta(hours=settings.FAILED_JOB_RESUME_HOURS)
+    for job in Job.objects.filter(
+        state=models.JobState.FAILED, extra__resumable=True, completion_time__lt=cutoff
+    ):
+        JobStorage(job.id).clear()
         if job.type == models.JobType.IMPORT_FILE:
             job.file and job.file.delete()
-    Job.objects.filter(pk=job_id).update(state=state, completion_time=datetime.now(UTC))
+        job.extra.pop("resumable")
+        Job.objects.filter(pk=job.id).update(extra=job.extra)
+
+
+@shared_task
+def clear_expired_uploads():
+    direct_uploads.clear_expired_uploads()
+
+
+@shared_task
+def dispatch_bulk_reprocess_jobs():
+    for job_id in Job.objects.filter(
+        type=models.JobType.BULK_REPROCESS_POSTS,
+        state__in=[models.JobState.PENDING, models.JobState.PROCESSING],
+    ).values_list("id", flat=True):
+        dispatch_bulk_reprocess(job_id)
 
 from celery import signals
 
+ratelimit.register_llm_rate_limiter()
+
 
 @signals.worker_ready.connect
 def refresh_statistics_when_program_starts(**kwargs):
     auto_refresh_statistics_data.delay()
 
+@signals.worker_process_shutdown.connect
+def close_converter_pools(**kwargs):
+    pdf_converter.get_office_pool().close()
+    pdf_converter.get_browser_pool().close()
+
 @shared_task
 def update_knowledgebase(job_id):
     job = models.Job.objects.get(pk=job_id)
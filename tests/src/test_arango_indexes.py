@@ -0,0 +1,150 @@
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from stixify.web import arango_indexes
+from stixify.web.arango_indexes import EDGE_COLLECTION, INDEXES, VERTEX_COLLECTION
+
+
+@pytest.fixture
+def db():
+    db = MagicMock()
+    collections = {VERTEX_COLLECTION: MagicMock(), EDGE_COLLECTION: MagicMock()}
+    for collection in collections.values():
+        collection.indexes.return_value = [
+            dict(type="primary", name="primary", fields=["_key"], sparse=False),
+        ]
+    db.collection.side_effect = collections.__getitem__
+    db.has_collection.side_effect = collections.__contains__
+    db.analyzers.return_value = [dict(name="identity")]
+    db.views.return_value = [dict(name="stixify_view")]
+    with patch.object(arango_indexes, "get_db", return_value=db):
+        yield db
+
+
+def test_missing_indexes(db):
+    # same definition under another name
+    db.collection(VERTEX_COLLECTION).indexes.return_value.append(
+        dict(type="persistent", name="by_creator", fields=["created_by_ref"], sparse=True)
+    )
+    # same name
+    db.collection(EDGE_COLLECTION).indexes.return_value.append(
+        dict(type="persistent", name=arango_indexes.REPORT_ID_INDEX, fields=["_stixify_report_id"], sparse=True)
+    )
+    missing = arango_indexes.missing_indexes(db)
+    assert [(collection, index["name"]) for collection, index in missing] == [
+        (VERTEX_COLLECTION, "stixify_type_latest_created"),
+        (VERTEX_COLLECTION, "stixify_object_marking_refs"),
+        (VERTEX_COLLECTION, "stixify_report_id"),
+        (VERTEX_COLLECTION, "stixify_report_id_key"),
+        (EDGE_COLLECTION, "stixify_created_by_ref"),
+        (EDGE_COLLECTION, "stixify_report_id_key"),
+    ]
+
+
+def test_missing_indexes__no_collection(db):
+    db.has_collection.side_effect = lambda name: name == EDGE_COLLECTION
+    assert {collection for collection, _ in arango_indexes.missing_indexes(db)} == {EDGE_COLLECTION}
+
+
+def test_ensure_indexes(db):
+    created = arango_indexes.ensure_indexes(db)
+    assert len(created) == sum(map(len, INDEXES.values()))
+    db.collection(VERTEX_COLLECTION).add_index.assert_any_call(
+        dict(
+            type="persistent",
+            name="stixify_created_by_ref",
+            fields=["created_by_ref"],
+            sparse=True,
+            inBackground=True,
+        )
+    )
+
+
+def test_explain(db):
+    def explain(query, bind_vars):
+        if "SORT doc._key" in query:
+            nodes = [dict(type="IndexNode", indexes=[dict(name="stixify_report_id_key")])]
+        elif "_stixify_report_id" in query:
+            nodes = [dict(type="IndexNode", indexes=[dict(name="stixify_report_id")])]
+        elif "@view" in bind_vars:
+            nodes = [dict(type="EnumerateViewNode", view=bind_vars["@view"], condition=dict(type="n-ary and"))]
+        else:
+            nodes = [dict(type="EnumerateCollectionNode", collection=bind_vars["@collection"])]
+        return dict(nodes=[dict(type="SingletonNode"), *nodes, dict(type="ReturnNode")])
+
+    db.aql.explain.side_effect = explain
+    plans = {plan.name: plan for plan in arango_indexes.explain(db)}
+    assert plans.keys() == arango_indexes.DIAGNOSTIC_QUERIES.keys()
+    assert plans[f"objects of a report ({EDGE_COLLECTION})"].indexes == ["stixify_report_id"]
+    assert plans[f"objects of a report ({EDGE_COLLECTION})"].full_scans == []
+    assert plans[f"objects of a report by cursor ({VERTEX_COLLECTION})"].indexes == ["stixify_report_id_key"]
+    assert plans["reports of a page"].full_scans == [VERTEX_COLLECTION]
+    assert plans["reports by description"].full_scans == []
+    assert plans["reports by description"].indexes == [arango_indexes.REPORT_SEARCH_VIEW]
+
+
+def test_missing_search(db):
+    assert arango_indexes.missing_search(db) == [
+        ("analyzer", arango_indexes.NGRAM_ANALYZER),
+        ("view", arango_indexes.REPORT_SEARCH_VIEW),
+    ]
+    db.analyzers.return_value.append(dict(name=f"stixify_database::{arango_indexes.NGRAM_ANALYZER}"))
+    db.views.return_value.append(dict(name=arango_indexes.REPORT_SEARCH_VIEW))
+    assert arango_indexes.missing_search(db) == []
+
+
+def test_missing_search__no_collection(db):
+    db.has_collection.side_effect = lambda name: False
+    assert arango_indexes.missing_search(db) == [("analyzer", arango_indexes.NGRAM_ANALYZER)]
+
+
+def test_ensure_search(db):
+    assert len(arango_indexes.ensure_search(db)) == 2
+    db.create_analyzer.assert_called_once_with(**arango_indexes.ANALYZERS[0])
+    db.create_arangosearch_view.assert_called_once_with(
+        arango_indexes.REPORT_SEARCH_VIEW, dict(links=arango_indexes.REPORT_SEARCH_LINKS)
+    )
+
+
+def test_has_report_search(db):
+    with patch.object(arango_indexes, "_report_search_ready", False):
+        assert not arango_indexes.has_report_search(db)
+        db.views.return_value.append(dict(name=arango_indexes.REPORT_SEARCH_VIEW))
+        assert arango_indexes.has_report_search(db)
+        # remembered once it exists
+        db.views.return_value.pop()
+        assert arango_indexes.has_report_search(db)
+
+
+def test_check_indexes(db):
+    warnings = arango_indexes.check_indexes()
+    assert len(warnings) == sum(map(len, INDEXES.values())) + 2
+    assert {warning.id for warning in warnings} == {"stixify.W002"}
+
+
+def test_check_indexes__unreachable(db):
+    db.has_collection.side_effect = ConnectionError("refused")
+    [warning] = arango_indexes.check_indexes()
+    assert warning.id == "stixify.W001"
+
+
+def test_command(db):
+    out = StringIO()
+    call_command("ensure_arango_indexes", stdout=out)
+    assert "10 index(es) created" in out.getvalue()
+
+
+def test_command__check(db):
+    with pytest.raises(CommandError):
+        call_command("ensure_arango_indexes", "--check", stdout=StringIO())
+    with (
+        patch.object(arango_indexes, "missing_indexes", return_value=[]),
+        patch.object(arango_indexes, "missing_search", return_value=[]),
+    ):
+        out = StringIO()
+        call_command("ensure_arango_indexes", "--check", stdout=out)
+    assert "All indexes exist" in out.getvalue()
+    db.collection(VERTEX_COLLECTION).add_index.assert_not_called()
@@ -0,0 +1,90 @@
+import io
+
+import pytest
+from file2txt.parsers.core import BaseParser
+from pypdf import PdfReader, PdfWriter
+
+from stixify.worker import chunking
+
+
+def make_pdf(page_count):
+    writer = PdfWriter()
+    for i in range(page_count):
+        writer.add_blank_page(width=100 + i, height=100)
+    output = io.BytesIO()
+    writer.write(output)
+    output.seek(0)
+    return output
+
+
+def make_image(name):
+    image = io.BytesIO(name.encode())
+    image.name = name
+    return image
+
+
+@pytest.mark.parametrize(
+    "page_count,pages_per_chunk,expected",
+    [
+        (5, 2, [(0, 2), (2, 4), (4, 5)]),
+        (4, 2, [(0, 2), (2, 4)]),
+        (1, 25, [(0, 1)]),
+    ],
+)
+def test_page_ranges(page_count, pages_per_chunk, expected):
+    assert chunking.page_ranges(page_count, pages_per_chunk) == expected
+
+
+def test_split_pdf():
+    pdf = make_pdf(5)
+    assert chunking.count_pages(pdf) == 5
+    chunks = chunking.split_pdf(pdf, chunking.page_ranges(5, 2))
+    widths = [
+        [int(page.mediabox.width) for page in PdfReader(io.BytesIO(chunk)).pages]
+        for chunk in chunks
+    ]
+    assert widths == [[100, 101], [102, 103], [104]]
+
+
+def test_merge_chunks__same_as_unsplit():
+    pages = [
+        "page one ![](_page_0_Picture_1.png)",
+        "page two",
+        "page three ![](_page_2_Picture_1.png) ![](logo.png)",
+        "page four ![](logo.png)",
+    ]
+    unsplit = BaseParser.join_pages(pages)
+    chunks = [
+        (
+            BaseParser.join_pages(["page one ![](_page_0_Picture_1.png)", "page two"]),
+            [make_image("_page_0_Picture_1.png")],
+        ),
+        (
+            BaseParser.join_pages(
+                ["page three ![](_page_0_Picture_1.png) ![](logo.png)", "page four ![](logo.png)"]
+            ),
+            [make_image("_page_0_Picture_1.png"), make_image("logo.png")],
+        ),
+    ]
+    markdown, images = chunking.merge_chunks(chunks, [0, 2])
+    assert markdown == unsplit
+    assert [image.name for image in images] == [
+        "_page_0_Picture_1.png",
+        "_page_2_Picture_1.png",
+        "logo.png",
+    ]
+    assert [image.read() for image in images] == [
+        b"_page_0_Picture_1.png",
+        b"_page_0_Picture_1.png",
+        b"logo.png",
+    ]
+
+
+def test_merge_chunks__duplicated_image_names():
+    chunks = [
+        ("![](logo.png)", [make_image("logo.png")]),
+        ("![](logo.png)", [make_image("logo.png")]),
+    ]
+    markdown, images = chunking.merge_chunks(chunks, [0, 25])
+    assert markdown == "![](logo.png)![](chunk1_logo.png)"
+    assert [image.name for image in images] == ["logo.png", "chunk1_logo.png"]
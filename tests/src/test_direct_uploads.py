@@ -0,0 +1,111 @@
+import base64
+import hashlib
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+from django.core.files.base import ContentFile
+from rest_framework.exceptions import ValidationError
+
+from stixify.web import direct_uploads
+
+SHA256 = "ab" * 32
+CHECKSUM = base64.b64encode(bytes.fromhex(SHA256)).decode()
+
+
+@pytest.fixture
+def storage(settings):
+    settings.DIRECT_UPLOAD_EXPIRY = 3600
+    storage = MagicMock(bucket_name="stixify")
+    storage._normalize_name.side_effect = lambda name: f"files/{name}"
+    with patch.object(direct_uploads, "default_storage", storage):
+        yield storage
+
+
+@pytest.fixture
+def presigning_client():
+    client = MagicMock()
+    client.generate_presigned_url.return_value = "https://storage.example/presigned"
+    with patch.object(direct_uploads, "get_presigning_client", return_value=client):
+        yield client
+
+
+def test_create_upload(storage, presigning_client):
+    upload = direct_uploads.create_upload("my report.pdf", 1024, SHA256.upper(), "application/pdf")
+    params = presigning_client.generate_presigned_url.call_args.kwargs["Params"]
+    assert params["Key"].startswith("files/uploads/")
+    assert params["Key"].endswith("/my_report.pdf")
+    assert params["ContentLength"] == 1024
+    assert params["ChecksumSHA256"] == CHECKSUM
+    assert upload["url"] == "https://storage.example/presigned"
+    assert upload["headers"] == {"Content-Type": "application/pdf", "x-amz-checksum-sha256": CHECKSUM}
+
+    storage.connection.meta.client.head_object.return_value = {
+        "ContentLength": 1024,
+        "ChecksumSHA256": CHECKSUM,
+    }
+    assert direct_uploads.get_upload(upload["upload_id"]) == dict(
+        name=params["Key"].removeprefix("files/"),
+        filename="my report.pdf",
+        size=1024,
+        sha256=SHA256,
+        content_type="application/pdf",
+    )
+
+
+@pytest.mark.parametrize(
+    "head",
+    [
+        ClientError({"Error": {"Code": "404"}}, "HeadObject"),
+        {"ContentLength": 1000, "ChecksumSHA256": CHECKSUM},
+        {"ContentLength": 1024, "ChecksumSHA256": base64.b64encode(b"\0" * 32).decode()},
+    ],
+)
+def test_get_upload__invalid(storage, presigning_client, head):
+    upload = direct_uploads.create_upload("report.pdf", 1024, SHA256, "application/pdf")
+    if isinstance(head, Exception):
+        storage.connection.meta.client.head_object.side_effect = head
+    else:
+        storage.connection.meta.client.head_object.return_value = head
+    with pytest.raises(ValidationError):
+        direct_uploads.get_upload(upload["upload_id"])
+
+
+@pytest.mark.parametrize(
+    "content,valid",
+    [
+        (b"a" * 1024, True),
+        (b"b" * 1024, False),
+    ],
+)
+def test_get_upload__no_checksum(storage, presigning_client, content, valid):
+    # storages that do not keep the checksum of the upload, the object is hashed instead
+    upload = direct_uploads.create_upload("report.pdf", 1024, hashlib.sha256(b"a" * 1024).hexdigest(), "application/pdf")
+    storage.connection.meta.client.head_object.return_value = {"ContentLength": 1024}
+    storage.open.return_value = ContentFile(content)
+    if valid:
+        assert direct_uploads.get_upload(upload["upload_id"])["size"] == 1024
+    else:
+        with pytest.raises(ValidationError):
+            direct_uploads.get_upload(upload["upload_id"])
+    storage.open.assert_called_once()
+
+
+def test_get_upload__bad_signature(storage):
+    with pytest.raises(ValidationError):
+        direct_uploads.get_upload("not-signed")
+    storage.connection.meta.client.head_object.assert_not_called()
+
+
+def test_move_to_file(storage):
+    file = MagicMock()
+    file._meta.get_field.return_value.generate_filename.return_value = "abc/report.pdf"
+    upload = dict(name="uploads/x/report.pdf", filename="report.pdf")
+    direct_uploads.move_to_file(file, upload)
+    storage.bucket.Object.assert_called_once_with("files/abc/report.pdf")
+    storage.bucket.Object.return_value.copy.assert_called_once_with(
+        {"Bucket": "stixify", "Key": "files/uploads/x/report.pdf"}
+    )
+    storage.delete.assert_called_once_with("uploads/x/report.pdf")
+    assert file.file.name == "abc/report.pdf"
+    file.save.assert_called_once_with(update_fields=["file"])
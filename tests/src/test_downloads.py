@@ -0,0 +1,136 @@
+import asyncio
+from io import BytesIO
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.handlers.asgi import ASGIRequest
+from django.test import RequestFactory
+from storages.backends.s3 import S3Storage
+
+from stixify.web import downloads
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def field_file(tmp_path, settings):
+    settings.FILE_DOWNLOAD_MODE = "stream"
+    storage = FileSystemStorage(location=tmp_path)
+    name = storage.save("identity/report/file.pdf", ContentFile(CONTENT))
+    return SimpleNamespace(storage=storage, name=name)
+
+
+def get(field_file, **headers):
+    request = RequestFactory().get("/", headers=headers)
+    return downloads.serve(request, field_file, "application/pdf")
+
+
+@pytest.mark.parametrize(
+    ["header", "expected"],
+    [
+        (None, None),
+        ("bytes=0-99", (0, 99)),
+        ("bytes=1000-", (1000, 1023)),
+        ("bytes=-24", (1000, 1023)),
+        ("bytes=1000-5000", (1000, 1023)),
+        ("bytes=0-1,5-6", None),
+        ("items=0-1", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert downloads.parse_range(header, 1024) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=10-5", "bytes=-0"])
+def test_parse_range__unsatisfiable(header):
+    with pytest.raises(ValueError):
+        downloads.parse_range(header, 1024)
+
+
+def test_serve(field_file):
+    response = get(field_file)
+    assert response.status_code == 200
+    assert response.streaming
+    assert b"".join(response.streaming_content) == CONTENT
+    assert response["Content-Length"] == str(len(CONTENT))
+    assert response["Accept-Ranges"] == "bytes"
+    assert response["Content-Disposition"] == 'attachment; filename="file.pdf"'
+
+
+def test_serve__asgi(field_file):
+    request = ASGIRequest(
+        dict(type="http", method="GET", path="/", query_string=b"", headers=[]), BytesIO()
+    )
+    with patch.object(downloads, "iter_content", wraps=downloads.iter_content) as iter_content:
+        response = downloads.serve(request, field_file, "application/pdf")
+
+        async def consume():
+            chunks = []
+            async for chunk in response:
+                chunks.append(chunk)
+            return chunks
+
+        with patch.object(downloads, "CHUNK_SIZE", 100):
+            chunks = asyncio.run(consume())
+    # an async iterator, a sync one would be read whole before sending the first chunk
+    assert response.is_async
+    assert iter_content.call_count == 1
+    assert len(chunks) == 11
+    assert b"".join(chunks) == CONTENT
+
+
+def test_serve__range(field_file):
+    response = get(field_file, Range="bytes=10-19")
+    assert response.status_code == 206
+    assert b"".join(response.streaming_content) == CONTENT[10:20]
+    assert response["Content-Range"] == f"bytes 10-19/{len(CONTENT)}"
+    assert response["Content-Length"] == "10"
+
+
+def test_serve__if_range(field_file):
+    etag = get(field_file)["ETag"]
+    assert get(field_file, Range="bytes=10-19", If_Range=etag).status_code == 206
+    assert get(field_file, Range="bytes=10-19", If_Range='"old"').status_code == 200
+
+
+def test_serve__unsatisfiable_range(field_file):
+    response = get(field_file, Range="bytes=5000-")
+    assert response.status_code == 416
+    assert response["Content-Range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_serve__not_modified(field_file):
+    etag = get(field_file)["ETag"]
+    assert get(field_file, If_None_Match=etag).status_code == 304
+    assert get(field_file, If_None_Match='"other"').status_code == 200
+
+
+def test_serve__x_accel(field_file, settings):
+    settings.FILE_DOWNLOAD_MODE = "x-accel"
+    settings.FILE_DOWNLOAD_X_ACCEL_PREFIX = "/protected/"
+    response = get(field_file)
+    assert response["X-Accel-Redirect"] == "/protected/identity/report/file.pdf"
+    assert response.content == b""
+
+
+def test_serve__redirect_needs_s3(field_file, settings):
+    settings.FILE_DOWNLOAD_MODE = "redirect"
+    assert get(field_file).status_code == 200
+
+
+def test_serve__redirect(settings):
+    settings.FILE_DOWNLOAD_MODE = "redirect"
+    storage = MagicMock(spec=S3Storage, bucket_name="stixify")
+    storage._normalize_name.side_effect = lambda name: f"files/{name}"
+    client = MagicMock()
+    client.generate_presigned_url.return_value = "https://storage.example/presigned"
+    with patch.object(downloads, "get_presigning_client", return_value=client):
+        response = get(SimpleNamespace(storage=storage, name="identity/report/file.pdf"))
+    assert response.status_code == 302
+    assert response["Location"] == "https://storage.example/presigned"
+    params = client.generate_presigned_url.call_args.kwargs["Params"]
+    assert params["Key"] == "files/identity/report/file.pdf"
+    assert params["ResponseContentDisposition"] == 'attachment; filename="file.pdf"'
@@ -0,0 +1,98 @@
+import asyncio
+import contextlib
+import json
+from unittest.mock import patch
+
+from stixify.web import events
+
+
+def collect(job_id, get_snapshot):
+    async def run():
+        return [chunk async for chunk in events.stream(job_id, get_snapshot)]
+
+    return asyncio.run(run())
+
+
+def snapshot(state):
+    async def get_snapshot():
+        return dict(event="state", job_id="job-1", state=state, error=None)
+
+    return get_snapshot
+
+
+def fake_subscribe(published):
+    @contextlib.asynccontextmanager
+    async def subscribe(job_id):
+        async def iterator():
+            for event in published:
+                yield event
+
+        yield iterator()
+
+    return subscribe
+
+
+def test_format_event():
+    event = dict(event="stage", job_id="job-1", stage="extract_file", status="started")
+    assert events.format_event(event) == f"event: stage\ndata: {json.dumps(event)}\n\n"
+
+
+def test_publish__not_redis():
+    with patch.object(events, "get_client") as mock_get_client:
+        events.publish_state("job-1", "processing")
+    mock_get_client.assert_not_called()
+
+
+def test_publish__redis(settings):
+    settings.CELERY_BROKER_URL = "redis://localhost:6379/0"
+    with patch.object(events, "get_client") as mock_get_client:
+        events.publish_stage("job-1", "extract_file", "completed", metrics={"wall_time": 1.0})
+    channel, payload = mock_get_client.return_value.publish.call_args[0]
+    assert channel == "stixify:job-events:job-1"
+    assert json.loads(payload) == dict(
+        event="stage",
+        job_id="job-1",
+        stage="extract_file",
+        status="completed",
+        metrics={"wall_time": 1.0},
+    )
+
+
+def test_publish__redis_error(settings):
+    settings.CELERY_BROKER_URL = "redis://localhost:6379/0"
+    with patch.object(events, "get_client") as mock_get_client:
+        mock_get_client.return_value.publish.side_effect = ConnectionError
+        events.publish_state("job-1", "processing")  # does not raise
+
+
+def test_stream__not_redis():
+    with patch.object(events, "subscribe") as mock_subscribe:
+        chunks = collect("job-1", snapshot("processing"))
+    mock_subscribe.assert_not_called()
+    assert chunks == [events.format_event(asyncio.run(snapshot("processing")()))]
+
+
+def test_stream(settings):
+    settings.CELERY_BROKER_URL = "redis://localhost:6379/0"
+    published = [
+        dict(event="stage", job_id="job-1", stage="extract_file", status="started"),
+        None,
+        dict(event="state", job_id="job-1", state="completed", error=None),
+        dict(event="stage", job_id="job-1", stage="never_sent", status="started"),
+    ]
+    with patch.object(events, "subscribe", fake_subscribe(published)):
+        chunks = collect("job-1", snapshot("processing"))
+    assert chunks == [
+        events.format_event(asyncio.run(snapshot("processing")())),
+        events.format_event(published[0]),
+        ": keep-alive\n\n",
+        events.format_event(published[2]),
+    ]
+
+
+def test_stream__already_finished(settings):
+    settings.CELERY_BROKER_URL = "redis://localhost:6379/0"
+    published = [dict(event="stage", job_id="job-1", stage="extract_file", status="started")]
+    with patch.object(events, "subscribe", fake_subscribe(published)):
+        chunks = collect("job-1", snapshot("failed"))
+    assert chunks == [events.format_event(asyncio.run(snapshot("failed")()))]
@@ -1,4 +1,4 @@
-from stixify.web.md_helper import MarkdownImageReplacer
+from stixify.web.md_helper import MarkdownImageReplacer, invalidate_markdown_cache, markdown_cache_keys
 
 
 def test_replaces_images():
@@ -36,3 +36,12 @@ def test_replaces_images():
         ).strip()
         == "![](https://someserver.net/service/example.image.jpg)"
     )
+
+
+def test_markdown_cache_keys():
+    keys = markdown_cache_keys("file-1", "http://testserver/markdown/")
+    assert markdown_cache_keys("file-1", "http://testserver/markdown/") == keys
+    assert markdown_cache_keys("file-1", "http://other/markdown/") != keys
+    assert markdown_cache_keys("file-2", "http://testserver/markdown/") != keys
+    invalidate_markdown_cache("file-1")
+    assert markdown_cache_keys("file-1", "http://testserver/markdown/") != keys
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+from llama_index.core.base.llms.types import CompletionResponse
+from llama_index.core.instrumentation.events.llm import LLMCompletionEndEvent
+from llama_index.core.llms import MockLLM
+
+from stixify.worker import metrics
+
+
+def test_stage_metrics():
+    with metrics.stage_metrics() as stage_metrics:
+        time.sleep(0.01)
+        metrics.record(objects=3)
+        metrics.increment(llm_calls=1)
+        metrics.increment(llm_calls=2)
+    assert stage_metrics["objects"] == 3
+    assert stage_metrics["llm_calls"] == 3
+    assert stage_metrics["wall_time"] >= 0.01
+    assert stage_metrics["cpu_time"] >= 0
+    assert stage_metrics["peak_rss_delta"] >= 0
+
+    metrics.record(objects=5)  # outside of a stage, ignored
+    assert stage_metrics["objects"] == 3
+
+
+def test_stage_metrics__exception():
+    with pytest.raises(ValueError):
+        with metrics.stage_metrics() as stage_metrics:
+            raise ValueError
+    assert "wall_time" in stage_metrics
+
+
+def test_llm_usage_handler():
+    response = CompletionResponse(
+        text="done", raw={"usage": {"prompt_tokens": 120, "completion_tokens": 30}}
+    )
+    handler = metrics.LLMUsageHandler()
+    with metrics.stage_metrics() as stage_metrics:
+        handler.handle(LLMCompletionEndEvent(prompt="extract", response=response))
+        handler.handle(LLMCompletionEndEvent(prompt="extract", response=response))
+    assert stage_metrics["llm_calls"] == 2
+    assert stage_metrics["llm_prompt_tokens"] == 240
+    assert stage_metrics["llm_completion_tokens"] == 60
+
+
+def test_llm_usage_handler__registered():
+    with metrics.stage_metrics() as stage_metrics:
+        MockLLM().complete("say hi")
+    assert stage_metrics["llm_calls"] == 1
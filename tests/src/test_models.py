@@ -1,7 +1,92 @@
+import hashlib
+import io
+from unittest.mock import patch
+
+from django.core.files.storage import default_storage
+
 from stixify.web import models
 
 
 def test_upload_to_func(db, stixify_file):
     image = models.FileImage.objects.create(report=stixify_file)
     assert models.upload_to_func(stixify_file, "ade.pdf") == "identity--c5f27ca2-a580-4fee-9bb9-753e2b563a30/report--dcbeb240-8dd6-4892-8e9e-7b6bda30e454/dcbeb240-8dd6-4892-8e9e-7b6bda30e454_ade.pdf"
-    assert models.upload_to_func(image, "ade.png") == "identity--c5f27ca2-a580-4fee-9bb9-753e2b563a30/report--dcbeb240-8dd6-4892-8e9e-7b6bda30e454/dcbeb240-8dd6-4892-8e9e-7b6bda30e454_ade.png"
\ No newline at end of file
+    assert models.upload_to_func(image, "ade.png") == "identity--c5f27ca2-a580-4fee-9bb9-753e2b563a30/report--dcbeb240-8dd6-4892-8e9e-7b6bda30e454/dcbeb240-8dd6-4892-8e9e-7b6bda30e454_ade.png"
+
+def make_image(name, content):
+    image = io.BytesIO(content)
+    image.name = name
+    return image
+
+
+def test_store_images(db, stixify_file, django_capture_on_commit_callbacks):
+    images = models.FileImage.store_images(
+        stixify_file,
+        [
+            make_image("image_0.png", b"logo"),
+            make_image("image_1.png", b"diagram"),
+            make_image("image_2.png", b"logo"),
+        ],
+    )
+    models.FileImage.create_stored(images)
+    logo_sha256 = hashlib.sha256(b"logo").hexdigest()
+    logo_path = f"images/{logo_sha256[:2]}/{logo_sha256}.png"
+    assert [(image.name, image.file.name) for image in stixify_file.images.order_by("name")] == [
+        ("image_0.png", logo_path),
+        ("image_1.png", models.FileImage.content_path(hashlib.sha256(b"diagram").hexdigest(), "x.png")),
+        ("image_2.png", logo_path),
+    ]
+    assert stixify_file.images.get(name="image_1.png").file.read() == b"diagram"
+
+    # stored once, removed with the last reference
+    with django_capture_on_commit_callbacks(execute=True):
+        stixify_file.images.get(name="image_0.png").delete()
+    assert default_storage.exists(logo_path)
+    with django_capture_on_commit_callbacks(execute=True):
+        stixify_file.images.all().delete()
+    assert not default_storage.exists(logo_path)
+
+
+def test_store_images__already_stored(db, stixify_file, django_capture_on_commit_callbacks):
+    with patch.object(default_storage, "save", wraps=default_storage.save) as mock_save:
+        models.FileImage.create_stored(
+            models.FileImage.store_images(stixify_file, [make_image("a.png", b"shared image")])
+        )
+        assert mock_save.call_count == 1
+        models.FileImage.store_images(stixify_file, [make_image("b.png", b"shared image")])
+        assert mock_save.call_count == 1
+    with django_capture_on_commit_callbacks(execute=True):
+        stixify_file.images.all().delete()
+
+
+def test_create_stored__deleted_meanwhile(db, stixify_file, django_capture_on_commit_callbacks):
+    images = models.FileImage.store_images(stixify_file, [make_image("a.png", b"deleted image")])
+    # the last reference of the image was deleted after `store_images` found it
+    default_storage.delete(images[0].file.name)
+    with patch.object(models, "lock_image", wraps=models.lock_image) as mock_lock_image:
+        models.FileImage.create_stored(images)
+    mock_lock_image.assert_called_once_with(images[0].file.name)
+    assert stixify_file.images.get().file.read() == b"deleted image"
+    with django_capture_on_commit_callbacks(execute=True):
+        stixify_file.images.all().delete()
+
+
+def test_set_txt2stix_data__navigator_layers(db, stixify_file):
+    from txt2stix.txt2stix import Txt2StixData
+
+    layers = [
+        {"domain": "mobile-attack", "name": "Mobile Layer", "techniques": []},
+        {"domain": "enterprise-attack", "name": "Enterprise Layer", "techniques": []},
+    ]
+    stixify_file.set_txt2stix_data(Txt2StixData(navigator_layer=layers, extractions={}))
+    stixify_file.refresh_from_db()
+    assert "navigator_layer" not in stixify_file.txt2stix_data
+    assert {layer.domain: layer.layer for layer in stixify_file.navigator_layers.all()} == {
+        "mobile": layers[0],
+        "enterprise": layers[1],
+    }
+    assert stixify_file.get_txt2stix_data()["navigator_layer"] == [layers[1], layers[0]]
+
+    # reprocessed without navigator layers
+    stixify_file.set_txt2stix_data(Txt2StixData(extractions={}))
+    assert not stixify_file.navigator_layers.exists()
+    assert "navigator_layer" not in stixify_file.get_txt2stix_data()
@@ -1,11 +1,13 @@
 
+import asyncio
 import io
 import os
 import shutil
 import tempfile
+import xmlrpc.client
+from pathlib import Path
 from unittest.mock import MagicMock, patch, call
 import pytest
-from stixify.worker.tasks import job_completed_with_error, new_task, process_post
 from stixify.web import models
 from dogesec_commons.stixifier.stixifier import StixifyProcessor
 
@@ -32,4 +34,166 @@ def test_convert_mhtml_to_pdf():
     mhtml_path = "tests/example_files/sample.mhtml"
     pdf_bytes = pdf_converter.convert_mhtml_to_pdf(mhtml_path)
     assert isinstance(pdf_bytes, bytes)
-    assert pdf_bytes[:4] == b"%PDF"
\ No newline at end of file
+    assert pdf_bytes[:4] == b"%PDF"
+
+@pytest.fixture
+def office_pool():
+    pool = pdf_converter.OfficePool(
+        size=2, command="unoserver", max_conversions=10, timeout=5
+    )
+    with patch("stixify.worker.pdf_converter.get_office_pool", return_value=pool):
+        yield pool
+
+
+def fake_server(alive=True):
+    server = MagicMock()
+    server.alive = alive
+    server.exhausted = False
+    return server
+
+
+def test_convert_with_libreoffice__uses_pool(office_pool):
+    with (
+        patch.object(pdf_converter.OfficePool, "available", True),
+        patch("stixify.worker.pdf_converter.OfficeServer") as mock_server_cls,
+        patch("stixify.worker.pdf_converter.convert_with_libreoffice_subprocess") as mock_subprocess,
+    ):
+        server = mock_server_cls.return_value = fake_server()
+        pdf_converter.convert_with_libreoffice(Path("a.docx"), Path("a.pdf"))
+        pdf_converter.convert_with_libreoffice(Path("b.docx"), Path("b.pdf"))
+        mock_server_cls.assert_called_once_with("unoserver", 10, 5)
+        assert server.convert.call_args_list == [
+            call(Path("a.docx"), Path("a.pdf")),
+            call(Path("b.docx"), Path("b.pdf")),
+        ]
+        mock_subprocess.assert_not_called()
+        assert office_pool.idle.qsize() == 1
+
+
+def test_convert_with_libreoffice__fallback(office_pool):
+    with (
+        patch("stixify.worker.pdf_converter.OfficeServer") as mock_server_cls,
+        patch("stixify.worker.pdf_converter.convert_with_libreoffice_subprocess") as mock_subprocess,
+    ):
+        with patch.object(pdf_converter.OfficePool, "available", False):
+            pdf_converter.convert_with_libreoffice(Path("a.docx"), Path("a.pdf"))
+        mock_server_cls.assert_not_called()
+        mock_subprocess.assert_called_once_with(Path("a.docx"), Path("a.pdf"))
+
+        mock_subprocess.reset_mock()
+        mock_server_cls.side_effect = pdf_converter.OfficePoolUnavailable("no start")
+        with patch.object(pdf_converter.OfficePool, "available", True):
+            pdf_converter.convert_with_libreoffice(Path("a.docx"), Path("a.pdf"))
+        mock_subprocess.assert_called_once_with(Path("a.docx"), Path("a.pdf"))
+        assert office_pool.started == 0
+
+
+def test_office_pool__failed_conversion_discards_server(office_pool):
+    server = fake_server()
+    server.convert.side_effect = TimeoutError
+    with patch("stixify.worker.pdf_converter.OfficeServer", return_value=server):
+        with pytest.raises(TimeoutError):
+            office_pool.convert(Path("a.docx"), Path("a.pdf"))
+    server.close.assert_called_once()
+    assert office_pool.started == 0
+    assert office_pool.idle.empty()
+
+
+def test_office_pool__recycles_exited_server(office_pool):
+    old_server, new_server = fake_server(), fake_server()
+    with patch(
+        "stixify.worker.pdf_converter.OfficeServer",
+        side_effect=[old_server, new_server],
+    ):
+        office_pool.convert(Path("a.docx"), Path("a.pdf"))
+        old_server.alive = False  # e.g --stop-after reached or crashed
+        office_pool.convert(Path("b.docx"), Path("b.pdf"))
+    old_server.close.assert_called_once()
+    new_server.convert.assert_called_once_with(Path("b.docx"), Path("b.pdf"))
+    assert office_pool.started == 1
+
+
+def test_office_pool__retires_exhausted_server(office_pool):
+    old_server, new_server = fake_server(), fake_server()
+
+    def exhaust(*args):
+        old_server.exhausted = True  # still alive while unoserver shuts down after --stop-after
+
+    old_server.convert.side_effect = exhaust
+    with patch(
+        "stixify.worker.pdf_converter.OfficeServer",
+        side_effect=[old_server, new_server],
+    ):
+        office_pool.convert(Path("a.docx"), Path("a.pdf"))
+        old_server.close.assert_called_once()
+        assert office_pool.idle.empty()
+        office_pool.convert(Path("b.docx"), Path("b.pdf"))
+    new_server.convert.assert_called_once_with(Path("b.docx"), Path("b.pdf"))
+    assert office_pool.started == 1
+
+
+def test_office_pool__retries_server_exited_after_release(office_pool):
+    old_server, new_server = fake_server(), fake_server()
+    with patch(
+        "stixify.worker.pdf_converter.OfficeServer",
+        side_effect=[old_server, new_server],
+    ):
+        office_pool.convert(Path("a.docx"), Path("a.pdf"))
+        # exits once back in the pool, its next conversion can not connect
+        old_server.convert.side_effect = ConnectionRefusedError
+        office_pool.convert(Path("b.docx"), Path("b.pdf"))
+    old_server.close.assert_called_once()
+    new_server.convert.assert_called_once_with(Path("b.docx"), Path("b.pdf"))
+    assert office_pool.started == 1
+    assert office_pool.idle.qsize() == 1
+
+
+def test_convert_with_libreoffice__pool_failures_fall_back(office_pool):
+    servers = [fake_server(), fake_server()]
+    for server in servers:
+        server.convert.side_effect = xmlrpc.client.Fault(1, "disposed")
+    with (
+        patch.object(pdf_converter.OfficePool, "available", True),
+        patch("stixify.worker.pdf_converter.OfficeServer", side_effect=servers),
+        patch("stixify.worker.pdf_converter.convert_with_libreoffice_subprocess") as mock_subprocess,
+    ):
+        pdf_converter.convert_with_libreoffice(Path("a.docx"), Path("a.pdf"))
+    for server in servers:
+        server.close.assert_called_once()
+    mock_subprocess.assert_called_once_with(Path("a.docx"), Path("a.pdf"))
+    assert office_pool.started == 0
+
+
+def test_office_pool__bounded(office_pool):
+    office_pool.size = 1
+    office_pool.timeout = 0.1
+    with patch("stixify.worker.pdf_converter.OfficeServer", return_value=fake_server()):
+        server = office_pool.acquire()
+        with pytest.raises(pdf_converter.OfficePoolUnavailable):
+            office_pool.acquire()
+        office_pool.release(server)
+        assert office_pool.acquire() is server
+
+
+def test_browser_pool__timeout():
+    pool = pdf_converter.BrowserPool(max_pages=1, timeout=0.1)
+
+    async def hung_render(input_file):
+        await asyncio.sleep(10)
+
+    with patch.object(pool, "_render", side_effect=hung_render):
+        with pytest.raises(pdf_converter.ConversionError, match="timed out"):
+            pool.render("tests/example_files/sample.mhtml")
+    pool.close()
+
+
+def test_browser_pool__reused():
+    pool = pdf_converter.BrowserPool(max_pages=2, timeout=60)
+    try:
+        first = pool.render("tests/example_files/sample.mhtml")
+        browser = pool.browser
+        second = pool.render("tests/example_files/sample.mhtml")
+        assert first[:4] == second[:4] == b"%PDF"
+        assert pool.browser is browser, "browser should be reused between renders"
+    finally:
+        pool.close()
@@ -0,0 +1,139 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from llama_index.core.base.llms.types import CompletionResponse
+from llama_index.core.instrumentation.events.llm import (
+    LLMCompletionEndEvent,
+    LLMCompletionStartEvent,
+)
+
+from stixify.worker import metrics, ratelimit
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+@pytest.fixture
+def redis_client(settings):
+    settings.CELERY_BROKER_URL = "redis://localhost:6379/0"
+    settings.AI_RATE_LIMITS = {
+        "openai:gpt-5-mini": {"requests_per_minute": 60, "tokens_per_minute": 6000},
+        "openai": {"requests_per_minute": 600},
+    }
+    values = {}
+    client = MagicMock()
+    client.get.side_effect = values.get
+    client.set.side_effect = values.__setitem__
+    bucket = MagicMock(return_value="0")
+    with (
+        patch.object(ratelimit, "get_client", return_value=client),
+        patch.object(ratelimit, "get_token_bucket_script", return_value=bucket),
+        patch.object(ratelimit.time, "sleep") as sleep,
+    ):
+        client.bucket = bucket
+        client.sleep = sleep
+        yield client
+
+
+def test_get_limit(redis_client):
+    limit = ratelimit.get_limit("openai", "gpt-5-mini")
+    assert limit.key == "openai:gpt-5-mini"
+    assert limit.limits == dict(requests=60, tokens=6000)
+    assert ratelimit.get_limit("openai", "gpt-5").key == "openai"
+    assert ratelimit.get_limit("anthropic", "claude") is None
+
+
+def test_get_limit__disabled(settings):
+    settings.CELERY_BROKER_URL = "memory://"
+    settings.AI_RATE_LIMITS = {"openai": {"requests_per_minute": 600}}
+    assert ratelimit.get_limit("openai", "gpt-5-mini") is None
+    assert ratelimit.call("openai", "gpt-5-mini", lambda: "response") == "response"
+
+
+def test_acquire__waits(redis_client):
+    redis_client.bucket.side_effect = ["0.5", "0.25", "0", "0"]
+    limit = ratelimit.get_limit("openai", "gpt-5-mini")
+    with metrics.stage_metrics() as stage_metrics:
+        assert limit.acquire(tokens=100) == 0.75
+    assert [c.args[0] for c in redis_client.sleep.call_args_list] == [0.5, 0.25]
+    assert [c.kwargs["keys"] for c in redis_client.bucket.call_args_list] == [
+        ["stixify:ratelimit:openai:gpt-5-mini:requests"]
+    ] * 3 + [["stixify:ratelimit:openai:gpt-5-mini:tokens"]]
+    capacity, rate, amount, force = redis_client.bucket.call_args.kwargs["args"]
+    assert (capacity, amount, force) == (1000, 100, 0)
+    assert rate == pytest.approx(100 * ratelimit.TARGET_UTILISATION)
+    assert stage_metrics["rate_limit_wait"] == 0.75
+
+
+def test_call__rate_limited(redis_client):
+    fn = MagicMock(side_effect=[RateLimitError(), RateLimitError(), "response"])
+    with metrics.stage_metrics() as stage_metrics:
+        response = ratelimit.call(
+            "openai", "gpt-5-mini", fn, tokens=100, get_tokens=lambda r: 150
+        )
+    assert response == "response"
+    assert fn.call_count == 3
+    assert redis_client.sleep.call_count == 2
+    assert stage_metrics["rate_limited"] == 2
+    # lowered twice, then raised back by a successful call
+    factor = ratelimit.RATE_DECREASE**2 + ratelimit.RATE_INCREASE
+    assert ratelimit.get_limit("openai", "gpt-5-mini").rate_factor() == pytest.approx(factor)
+    # estimated tokens given back on failures, corrected with the actual usage on success
+    forced = [
+        c.kwargs["args"][2]
+        for c in redis_client.bucket.call_args_list
+        if c.kwargs["args"][3] == 1
+    ]
+    assert forced == [-100, -100, 50]
+
+
+def test_call__other_error(redis_client):
+    fn = MagicMock(side_effect=ValueError("bad request"))
+    with pytest.raises(ValueError):
+        ratelimit.call("openai", "gpt-5-mini", fn, tokens=100)
+    assert fn.call_count == 1
+    assert ratelimit.get_limit("openai", "gpt-5-mini").rate_factor() == 1.0
+
+
+def test_call__gives_up(redis_client):
+    fn = MagicMock(side_effect=RateLimitError())
+    with pytest.raises(RateLimitError):
+        ratelimit.call("openai", "gpt-5-mini", fn)
+    assert fn.call_count == ratelimit.MAX_RETRIES + 1
+    assert ratelimit.get_limit("openai", "gpt-5-mini").rate_factor() == pytest.approx(
+        ratelimit.RATE_DECREASE**ratelimit.MAX_RETRIES
+    )
+
+
+@pytest.mark.parametrize(
+    ["class_name", "provider"],
+    [
+        ("openai_llm", "openai"),
+        ("Anthropic_LLM", "anthropic"),
+        ("GenAI", "gemini"),
+        ("OpenRouter_LLM", "openrouter"),
+        ("Some_LLM", "some"),
+    ],
+)
+def test_llm_provider_model(class_name, provider):
+    assert ratelimit.llm_provider_model(class_name, "model") == (provider, "model")
+
+
+def test_llm_rate_limit_handler(redis_client):
+    handler = ratelimit.LLMRateLimitHandler()
+    model_dict = {"class_name": "openai_llm", "model": "gpt-5-mini"}
+    handler.handle(
+        LLMCompletionStartEvent(
+            prompt="x" * 400, additional_kwargs={}, model_dict=model_dict, span_id="span-1"
+        )
+    )
+    assert ratelimit._pending_calls["span-1"][1] == 100
+    response = CompletionResponse(
+        text="done", raw={"usage": {"prompt_tokens": 120, "completion_tokens": 30}}
+    )
+    handler.handle(
+        LLMCompletionEndEvent(prompt="x" * 400, response=response, span_id="span-1")
+    )
+    assert "span-1" not in ratelimit._pending_calls
+    assert redis_client.bucket.call_args.kwargs["args"][2:] == [50, 1]
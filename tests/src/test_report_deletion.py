@@ -0,0 +1,87 @@
+from unittest.mock import MagicMock, call, patch
+
+import pytest
+
+from stixify.worker import report_deletion
+
+REPORT_ID = "report--dcbeb240-8dd6-4892-8e9e-7b6bda30e454"
+
+
+@pytest.fixture
+def db_service():
+    db_service = MagicMock()
+    with patch.object(report_deletion, "get_db_service", return_value=db_service):
+        yield db_service
+
+
+def test_remove_report_objects(db_service):
+    db_service.db.collection.return_value.indexes.return_value = []
+    removed = {
+        report_deletion.VERTEX_COLLECTION: [["indicator--1", "indicator--2"], ["indicator--3"]],
+        report_deletion.EDGE_COLLECTION: [["relationship--1"]],
+    }
+    db_service.execute_raw_query.side_effect = lambda query, bind_vars: removed[bind_vars["@collection"]].pop(0)
+    db_service.update_is_latest_several.side_effect = lambda ids, collection: [f"{collection}/old-{ids[0]}"]
+    progress = MagicMock()
+    with (
+        patch.object(report_deletion, "REMOVE_BATCH_SIZE", 2),
+        patch.object(report_deletion, "IS_LATEST_CHUNK_SIZE", 2),
+    ):
+        counts = report_deletion.remove_report_objects(REPORT_ID, progress=progress)
+    assert counts == dict(removed_objects=4, updated_objects=4)
+
+    bind_vars = db_service.execute_raw_query.call_args_list[0].kwargs["bind_vars"]
+    assert bind_vars == {
+        "@collection": report_deletion.VERTEX_COLLECTION,
+        "index": report_deletion.REPORT_ID_INDEX,
+        "report_id": REPORT_ID,
+        "batch_size": 2,
+    }
+    # a full batch is followed by another one
+    assert db_service.execute_raw_query.call_count == 3
+    assert db_service.update_is_latest_several.call_args_list == [
+        call(["indicator--1", "indicator--2"], report_deletion.VERTEX_COLLECTION),
+        call(["indicator--3"], report_deletion.VERTEX_COLLECTION),
+        call(["relationship--1"], report_deletion.EDGE_COLLECTION),
+    ]
+    assert db_service.deprecate_relationships.call_count == 2
+    db_service.deprecate_relationships.assert_any_call(
+        [
+            f"{report_deletion.VERTEX_COLLECTION}/old-indicator--1",
+            f"{report_deletion.VERTEX_COLLECTION}/old-indicator--3",
+        ],
+        report_deletion.EDGE_COLLECTION,
+    )
+    assert progress.call_args == call(removed_objects=4, updated_objects=4)
+
+
+def test_remove_report_objects__nothing_to_remove(db_service):
+    db_service.execute_raw_query.return_value = []
+    counts = report_deletion.remove_report_objects(REPORT_ID)
+    assert counts == dict(removed_objects=0, updated_objects=0)
+    db_service.update_is_latest_several.assert_not_called()
+    db_service.deprecate_relationships.assert_not_called()
+
+
+def test_ensure_report_id_index():
+    db = MagicMock()
+    db.collection.return_value.indexes.return_value = [
+        dict(type="primary", name="primary", fields=["_key"]),
+        dict(type="persistent", name="stixify_created_by_ref", fields=["created_by_ref"], sparse=True),
+    ]
+    assert report_deletion.ensure_report_id_index(db, report_deletion.VERTEX_COLLECTION) == report_deletion.REPORT_ID_INDEX
+    db.collection.assert_called_once_with(report_deletion.VERTEX_COLLECTION)
+    db.collection.return_value.add_persistent_index.assert_called_once_with(
+        fields=["_stixify_report_id"], sparse=True, name=report_deletion.REPORT_ID_INDEX, in_background=True
+    )
+
+
+def test_ensure_report_id_index__other_name(db_service):
+    # an equivalent index created under another name is the one hinted
+    db_service.db.collection.return_value.indexes.return_value = [
+        dict(type="persistent", name="idx_1234", fields=["_stixify_report_id"], sparse=True),
+    ]
+    db_service.execute_raw_query.return_value = []
+    report_deletion.remove_report_objects(REPORT_ID)
+    db_service.db.collection.return_value.add_persistent_index.assert_not_called()
+    assert {c.kwargs["bind_vars"]["index"] for c in db_service.execute_raw_query.call_args_list} == {"idx_1234"}
@@ -0,0 +1,79 @@
+import io
+
+import pytest
+from django.core.files.storage import FileSystemStorage
+
+from stixify.worker.storage import JobStorage
+
+
+@pytest.fixture
+def job_storage(tmp_path):
+    return JobStorage(
+        "164716d9-85af-4a81-8f71-9168db3fadf0",
+        storage=FileSystemStorage(location=tmp_path),
+    )
+
+
+def test_path(job_storage):
+    assert (
+        job_storage.path("markdown.md")
+        == "jobs/164716d9-85af-4a81-8f71-9168db3fadf0/markdown.md"
+    )
+
+
+def test_write_read(job_storage):
+    job_storage.write_text(JobStorage.MARKDOWN, "some markdown")
+    assert job_storage.exists(JobStorage.MARKDOWN)
+    assert job_storage.read_text(JobStorage.MARKDOWN) == "some markdown"
+
+    # overwrite must not create a new file with random suffix
+    job_storage.write_text(JobStorage.MARKDOWN, "new markdown")
+    assert job_storage.read_text(JobStorage.MARKDOWN) == "new markdown"
+
+    job_storage.write_json(JobStorage.TXT2STIX_DATA, {"a": [1, 2]})
+    assert job_storage.read_json(JobStorage.TXT2STIX_DATA) == {"a": [1, 2]}
+
+
+def test_images(job_storage):
+    assert job_storage.read_images() == []
+    images = []
+    for name in ["image_1.png", "image_0.png"]:
+        image = io.BytesIO(name.encode())
+        image.name = name
+        images.append(image)
+    job_storage.write_images(images)
+    stored_images = job_storage.read_images()
+    assert [image.name for image in stored_images] == ["image_0.png", "image_1.png"]
+    assert [image.read() for image in stored_images] == [b"image_0.png", b"image_1.png"]
+
+
+def test_clear(job_storage):
+    job_storage.clear()  # should not fail on missing job directory
+    job_storage.write_text(JobStorage.MARKDOWN, "some markdown")
+    image = io.BytesIO(b"image")
+    image.name = "image.png"
+    job_storage.write_images([image])
+    job_storage.clear()
+    assert not job_storage.exists(JobStorage.MARKDOWN)
+    assert job_storage.read_images() == []
+
+
+def test_checkpoints(job_storage):
+    assert job_storage.completed_stages() == []
+    assert not job_storage.is_completed("convert_file")
+    job_storage.mark_completed("extract_file")
+    job_storage.mark_completed("convert_file")
+    job_storage.mark_completed("convert_file")
+    assert job_storage.is_completed("convert_file")
+    assert job_storage.completed_stages() == ["convert_file", "extract_file"]
+    job_storage.clear()
+    assert job_storage.completed_stages() == []
+
+
+def test_chunk(job_storage):
+    chunk = job_storage.chunk(1)
+    assert chunk.path("markdown.md") == "jobs/164716d9-85af-4a81-8f71-9168db3fadf0/chunks/1/markdown.md"
+    chunk.write_text(JobStorage.MARKDOWN, "chunk markdown")
+    assert not job_storage.exists(JobStorage.MARKDOWN)
+    job_storage.clear()
+    assert not chunk.exists(JobStorage.MARKDOWN)
@@ -1,15 +1,40 @@
+import contextlib
+from datetime import timedelta
 import io
 from pathlib import Path
 from unittest.mock import MagicMock, patch, call
 import uuid
 import pytest
-from stixify.worker.tasks import job_completed_with_error, new_task, process_post
+from stixify.worker.tasks import (
+    archive_pdf,
+    convert_file,
+    create_bulk_reprocessing_job,
+    create_deletion_job,
+    delete_report,
+    dispatch_bulk_reprocess,
+    dispatch_bulk_reprocess_jobs,
+    dispatch_waiting_jobs,
+    embed_file,
+    extract_file,
+    clear_expired_checkpoints,
+    job_completed_with_error,
+    job_pipeline,
+    new_batch_task,
+    new_task,
+    render_mhtml_pdf,
+)
+from stixify.worker.storage import JobStorage
 from stixify.web import models
 from dogesec_commons.stixifier.stixifier import StixifyProcessor
 from dogesec_commons.stixifier.models import Profile
 from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
 from txt2stix.txt2stix import Txt2StixData
+from file2txt.parsers.core import BaseParser
+from pypdf import PdfReader, PdfWriter
 
+from django.conf import settings
+from stixify.worker.celery import JOB_PRIORITIES
 from stixify.worker import tasks
 
 
@@ -18,45 +43,176 @@ def always_eager(celery_eager):
     yield
 
 
+@pytest.fixture(autouse=True)
+def clear_job_storage():
+    yield
+    # checkpoints of the `stixify_job` fixture would skip the stages of the next tests
+    JobStorage("164716d9-85af-4a81-8f71-9168db3fadf0").clear()
+
+
+PIPELINE_STAGES = [
+    "render_mhtml_pdf",
+    "convert_file",
+    "extract_file",
+    "upload_file",
+    "embed_file",
+    "archive_pdf",
+    "job_completed_with_error",
+]
+
+
 @pytest.mark.django_db
 def test_new_task(stixify_job):
-    with (
-        patch("stixify.worker.tasks.process_post.run") as mock_process_post,
-        patch(
-            "stixify.worker.tasks.job_completed_with_error.run"
-        ) as mock_job_completed_with_error,
-    ):
+    mocks = {}
+    with contextlib.ExitStack() as stack:
+        for stage in PIPELINE_STAGES:
+            mocks[stage] = stack.enter_context(
+                patch(f"stixify.worker.tasks.{stage}.run")
+            )
         new_task(stixify_job)
-        mock_process_post.assert_called_once_with(stixify_job.id)
-        mock_job_completed_with_error.assert_called_once_with(stixify_job.id)
+    for stage in PIPELINE_STAGES:
+        mocks[stage].assert_called_once_with(stixify_job.id)
+
+
+def test_job_pipeline__archive_pdf_concurrent():
+    job = models.Job(id=uuid.uuid4())
+    render, join = job_pipeline(job).tasks
+    assert render.task == "stixify.worker.tasks.render_mhtml_pdf"
+    archive, extraction = join.tasks
+    assert archive.task == "stixify.worker.tasks.archive_pdf"
+    assert [task.task.rsplit(".", 1)[-1] for task in extraction.tasks] == [
+        "convert_file",
+        "extract_file",
+        "upload_file",
+        "embed_file",
+    ]
+    assert join.body.task == "stixify.worker.tasks.job_completed_with_error"
 
 
 @pytest.mark.django_db
-def test_process_post_job__fails(stixify_job):
+def test_new_batch_task(stixify_job):
+    other_job = models.Job.objects.create(file=stixify_job.file)
+    mocks = {}
+    with contextlib.ExitStack() as stack:
+        for stage in PIPELINE_STAGES:
+            mocks[stage] = stack.enter_context(
+                patch(f"stixify.worker.tasks.{stage}.run")
+            )
+        new_batch_task([stixify_job, other_job])
+    for stage in PIPELINE_STAGES:
+        mocks[stage].assert_has_calls(
+            [call(stixify_job.id), call(other_job.id)], any_order=True
+        )
+        assert mocks[stage].call_count == 2
+
+
+@pytest.mark.django_db
+def test_new_batch_task__priorities(stixify_job):
+    bulk_job = models.Job.objects.create(file=stixify_job.file, priority=models.JobPriority.BULK)
+    with patch("stixify.worker.tasks.group") as mock_group:
+        new_batch_task([stixify_job, bulk_job])
+    pipelines = list(mock_group.call_args[0][0])
+    assert [pipeline.options["priority"] for pipeline in pipelines] == [
+        JOB_PRIORITIES[models.JobPriority.INTERACTIVE],
+        JOB_PRIORITIES[models.JobPriority.BULK],
+    ]
+    assert "priority" not in mock_group.return_value.apply_async.call_args.kwargs
+
+
+def test_pipeline_routes():
+    from stixify.worker.celery import app
+
+    routes = app.conf.task_routes
+    assert routes["stixify.worker.tasks.render_mhtml_pdf"] == {"queue": "render"}
+    assert routes["stixify.worker.tasks.convert_file"] == {"queue": "convert"}
+    assert routes["stixify.worker.tasks.extract_file"] == {"queue": "extract"}
+    assert routes["stixify.worker.tasks.upload_file"] == {"queue": "upload"}
+    assert routes["stixify.worker.tasks.delete_report"] == {"queue": "upload"}
+    assert routes["stixify.worker.tasks.embed_file"] == {"queue": "embed"}
+    assert routes["stixify.worker.tasks.archive_pdf"] == {"queue": "archive_pdf"}
+
+
+def test_pipeline_stage__time_limit():
+    from stixify.worker.celery import app
+
+    # an unacknowledged stage is only redelivered once it can not be running anymore
+    assert tasks.extract_file.soft_time_limit == settings.PIPELINE_STAGE_TIME_LIMIT
+    assert tasks.extract_file.time_limit > tasks.extract_file.soft_time_limit
+    assert app.conf.broker_transport_options["visibility_timeout"] > tasks.extract_file.time_limit
+
+
+@pytest.mark.django_db
+def test_pipeline_stage__fails(stixify_job):
     with (
         patch(
             "stixify.worker.tasks.StixifyProcessor", side_effect=ValueError
         ) as mock_stixify_processor_cls,
     ):
-        process_post.si(stixify_job.id).delay()
+        convert_file.si(stixify_job.id).delay()
         stixify_job.refresh_from_db()
         assert stixify_job.error == "failed to process report"
 
+        stixify_job.error = None
+        stixify_job.save()
         mock_stixify_processor_cls.side_effect = ValueError("some error")
-        process_post.si(stixify_job.id).delay()
+        convert_file.si(stixify_job.id).delay()
         stixify_job.refresh_from_db()
         assert stixify_job.error == "failed to process report: some error"
 
 
+@pytest.mark.django_db
+def test_save_stage_metrics(stixify_job):
+    stixify_job.extra = {"skip_extraction": True}
+    stixify_job.save()
+    tasks.save_stage_metrics(stixify_job.id, "convert_file", {"wall_time": 1.5})
+    tasks.save_stage_metrics(stixify_job.id, "archive_pdf", {"wall_time": 2.5})
+    stixify_job.refresh_from_db()
+    assert stixify_job.extra == {
+        "skip_extraction": True,
+        "metrics": {
+            "convert_file": {"wall_time": 1.5},
+            "archive_pdf": {"wall_time": 2.5},
+        },
+    }
+
+
+@pytest.mark.django_db
+def test_pipeline_stage__skipped_after_failure(stixify_job):
+    stixify_job.error = "failed to process report: earlier stage"
+    stixify_job.save()
+    with patch("stixify.worker.tasks.StixifyProcessor") as mock_stixify_processor_cls:
+        assert extract_file.si(stixify_job.id).delay().get() == stixify_job.id
+        mock_stixify_processor_cls.assert_not_called()
+    stixify_job.refresh_from_db()
+    assert stixify_job.error == "failed to process report: earlier stage"
+
+
+@pytest.mark.django_db
+def test_pipeline_stage__publishes_events(stixify_job):
+    with (
+        patch("stixify.worker.tasks.StixifyProcessor", side_effect=ValueError("some error")),
+        patch("stixify.worker.tasks.events") as mock_events,
+    ):
+        convert_file.si(stixify_job.id).delay()
+    mock_events.publish_state.assert_called_once_with(stixify_job.id, models.JobState.PROCESSING)
+    assert [c.args for c in mock_events.publish_stage.call_args_list] == [
+        (stixify_job.id, "convert_file", "started"),
+        (stixify_job.id, "convert_file", "failed"),
+    ]
+    assert "wall_time" in mock_events.publish_stage.call_args.kwargs["metrics"]
+
+
 @pytest.fixture
 def fake_stixifier_processor(tmpdir):
     mocked_processor = MagicMock()
     mocked_processor.summary = "Summarized post"
-    mocked_processor.md_file.open.return_value = io.BytesIO(b"Generated MD File")
+    mocked_processor.output_md = "Generated MD File"
+    mocked_processor.bundle = '{"type": "bundle"}'
     mocked_processor.incident = None
     mocked_processor.txt2stix_data = Txt2StixData.model_validate(fake_txt2stix_data())
     mocked_processor.md_images = []
-    mocked_processor.tmpdir = MagicMock()
+    mocked_processor.tmpdir = Path(tmpdir)
+    mocked_processor.report_id = "report-id"
     mocked_processor.filename = "test.md"
     return mocked_processor
 
@@ -71,42 +227,143 @@ def stixify_reprocess_job(stixify_job):
 
 
 @pytest.mark.django_db
-def test_process_post_job(stixify_job, fake_stixifier_processor):
+def test_new_task__import_file(stixify_job, fake_stixifier_processor):
     file = stixify_job.file
+    image = io.BytesIO(b"image content")
+    image.name = "image_0.png"
+    fake_stixifier_processor.md_images = [image]
 
     with (
         patch("stixify.worker.tasks.StixifyProcessor") as mock_stixify_processor_cls,
         patch("stixify.worker.pdf_converter.make_conversion") as mock_convert_pdf,
         patch.object(models.File, "create_embedding") as mock_create_embedding,
     ):
+        mock_convert_pdf.side_effect = lambda input_path, output_path: output_path.write_bytes(b"PDF content")
         mock_stixify_processor_cls.return_value = fake_stixifier_processor
-        process_post.si(stixify_job.id).delay()
+        new_task(stixify_job)
         stixify_job.refresh_from_db()
         file.refresh_from_db()
+        assert stixify_job.error == None, stixify_job.error
+        assert stixify_job.state == models.JobState.COMPLETED
         mock_convert_pdf.assert_called_once()
-        mock_stixify_processor_cls.assert_called_once()
-        mock_stixify_processor_cls.return_value.setup.assert_called_once()
-        assert mock_stixify_processor_cls.return_value.setup.call_args[1][
+        fake_stixifier_processor.file2txt.assert_called_once()
+        fake_stixifier_processor.txt2stix.assert_called_once_with(None)
+        fake_stixifier_processor.upload_to_arango.assert_called_once()
+        fake_stixifier_processor.process.assert_not_called()
+        assert fake_stixifier_processor.setup.call_args[1][
             "extra"
         ] == dict(_stixify_file_id=str(file.id))
+        assert fake_stixifier_processor.extra_data.__setitem__.call_args == call("_stixify_report_id", file.report_id)
         assert file.txt2stix_data["content_check"]["threat_score"] == 8
         assert file.ai_describes_incident == True
         assert file.markdown_file.read() == b"Generated MD File"
-        process_stream: io.BytesIO = mock_stixify_processor_cls.call_args[0][0]
-        process_stream.seek(0)
-        assert process_stream.read() == file.file.read()
-        mock_stixify_processor_cls.assert_called_once_with(
-            process_stream,
-            stixify_job.profile,
-            job_id=stixify_job.id,
-            file2txt_mode=file.mode,
-            report_id=file.id,
-        )
+        assert file.pdf_file.read() == b"PDF content"
+        assert [img.name for img in file.images.all()] == ["image_0.png"]
+        assert file.images.first().file.read() == b"image content"
+        for process_call in mock_stixify_processor_cls.call_args_list:
+            process_stream: io.BytesIO = process_call[0][0]
+            process_stream.seek(0)
+            assert process_stream.read() == file.file.read()
+            file.file.seek(0)
+            assert process_call == call(
+                process_stream,
+                stixify_job.profile,
+                job_id=stixify_job.id,
+                file2txt_mode=file.mode,
+                report_id=file.id,
+            )
         mock_create_embedding.assert_called_once_with(include_non_incident=False)
+        storage = JobStorage(stixify_job.id)
+        assert not storage.exists(JobStorage.MARKDOWN), "intermediate state should be removed once job completes"
+        stage_metrics = stixify_job.extra["metrics"]
+        assert set(stage_metrics) == set(tasks.PIPELINE_STAGES)
+        for stage in tasks.PIPELINE_STAGES:
+            assert {"wall_time", "cpu_time", "peak_rss_delta"}.issubset(stage_metrics[stage])
+        assert stage_metrics["convert_file"]["markdown_length"] == len("Generated MD File")
+        assert stage_metrics["convert_file"]["images"] == 1
+        assert stage_metrics["extract_file"]["bundle_objects"] == 0
+
+
+@pytest.mark.django_db
+def test_convert_file(stixify_job, fake_stixifier_processor):
+    image = io.BytesIO(b"image content")
+    image.name = "image_0.png"
+    fake_stixifier_processor.md_images = [image]
+    with patch("stixify.worker.tasks.StixifyProcessor") as mock_stixify_processor_cls:
+        mock_stixify_processor_cls.return_value = fake_stixifier_processor
+        convert_file.si(stixify_job.id).delay()
+    stixify_job.refresh_from_db()
+    assert stixify_job.state == models.JobState.PROCESSING
+    storage = JobStorage(stixify_job.id)
+    assert storage.read_text(JobStorage.MARKDOWN) == "Generated MD File"
+    images = storage.read_images()
+    assert [img.name for img in images] == ["image_0.png"]
+    assert images[0].read() == b"image content"
+    storage.clear()
+
+
+@pytest.mark.django_db
+def test_convert_file__large_document(stixify_job, settings):
+    settings.LARGE_DOCUMENT_PAGE_THRESHOLD = 4
+    settings.LARGE_DOCUMENT_CHUNK_PAGES = 2
+    writer = PdfWriter()
+    for i in range(5):
+        writer.add_blank_page(width=100 + i, height=100)
+    pdf = io.BytesIO()
+    writer.write(pdf)
+    file = stixify_job.file
+    file.mode = "pdf"
+    file.file.save("file.pdf", ContentFile(pdf.getvalue()))
+
+    def make_fake_processor(input_file, *args, **kwargs):
+        # "converts" every page to its number, found from its width
+        processor = MagicMock()
+        pages = PdfReader(input_file).pages
+        processor.output_md = BaseParser.join_pages(
+            [f"page {int(page.mediabox.width) - 100}" for page in pages]
+        )
+        processor.md_images = []
+        return processor
+
+    with patch("stixify.worker.tasks.StixifyProcessor", side_effect=make_fake_processor) as mock_stixify_processor_cls:
+        convert_file.si(stixify_job.id).delay()
+    stixify_job.refresh_from_db()
+    assert stixify_job.error == None, stixify_job.error
+    assert mock_stixify_processor_cls.call_count == 3
+    storage = JobStorage(stixify_job.id)
+    assert storage.read_text(JobStorage.MARKDOWN) == BaseParser.join_pages(
+        [f"page {i}" for i in range(5)]
+    )
+    assert storage.completed_stages() == [
+        "convert_file",
+        "convert_file_chunk.0",
+        "convert_file_chunk.1",
+        "convert_file_chunk.2",
+        "merge_file_chunks",
+    ]
+    assert stixify_job.extra["metrics"]["convert_file"]["chunks"] == 3
+    assert stixify_job.extra["metrics"]["convert_file"]["pages"] == 5
 
 
 @pytest.mark.django_db
-def test_process_post_mhtml_pdf_mode(stixify_job, fake_stixifier_processor):
+def test_extract_file(stixify_job, fake_stixifier_processor):
+    storage = JobStorage(stixify_job.id)
+    storage.write_text(JobStorage.MARKDOWN, "Stored MD File")
+    with patch("stixify.worker.tasks.StixifyProcessor") as mock_stixify_processor_cls:
+        mock_stixify_processor_cls.return_value = fake_stixifier_processor
+        extract_file.si(stixify_job.id).delay()
+    stixify_job.refresh_from_db()
+    assert stixify_job.error == None, stixify_job.error
+    assert fake_stixifier_processor.output_md == "Stored MD File"
+    fake_stixifier_processor.file2txt.assert_not_called()
+    fake_stixifier_processor.write_bundle.assert_called_once_with(fake_stixifier_processor.bundler)
+    assert storage.read_text(JobStorage.BUNDLE) == '{"type": "bundle"}'
+    assert storage.read_json(JobStorage.TXT2STIX_DATA)["content_check"]["threat_score"] == 8
+    storage.clear()
+
+
+@pytest.mark.django_db
+def test_convert_file_mhtml_pdf_mode(stixify_job, fake_stixifier_processor):
     stixify_job.refresh_from_db()
     file = stixify_job.file
     file.mode = "mhtml-pdf"
@@ -117,7 +374,7 @@ def test_process_post_mhtml_pdf_mode(stixify_job, fake_stixifier_processor):
         patch("stixify.worker.pdf_converter.convert_mhtml_to_pdf") as mock_convert_pdf,
     ):
         mock_stixify_processor_cls.return_value = fake_stixifier_processor
-        process_post.si(stixify_job.id).delay()
+        convert_file.si(stixify_job.id).delay()
         process_stream: io.BytesIO = mock_stixify_processor_cls.call_args[0][0]
         process_stream.seek(0)
         mock_stixify_processor_cls.assert_called_once_with(
@@ -128,6 +385,39 @@ def test_process_post_mhtml_pdf_mode(stixify_job, fake_stixifier_processor):
             report_id=file.id,
         )
         assert process_stream.read() == b"PDF content"
+    JobStorage(stixify_job.id).clear()
+
+
+@pytest.mark.django_db
+def test_render_mhtml_pdf(stixify_job):
+    file = stixify_job.file
+    file.mode = "mhtml-pdf"
+    file.save()
+    with patch(
+        "stixify.worker.pdf_converter.convert_mhtml_to_pdf", return_value=b"PDF content"
+    ) as mock_convert_pdf:
+        render_mhtml_pdf.si(stixify_job.id).delay()
+        mock_convert_pdf.assert_called_once()
+        assert mock_convert_pdf.call_args[0][0].read_bytes() == b"File Content"
+    stixify_job.refresh_from_db()
+    file.refresh_from_db()
+    assert stixify_job.state == models.JobState.PROCESSING
+    assert file.pdf_file.name.endswith(f"{file.id}_file.pdf")
+    assert file.pdf_file.read() == b"PDF content"
+    assert file.process_file.read() == b"PDF content"
+
+    with patch("stixify.worker.pdf_converter.convert_mhtml_to_pdf") as mock_convert_pdf:
+        render_mhtml_pdf.si(stixify_job.id).delay()
+        mock_convert_pdf.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_render_mhtml_pdf__other_modes(stixify_job):
+    with patch("stixify.worker.pdf_converter.convert_mhtml_to_pdf") as mock_convert_pdf:
+        render_mhtml_pdf.si(stixify_job.id).delay()
+        mock_convert_pdf.assert_not_called()
+    stixify_job.file.refresh_from_db()
+    assert not stixify_job.file.pdf_file
 
 
 @pytest.mark.django_db
@@ -150,6 +440,7 @@ def test_process_post_reprocess_skip_extraction_no_existing_data(
         assert (
             stixify_reprocess_job.file.markdown_file.read() == b"test content"
         ), "File should not be removed if reprocess fails"
+        fake_stixifier_processor.upload_to_arango.assert_not_called()
 
 
 def fake_txt2stix_data():
@@ -184,13 +475,48 @@ def test_process_post_reprocess_skip_extraction_uses_existing_data(
         mock_stixify_processor_cls.return_value = fake_stixifier_processor
         new_task(stixify_reprocess_job)
         fake_stixifier_processor.process.assert_not_called()
+        fake_stixifier_processor.file2txt.assert_not_called()
         fake_stixifier_processor.txt2stix.assert_called_once()
+        assert fake_stixifier_processor.output_md == "test content"
         fake_stixifier_processor.write_bundle.assert_called_once()
         fake_stixifier_processor.upload_to_arango.assert_called_once()
         mock_convert_pdf.assert_not_called()
         mock_create_embedding.assert_called_once()
 
 
+@pytest.mark.django_db
+def test_new_task__import_duplicate(stixify_job, fake_stixifier_processor):
+    file = stixify_job.file
+    file.txt2stix_data = Txt2StixData().model_dump(mode="json")
+    file.markdown_file.save("markdown.md", io.BytesIO(b"cloned markdown"), save=False)
+    file.pdf_file.save("cloned.pdf", io.BytesIO(b"%PDF"), save=False)
+    file.save()
+    models.FileImage.objects.create(
+        report=file, file=ContentFile(b"image", name="image.png"), name="image.png"
+    )
+    stixify_job.extra = {"skip_extraction": True, "duplicate_of": str(uuid.uuid4())}
+    stixify_job.save(update_fields=["extra"])
+
+    with (
+        patch("stixify.worker.tasks.StixifyProcessor") as mock_stixify_processor_cls,
+        patch("stixify.worker.pdf_converter.make_conversion") as mock_convert_pdf,
+        patch.object(models.File, "create_embedding"),
+    ):
+        mock_stixify_processor_cls.return_value = fake_stixifier_processor
+        new_task(stixify_job)
+        stixify_job.refresh_from_db()
+        assert stixify_job.error is None, stixify_job.error
+        fake_stixifier_processor.file2txt.assert_not_called()
+        fake_stixifier_processor.txt2stix.assert_called_once()
+        assert isinstance(fake_stixifier_processor.txt2stix.call_args[0][0], Txt2StixData)
+        fake_stixifier_processor.upload_to_arango.assert_called_once()
+        mock_convert_pdf.assert_not_called()
+
+    file.refresh_from_db()
+    assert file.markdown_file.read() == b"cloned markdown"
+    assert [image.name for image in file.images.all()] == ["image.png"]
+
+
 @pytest.mark.django_db
 def test_process_post_reprocess_with_profile_switch(
     stixify_reprocess_job, fake_stixifier_processor, stixifier_profile
@@ -217,19 +543,72 @@ def test_process_post_reprocess_with_profile_switch(
         patch.object(models.File, "create_embedding") as mock_create_embedding,
     ):
         mock_stixify_processor_cls.return_value = fake_stixifier_processor
-        process_post.si(stixify_reprocess_job.id).delay()
+        new_task(stixify_reprocess_job)
         stixify_reprocess_job.file.refresh_from_db()
-        fake_stixifier_processor.process.assert_called_once()
+        fake_stixifier_processor.file2txt.assert_called_once()
+        fake_stixifier_processor.txt2stix.assert_called_once_with(None)
         assert str(stixify_reprocess_job.file.profile_id) == str(new_profile.pk)
+        for processor_call in mock_stixify_processor_cls.call_args_list:
+            assert processor_call[0][1] == new_profile
         mock_create_embedding.assert_called_once()
 
 
 @pytest.mark.django_db
-def test_process_post_with_incident(stixify_job, fake_stixifier_processor, tmpdir):
-    fake_stixifier_processor.txt2stix_data.content_check.describes_incident = True
-    fake_stixifier_processor.tmpdir = Path(tmpdir)
+def test_process_post_reprocess_skip_conversion(
+    stixify_reprocess_job, fake_stixifier_processor, stixifier_profile
+):
+    file = stixify_reprocess_job.file
+    file.markdown_file.save("markdown.md", io.BytesIO(b"stored markdown"))
+    new_profile = Profile.objects.create(
+        name="new-test-profile",
+        extractions=stixifier_profile.extractions,
+        relationship_mode=stixifier_profile.relationship_mode,
+    )
+    stixify_reprocess_job.extra = {
+        "skip_extraction": False,
+        "skip_conversion": True,
+        "profile_id": str(new_profile.pk),
+    }
+    stixify_reprocess_job.save(update_fields=["extra"])
+
+    with (
+        patch("stixify.worker.tasks.StixifyProcessor") as mock_stixify_processor_cls,
+        patch.object(models.File, "create_embedding"),
+    ):
+        mock_stixify_processor_cls.return_value = fake_stixifier_processor
+        new_task(stixify_reprocess_job)
+        stixify_reprocess_job.refresh_from_db()
+        assert stixify_reprocess_job.error is None, stixify_reprocess_job.error
+        fake_stixifier_processor.file2txt.assert_not_called()
+        fake_stixifier_processor.txt2stix.assert_called_once_with(None)
+        assert fake_stixifier_processor.output_md == "stored markdown"
+        fake_stixifier_processor.upload_to_arango.assert_called_once()
+        for processor_call in mock_stixify_processor_cls.call_args_list:
+            assert processor_call[0][1] == new_profile
+    file.refresh_from_db()
+    assert file.profile == new_profile
+    assert file.markdown_file.read() == b"stored markdown"
 
 
+@pytest.mark.django_db
+def test_process_post_reprocess_skip_conversion_no_markdown(
+    stixify_reprocess_job, fake_stixifier_processor
+):
+    stixify_reprocess_job.extra = {"skip_extraction": False, "skip_conversion": True}
+    stixify_reprocess_job.save(update_fields=["extra"])
+    with patch("stixify.worker.tasks.StixifyProcessor") as mock_stixify_processor_cls:
+        mock_stixify_processor_cls.return_value = fake_stixifier_processor
+        new_task(stixify_reprocess_job)
+    stixify_reprocess_job.refresh_from_db()
+    assert stixify_reprocess_job.state == models.JobState.FAILED
+    assert "no existing markdown" in stixify_reprocess_job.error
+    fake_stixifier_processor.txt2stix.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_process_post_with_incident(stixify_job, fake_stixifier_processor):
+    fake_stixifier_processor.txt2stix_data.content_check.describes_incident = True
+
     with (
         patch("stixify.worker.tasks.StixifyProcessor") as mock_stixify_processor_cls,
         patch.object(models.File, "create_embedding") as mock_create_embedding,
@@ -240,7 +619,10 @@ def test_process_post_with_incident(stixify_job, fake_stixifier_processor, tmpdi
         mock_stixify_processor_cls.return_value = fake_stixifier_processor
         new_task(stixify_job)
         mock_create_embedding.assert_called_once_with(include_non_incident=False)
-        mock_convert_pdf.assert_called_once_with("test.md", fake_stixifier_processor.tmpdir/"converted_pdf.pdf")
+        mock_convert_pdf.assert_called_once()
+        input_path, output_path = mock_convert_pdf.call_args[0]
+        assert input_path.name.endswith("file.md")
+        assert output_path.name == "converted_pdf.pdf"
         file = models.File.objects.get(pk=stixify_job.file_id)
         assert file.ai_describes_incident is True
         assert file.ai_incident_summary == "some explanation"
@@ -255,26 +637,44 @@ def test_process_post_with_incident(stixify_job, fake_stixifier_processor, tmpdi
     ],
 )
 @pytest.mark.django_db
-def test_process_post__creates_embedding(
-    stixify_job, fake_stixifier_processor, settings_value, settings
+def test_embed_file(
+    stixify_job, settings_value, settings
 ):
     settings.CREATE_EMBEDDING_INCLUDE_NON_INCIDENT = settings_value
     with (
-        patch("stixify.worker.tasks.StixifyProcessor") as mock_stixify_processor_cls,
         patch.object(models.File, "create_embedding") as mock_create_embedding,
-        patch("stixify.worker.pdf_converter.make_conversion") as mock_convert_pdf,
     ):
-        mock_stixify_processor_cls.return_value = fake_stixifier_processor
-        process_post.si(stixify_job.id).delay()
+        embed_file.si(stixify_job.id).delay()
 
         mock_create_embedding.assert_called_once_with(
             include_non_incident=settings_value
         )
 
 
+@pytest.mark.django_db
+def test_archive_pdf__keeps_concurrent_updates(stixify_job):
+    def make_conversion(input_path, output_path):
+        # the extraction branch saves the file while the pdf is being converted
+        models.File.objects.filter(pk=stixify_job.file_id).update(txt2stix_data={"data": "here"})
+        output_path.write_bytes(b"PDF content")
+
+    with patch("stixify.worker.pdf_converter.make_conversion", side_effect=make_conversion):
+        archive_pdf.si(stixify_job.id).delay()
+    file = models.File.objects.get(pk=stixify_job.file_id)
+    assert file.pdf_file.read() == b"PDF content"
+    assert file.txt2stix_data == {"data": "here"}
+
+
+@pytest.mark.django_db
+def test_archive_pdf__reprocess_skipped(stixify_reprocess_job):
+    with patch("stixify.worker.pdf_converter.make_conversion") as mock_convert_pdf:
+        archive_pdf.si(stixify_reprocess_job.id).delay()
+        mock_convert_pdf.assert_not_called()
+
+
 @pytest.mark.django_db
 def test_process_post_full(stixify_job):
-    process_post.si(stixify_job.id).delay()
+    new_task(stixify_job)
     file = models.File.objects.get(pk=stixify_job.file_id)
     stixify_job.refresh_from_db()
     assert stixify_job.error == None, stixify_job.error
@@ -286,13 +686,92 @@ def test_job_completed_with_error__failed(stixify_job):
     stixify_job.error = "failed"
     stixify_job.save()
     file_id = stixify_job.file.pk
+    JobStorage(stixify_job.id).mark_completed("convert_file")
     job_completed_with_error(stixify_job.id)
     stixify_job.refresh_from_db()
-    assert stixify_job.file == None
+    # kept until the job is resumed or the checkpoints expire
+    assert stixify_job.file.pk == uuid.UUID(file_id)
     assert stixify_job.state == models.JobState.FAILED
+    assert stixify_job.extra["resumable"] == True
+    assert JobStorage(stixify_job.id).is_completed("convert_file")
+    assert stixify_job.completion_time != None
+
+    with patch("stixify.worker.tasks.datetime") as mock_datetime:
+        mock_datetime.now.return_value = stixify_job.completion_time + timedelta(hours=23)
+        clear_expired_checkpoints()
+    stixify_job.refresh_from_db()
+    assert stixify_job.file.pk == uuid.UUID(file_id)
+    assert JobStorage(stixify_job.id).is_completed("convert_file")
+
+    with patch("stixify.worker.tasks.datetime") as mock_datetime:
+        mock_datetime.now.return_value = stixify_job.completion_time + timedelta(hours=25)
+        clear_expired_checkpoints()
+    stixify_job.refresh_from_db()
+    assert stixify_job.file == None
+    assert "resumable" not in stixify_job.extra
+    assert not JobStorage(stixify_job.id).is_completed("convert_file")
     with pytest.raises(models.File.DoesNotExist):
         models.File.objects.get(pk=file_id)
-    assert stixify_job.completion_time != None
+
+
+@pytest.mark.django_db
+def test_job_completed_with_error__failed_reprocess(stixify_reprocess_job):
+    stixify_reprocess_job.error = "failed"
+    stixify_reprocess_job.save()
+    job_completed_with_error(stixify_reprocess_job.id)
+    stixify_reprocess_job.refresh_from_db()
+    assert stixify_reprocess_job.extra == {"resumable": True}
+    with patch("stixify.worker.tasks.datetime") as mock_datetime:
+        mock_datetime.now.return_value = stixify_reprocess_job.completion_time + timedelta(hours=25)
+        clear_expired_checkpoints()
+    stixify_reprocess_job.refresh_from_db()
+    assert stixify_reprocess_job.file != None
+    assert stixify_reprocess_job.extra == {}
+
+
+@pytest.mark.django_db
+def test_pipeline_stage__checkpoints(stixify_job, fake_stixifier_processor):
+    with patch("stixify.worker.tasks.StixifyProcessor") as mock_stixify_processor_cls:
+        mock_stixify_processor_cls.return_value = fake_stixifier_processor
+        convert_file.si(stixify_job.id).delay()
+        assert JobStorage(stixify_job.id).completed_stages() == ["convert_file"]
+        fake_stixifier_processor.file2txt.assert_called_once()
+
+        # a redelivered or resumed stage is not run again
+        convert_file.si(stixify_job.id).delay()
+        fake_stixifier_processor.file2txt.assert_called_once()
+
+    with patch("stixify.worker.tasks.StixifyProcessor", side_effect=ValueError):
+        extract_file.si(stixify_job.id).delay()
+    assert JobStorage(stixify_job.id).completed_stages() == ["convert_file"]
+
+
+@pytest.mark.django_db
+def test_resume_job(stixify_reprocess_job, fake_stixifier_processor, django_capture_on_commit_callbacks):
+    job = stixify_reprocess_job
+    storage = JobStorage(job.id)
+    with (
+        patch("stixify.worker.tasks.StixifyProcessor") as mock_stixify_processor_cls,
+        patch.object(models.File, "create_embedding"),
+    ):
+        mock_stixify_processor_cls.return_value = fake_stixifier_processor
+        fake_stixifier_processor.txt2stix.side_effect = ValueError("llm error")
+        new_task(job)
+        job.refresh_from_db()
+        assert job.state == models.JobState.FAILED
+        assert tasks.is_resumable(job)
+        assert storage.is_completed("convert_file")
+
+        fake_stixifier_processor.txt2stix.side_effect = None
+        with django_capture_on_commit_callbacks(execute=True):
+            tasks.resume_job(job)
+    job.refresh_from_db()
+    assert job.error == None, job.error
+    assert job.state == models.JobState.COMPLETED
+    assert "resumable" not in job.extra
+    fake_stixifier_processor.file2txt.assert_called_once()
+    assert fake_stixifier_processor.txt2stix.call_count == 2
+    assert storage.completed_stages() == []  # cleared once completed
 
 
 @pytest.mark.django_db
@@ -303,3 +782,225 @@ def test_job_completed_with_error__success(stixify_job):
     assert stixify_job.file.pk == file_id
     assert stixify_job.state == models.JobState.COMPLETED
     assert stixify_job.completion_time != None
+
+
+@pytest.fixture
+def bulk_files(stixify_file):
+    files = [stixify_file]
+    for i in range(2):
+        files.append(
+            models.File.objects.create(
+                file=SimpleUploadedFile(f"file{i}.md", b"File Content", "text/markdown"),
+                profile=stixify_file.profile,
+                identity=stixify_file.identity,
+                mode="md",
+                name=f"file {i}",
+            )
+        )
+    return files
+
+
+@pytest.mark.django_db
+def test_bulk_reprocess__throttled(bulk_files, django_capture_on_commit_callbacks):
+    options = dict(skip_extraction=True, skip_conversion=False, profile_id=None)
+    with (
+        patch("stixify.worker.tasks.new_task") as mock_new_task,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        parent = create_bulk_reprocessing_job(
+            [file.id for file in bulk_files], options, max_in_flight=2
+        )
+    parent.refresh_from_db()
+    children = list(models.Job.objects.filter(batch_id=parent.id).order_by("id"))
+    assert parent.type == models.JobType.BULK_REPROCESS_POSTS
+    assert parent.state == models.JobState.PROCESSING
+    assert parent.extra["dispatched"] == 2
+    assert {child.file_id for child in children} == {file.id for file in bulk_files}
+    for child in children:
+        assert child.type == models.JobType.REPROCESS_POSTS
+        assert child.extra == options
+    assert mock_new_task.call_args_list == [call(children[0]), call(children[1])]
+
+    # nothing finished, no room for more jobs
+    with (
+        patch("stixify.worker.tasks.new_task") as mock_new_task,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        dispatch_bulk_reprocess(parent.id)
+    mock_new_task.assert_not_called()
+
+    children[0].state = models.JobState.FAILED
+    children[0].save()
+    with (
+        patch("stixify.worker.tasks.new_task") as mock_new_task,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        dispatch_bulk_reprocess_jobs()
+    assert mock_new_task.call_args_list == [call(children[2])]
+    parent.refresh_from_db()
+    assert parent.extra["dispatched"] == 3
+    assert parent.extra["dispatched_until"] == str(children[2].id)
+
+    models.Job.objects.filter(batch_id=parent.id).update(state=models.JobState.COMPLETED)
+    dispatch_bulk_reprocess(parent.id)
+    parent.refresh_from_db()
+    assert parent.state == models.JobState.COMPLETED
+    assert parent.completion_time
+
+
+@pytest.mark.django_db
+def test_job_completed_with_error__dispatches_bulk_reprocess(stixify_reprocess_job):
+    stixify_reprocess_job.batch_id = uuid.uuid4()
+    stixify_reprocess_job.save()
+    with patch("stixify.worker.tasks.dispatch_bulk_reprocess.delay") as mock_dispatch:
+        job_completed_with_error(stixify_reprocess_job.id)
+    mock_dispatch.assert_called_once_with(stixify_reprocess_job.batch_id)
+
+
+@pytest.mark.django_db
+def test_new_task__priority(stixify_job):
+    stixify_job.priority = models.JobPriority.BULK
+    stixify_job.save()
+    with patch("stixify.worker.tasks.job_pipeline") as mock_pipeline:
+        new_task(stixify_job)
+    mock_pipeline.return_value.apply_async.assert_called_once_with(
+        countdown=tasks.POLL_INTERVAL,
+        root_id=str(stixify_job.id),
+        task_id=str(stixify_job.id),
+        priority=3,
+    )
+    stixify_job.refresh_from_db()
+    assert stixify_job.queued_time is not None
+
+
+@pytest.mark.django_db
+def test_dispatch_waiting_jobs(bulk_files, settings, django_capture_on_commit_callbacks):
+    settings.JOB_PRIORITY_MAX_IN_FLIGHT = {"bulk": 2}
+    jobs = [
+        models.Job.objects.create(file=file, priority=models.JobPriority.BULK)
+        for file in bulk_files
+    ]
+    interactive_job = models.Job.objects.create(file=bulk_files[0])
+    with (
+        patch("stixify.worker.tasks.send_job") as mock_send_job,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        new_batch_task(jobs)
+        new_task(interactive_job)
+    # oldest first, the interactive job is not limited
+    assert mock_send_job.call_args_list == [call(jobs[0]), call(jobs[1]), call(interactive_job)]
+    waiting = models.Job.objects.filter(priority=models.JobPriority.BULK, queued_time__isnull=True)
+    assert list(waiting) == [jobs[2]]
+
+    # no room until a job finishes
+    with (
+        patch("stixify.worker.tasks.send_job") as mock_send_job,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        dispatch_waiting_jobs()
+    mock_send_job.assert_not_called()
+
+    with (
+        patch("stixify.worker.tasks.send_job") as mock_send_job,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        job_completed_with_error(jobs[0].id)
+    assert mock_send_job.call_args_list == [call(jobs[2])]
+
+
+def test_job_pipeline__delete_report():
+    job = models.Job(id=uuid.uuid4(), type=models.JobType.DELETE_REPORT)
+    assert [task.task.rsplit(".", 1)[-1] for task in job_pipeline(job).tasks] == [
+        "delete_report",
+        "job_completed_with_error",
+    ]
+
+
+@pytest.mark.django_db
+def test_create_deletion_job(stixify_file, django_capture_on_commit_callbacks):
+    with (
+        patch("stixify.worker.tasks.new_task") as mock_new_task,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        job = create_deletion_job(stixify_file)
+        # a second request reuses the job
+        assert create_deletion_job(stixify_file) == job
+    mock_new_task.assert_called_once_with(job)
+    assert job.type == models.JobType.DELETE_REPORT
+    assert job.priority == models.JobPriority.BULK
+    assert job.extra == dict(report_id=stixify_file.report_id, removed_objects=0, updated_objects=0)
+    stixify_file.refresh_from_db()
+    assert stixify_file.pending_deletion
+
+
+@pytest.mark.django_db
+def test_delete_report(stixify_file, django_capture_on_commit_callbacks):
+    with patch("stixify.worker.tasks.new_task"):
+        job = create_deletion_job(stixify_file)
+
+    def remove_report_objects(report_id, progress):
+        progress(removed_objects=3, updated_objects=0)
+        progress(removed_objects=3, updated_objects=2)
+        return dict(removed_objects=3, updated_objects=2)
+
+    with (
+        patch(
+            "stixify.worker.report_deletion.remove_report_objects", side_effect=remove_report_objects
+        ) as mock_remove,
+        patch("stixify.worker.tasks.create_deletion_job") as mock_create_deletion_job,
+        patch("stixify.web.events.publish_stage") as mock_publish_stage,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        delete_report.si(job.id).delay()
+    mock_remove.assert_called_once()
+    assert mock_remove.call_args[0] == (stixify_file.report_id,)
+    mock_publish_stage.assert_any_call(job.id, "delete_report", "progress", removed_objects=3, updated_objects=2)
+    # the objects are already removed, no other job is created for the deleted file
+    mock_create_deletion_job.assert_not_called()
+    assert not models.File.objects.filter(pk=stixify_file.pk).exists()
+    job.refresh_from_db()
+    assert job.error is None
+    assert job.file is None
+    assert job.extra["removed_objects"] == 3
+    assert job.extra["updated_objects"] == 2
+
+
+@pytest.mark.django_db
+def test_delete_report__waits_for_jobs(stixify_job):
+    models.Job.objects.filter(pk=stixify_job.pk).update(state=models.JobState.PROCESSING)
+    with patch("stixify.worker.tasks.new_task"):
+        job = create_deletion_job(stixify_job.file)
+    with (
+        patch("stixify.worker.report_deletion.remove_report_objects") as mock_remove,
+        patch.object(delete_report, "replace") as mock_replace,
+    ):
+        delete_report.si(job.id).delay()
+    mock_remove.assert_not_called()
+    [replacement], _ = mock_replace.call_args
+    assert replacement.args == (job.id,)
+    assert replacement.options["countdown"] == tasks.DELETE_REPORT_WAIT_INTERVAL
+    assert models.File.objects.filter(pk=stixify_job.file_id).exists()
+
+
+@pytest.mark.django_db
+def test_pipeline_stage__file_being_deleted(stixify_job):
+    with patch("stixify.worker.tasks.new_task"):
+        create_deletion_job(stixify_job.file)
+    with patch("stixify.worker.tasks.make_processor") as mock_make_processor:
+        extract_file.si(stixify_job.id).delay()
+    mock_make_processor.assert_not_called()
+    stixify_job.refresh_from_db()
+    assert stixify_job.error == "file is being deleted"
+
+
+@pytest.mark.django_db
+def test_remove_reports_on_delete(stixify_file, django_capture_on_commit_callbacks):
+    with (
+        patch("stixify.worker.tasks.new_task") as mock_new_task,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        stixify_file.delete()
+    job = mock_new_task.call_args[0][0]
+    assert job.type == models.JobType.DELETE_REPORT
+    assert job.file is None
+    assert job.extra["report_id"] == "report--dcbeb240-8dd6-4892-8e9e-7b6bda30e454"
@@ -0,0 +1,38 @@
+import contextlib
+import hashlib
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopFutureHandlers
+
+from stixify.web.models import File
+from stixify.web.upload_handlers import (
+    DigestMemoryFileUploadHandler,
+    DigestTemporaryFileUploadHandler,
+)
+
+
+@pytest.mark.parametrize(
+    "handler_class",
+    [DigestMemoryFileUploadHandler, DigestTemporaryFileUploadHandler],
+)
+def test_digest_upload_handler(handler_class):
+    content = b"some file content" * 1000
+    handler = handler_class()
+    handler.handle_raw_input(None, {}, len(content), "boundary")
+    with contextlib.suppress(StopFutureHandlers):  # raised by the memory handler to claim the file
+        handler.new_file("file", "file.pdf", "application/pdf", len(content))
+    offset = 0
+    for start in range(0, len(content), 1024):
+        chunk = content[start : start + 1024]
+        handler.receive_data_chunk(chunk, offset)
+        offset += len(chunk)
+    uploaded = handler.file_complete(offset)
+    assert uploaded.sha256 == hashlib.sha256(content).hexdigest()
+    assert File.compute_sha256(uploaded) == uploaded.sha256
+
+
+def test_compute_sha256__without_handler():
+    file = SimpleUploadedFile("file.txt", b"file content")
+    assert File.compute_sha256(file) == hashlib.sha256(b"file content").hexdigest()
+    assert file.read() == b"file content", "file must be rewound"
@@ -1,13 +1,16 @@
 import json
 import re
 import uuid
+import zipfile
 from stixify.web import models
 from stixify.classifier.models import DocumentEmbedding
 from stixify.web.serializers import FileSerializer, JobSerializer
 from stixify.web.views import FileView
+from stixify.worker import tasks
 import pytest
 from unittest.mock import patch
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
 import io
 from stixify.web.md_helper import MarkdownImageReplacer
 from tests.utils import Transport
@@ -35,12 +38,122 @@ def test_create(client, stixifier_profile, api_schema, identity):
         file = models.File.objects.get(pk="567681d6-2817-4d84-84fb-87b2f059b92e")
         mock_job_serializer_cls.assert_called_once_with(job, **mock_job_serializer_cls.call_args[1])
         mock_new_task.assert_called_once_with(job)
+        assert job.priority == models.JobPriority.INTERACTIVE
         assert resp.data["file"]["id"] == "567681d6-2817-4d84-84fb-87b2f059b92e"
         assert file.file.read() == b"file content"
         resp.wsgi_request.FILES.clear()
         api_schema['/api/v1/files/']['POST'].validate_response(Transport.get_st_response(resp))
 
 
+@pytest.mark.django_db
+def test_create__priority(client, stixifier_profile, identity):
+    payload = dict(
+        file=SimpleUploadedFile(name="name.md", content=b"file content"),
+        profile_id=stixifier_profile.id,
+        identity_id=identity.id,
+        mode="md",
+        name="Upload test",
+        priority="bulk",
+    )
+    with patch("stixify.web.views.new_task") as mock_new_task:
+        resp = client.post("/api/v1/files/", data=payload)
+    assert resp.status_code == 201, resp.content
+    job = models.Job.objects.get(pk=resp.data["id"])
+    assert job.priority == models.JobPriority.BULK
+    assert resp.data["priority"] == "bulk"
+    mock_new_task.assert_called_once_with(job)
+
+
+@pytest.mark.django_db
+def test_create__pending_deletion_ignored(client, stixifier_profile, identity):
+    payload = dict(
+        file=SimpleUploadedFile(name="name.md", content=b"file content"),
+        profile_id=stixifier_profile.id,
+        identity_id=identity.id,
+        mode="md",
+        name="Upload test",
+        pending_deletion=True,
+    )
+    with patch("stixify.web.views.new_task"):
+        resp = client.post("/api/v1/files/", data=payload)
+    assert resp.status_code == 201, resp.content
+    assert "pending_deletion" not in resp.data["file"]
+    assert models.Job.objects.get(pk=resp.data["id"]).file.pending_deletion is False
+
+
+@pytest.mark.django_db
+def test_create_upload(client, api_schema):
+    payload = dict(filename="report.pdf", size=1024, sha256="ab" * 32, content_type="application/pdf")
+    upload = dict(
+        upload_id="signed-upload",
+        url="https://storage.example/uploads/report.pdf?X-Amz-Signature=x",
+        method="PUT",
+        headers={"Content-Type": "application/pdf", "x-amz-checksum-sha256": "q6ur"},
+        expires_at="2026-01-01T00:00:00Z",
+    )
+    with (
+        patch("stixify.web.direct_uploads.is_enabled", return_value=True),
+        patch("stixify.web.direct_uploads.create_upload", return_value=upload) as mock_create_upload,
+    ):
+        resp = client.post("/api/v1/files/uploads/", data=payload, content_type="application/json")
+    assert resp.status_code == 201, resp.content
+    mock_create_upload.assert_called_once_with(**payload)
+    assert resp.data["upload_id"] == "signed-upload"
+    api_schema["/api/v1/files/uploads/"]["POST"].validate_response(Transport.get_st_response(resp))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    ["enabled", "payload"],
+    [
+        (False, dict(filename="report.pdf", size=1024, sha256="ab" * 32)),
+        (True, dict(filename="report.pdf", size=1024, sha256="not-a-digest")),
+        (True, dict(filename="report.pdf", size=6 * 1024**3, sha256="ab" * 32)),
+    ],
+)
+def test_create_upload__bad_request(client, enabled, payload):
+    with patch("stixify.web.direct_uploads.is_enabled", return_value=enabled):
+        resp = client.post("/api/v1/files/uploads/", data=payload, content_type="application/json")
+    assert resp.status_code == 400, resp.content
+
+
+@pytest.mark.django_db
+def test_confirm_upload(client, stixifier_profile, identity, api_schema):
+    upload = dict(
+        name="uploads/a/report.pdf",
+        filename="report.pdf",
+        size=12,
+        sha256="ab" * 32,
+        content_type="application/pdf",
+    )
+    payload = dict(
+        upload_id="signed-upload",
+        profile_id=str(stixifier_profile.id),
+        identity_id=identity.id,
+        mode="pdf",
+        name="Direct upload",
+        priority="bulk",
+    )
+    with (
+        patch("stixify.web.direct_uploads.is_enabled", return_value=True),
+        patch("stixify.web.direct_uploads.get_upload", return_value=upload) as mock_get_upload,
+        patch("stixify.web.direct_uploads.move_to_file") as mock_move_to_file,
+        patch("stixify.web.views.new_task") as mock_new_task,
+    ):
+        resp = client.post("/api/v1/files/uploads/confirm/", data=payload, content_type="application/json")
+    assert resp.status_code == 201, resp.content
+    mock_get_upload.assert_called_once_with("signed-upload")
+    job = models.Job.objects.get(pk=resp.data["id"])
+    assert job.priority == models.JobPriority.BULK
+    file = job.file
+    assert file.name == "Direct upload"
+    assert file.sha256 == upload["sha256"]
+    assert file.mimetype == "application/pdf"
+    mock_move_to_file.assert_called_once_with(file, upload)
+    mock_new_task.assert_called_once_with(job)
+    api_schema["/api/v1/files/uploads/confirm/"]["POST"].validate_response(Transport.get_st_response(resp))
+
+
 @pytest.mark.django_db
 def test_create_mhtml_pdf(client, stixifier_profile, api_schema, identity):
     payload = dict(
@@ -57,22 +170,353 @@ def test_create_mhtml_pdf(client, stixifier_profile, api_schema, identity):
         ) as mock_job_serializer_cls,
         patch("stixify.web.views.new_task") as mock_new_task,
         patch(
-            "stixify.web.serializers.pdf_converter.convert_mhtml_to_pdf",
-            return_value=b"pdf bytes",
+            "stixify.worker.pdf_converter.convert_mhtml_to_pdf",
         ) as mock_convert_mhtml_to_pdf,
     ):
         resp = client.post("/api/v1/files/", data=payload)
         assert resp.status_code == 201, resp.content
         file = models.File.objects.get(pk="567681d6-2817-4d84-84fb-87b2f059b92e")
+        job = models.Job.objects.get(pk=resp.data["id"])
         assert file.file.read() == b"file content"
-        assert file.pdf_file.read() == b"pdf bytes"
-        mock_convert_mhtml_to_pdf.assert_called_once()
+        assert not file.pdf_file, "pdf is rendered by the worker, not during upload"
+        mock_convert_mhtml_to_pdf.assert_not_called()
+        mock_new_task.assert_called_once_with(job)
         resp.wsgi_request.FILES.clear()
         api_schema["/api/v1/files/"]["POST"].validate_response(
             Transport.get_st_response(resp)
         )
 
 
+@pytest.fixture
+def processed_duplicate(stixify_job):
+    file = stixify_job.file
+    file.sha256 = models.File.compute_sha256(SimpleUploadedFile("x", b"File Content"))
+    file.txt2stix_data = {"data": "here"}
+    file.markdown_file.save("markdown.md", io.BytesIO(b"Some markdown"), save=False)
+    file.save()
+    models.FileImage.objects.create(
+        report=file, file=SimpleUploadedFile("image.png", b"image"), name="image.png"
+    )
+    return file
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "on_duplicate,expected_status",
+    [
+        (None, 201),
+        ("process", 201),
+        ("return-existing", 200),
+        ("reuse-extractions", 201),
+    ],
+)
+def test_create__duplicate(
+    client, processed_duplicate, stixifier_profile, identity, api_schema, on_duplicate, expected_status
+):
+    payload = dict(
+        file=SimpleUploadedFile(name="name.md", content=b"File Content"),
+        profile_id=stixifier_profile.id,
+        identity_id=identity.id,
+        mode="md",
+        name="Duplicate upload",
+    )
+    if on_duplicate:
+        payload.update(on_duplicate=on_duplicate)
+    with patch("stixify.web.views.new_task") as mock_new_task:
+        resp = client.post("/api/v1/files/", data=payload)
+        assert resp.status_code == expected_status, resp.content
+        job = models.Job.objects.get(pk=resp.data["id"])
+        if on_duplicate == "return-existing":
+            assert job.file == processed_duplicate
+            mock_new_task.assert_not_called()
+            assert models.File.objects.count() == 1
+            return
+
+        mock_new_task.assert_called_once_with(job)
+        assert job.file != processed_duplicate
+        assert job.file.sha256 == processed_duplicate.sha256
+        if on_duplicate == "reuse-extractions":
+            assert job.extra == dict(skip_extraction=True, duplicate_of=str(processed_duplicate.id))
+            assert job.file.txt2stix_data == processed_duplicate.txt2stix_data
+            assert job.file.markdown_file.read() == b"Some markdown"
+            assert [image.name for image in job.file.images.all()] == ["image.png"]
+        else:
+            assert not job.extra
+            assert job.file.txt2stix_data is None
+        resp.wsgi_request.FILES.clear()
+        api_schema["/api/v1/files/"]["POST"].validate_response(
+            Transport.get_st_response(resp)
+        )
+
+
+@pytest.mark.django_db
+def test_create__duplicate_other_profile(client, processed_duplicate, identity):
+    payload = dict(
+        file=SimpleUploadedFile(name="name.md", content=b"File Content"),
+        profile_id=processed_duplicate.profile.id,
+        identity_id=identity.id,
+        mode="txt",
+        name="Duplicate upload",
+        on_duplicate="return-existing",
+    )
+    with patch("stixify.web.views.new_task") as mock_new_task:
+        resp = client.post("/api/v1/files/", data=payload)
+        assert resp.status_code == 201, resp.content
+        job = models.Job.objects.get(pk=resp.data["id"])
+        assert job.file != processed_duplicate
+        mock_new_task.assert_called_once_with(job)
+
+
+@pytest.mark.django_db
+def test_bulk_create(client, stixifier_profile, identity, api_schema, django_capture_on_commit_callbacks):
+    payload = dict(
+        files=[
+            SimpleUploadedFile(name="first.md", content=b"first content", content_type="text/markdown"),
+            SimpleUploadedFile(name="second.md", content=b"second content", content_type="text/markdown"),
+        ],
+        profile_id=stixifier_profile.id,
+        identity_id=identity.id,
+        mode="md",
+        labels=["label1", "label2"],
+        tlp_level="amber",
+    )
+    with (
+        patch("stixify.web.views.tasks.new_batch_task") as mock_new_batch_task,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        resp = client.post("/api/v1/files/bulk/", data=payload)
+    assert resp.status_code == 201, resp.content
+    assert resp.data["total_jobs"] == resp.data["pending_jobs"] == 2
+    assert resp.data["state"] == "pending"
+    jobs = list(models.Job.objects.filter(batch_id=resp.data["batch_id"]).order_by("file__name"))
+    mock_new_batch_task.assert_called_once()
+    assert {job.id for job in mock_new_batch_task.call_args[0][0]} == {job.id for job in jobs}
+    assert [job.file.name for job in jobs] == ["first.md", "second.md"]
+    assert {job.priority for job in jobs} == {models.JobPriority.BULK}
+    for job, content in zip(jobs, [b"first content", b"second content"]):
+        assert job.file.file.read() == content
+        assert job.file.sha256 == models.File.compute_sha256(SimpleUploadedFile("x", content))
+        assert job.file.labels == ["label1", "label2"]
+        assert job.file.tlp_level == "amber"
+        assert job.file.profile == stixifier_profile
+        assert job.file.mimetype == "text/markdown"
+    resp.wsgi_request.FILES.clear()
+    api_schema["/api/v1/files/bulk/"]["POST"].validate_response(
+        Transport.get_st_response(resp)
+    )
+
+
+@pytest.mark.django_db
+def test_bulk_create__archive(client, stixifier_profile, identity, django_capture_on_commit_callbacks):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("reports/first.md", "first content")
+        zf.writestr("second.md", "second content")
+        zf.writestr("__MACOSX/reports/._first.md", "junk")
+        zf.writestr(".DS_Store", "junk")
+    payload = dict(
+        archive=SimpleUploadedFile(name="reports.zip", content=archive.getvalue()),
+        profile_id=stixifier_profile.id,
+        identity_id=identity.id,
+        mode="md",
+    )
+    with (
+        patch("stixify.web.views.tasks.new_batch_task") as mock_new_batch_task,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        resp = client.post("/api/v1/files/bulk/", data=payload)
+    assert resp.status_code == 201, resp.content
+    mock_new_batch_task.assert_called_once()
+    files = models.File.objects.filter(job__batch_id=resp.data["batch_id"]).order_by("name")
+    assert [(file.name, file.file.read()) for file in files] == [
+        ("first.md", b"first content"),
+        ("second.md", b"second content"),
+    ]
+
+
+def make_archive(**members):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    return SimpleUploadedFile(name="reports.zip", content=archive.getvalue())
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "uploads",
+    [
+        dict(),
+        dict(
+            files=[SimpleUploadedFile(name="first.md", content=b"first")],
+            archive=SimpleUploadedFile(name="reports.zip", content=b"zip"),
+        ),
+        dict(archive=SimpleUploadedFile(name="reports.zip", content=b"not a zip")),
+        dict(files=[SimpleUploadedFile(name=f"{i}.md", content=b"content") for i in range(3)]),
+        dict(archive=make_archive(**{"big.md": "a" * 101})),  # over the member size once extracted
+        dict(archive=make_archive(**{"first.md": "a" * 80, "second.md": "b" * 80})),  # over the total size
+    ],
+)
+def test_bulk_create__bad_request(client, stixifier_profile, identity, settings, uploads):
+    settings.BULK_UPLOAD_MAX_FILES = 2
+    settings.BULK_UPLOAD_MAX_ARCHIVE_MEMBER_SIZE = 100
+    settings.BULK_UPLOAD_MAX_ARCHIVE_SIZE = 150
+    payload = dict(
+        profile_id=stixifier_profile.id,
+        identity_id=identity.id,
+        mode="md",
+        **uploads,
+    )
+    with patch("stixify.web.views.tasks.new_batch_task") as mock_new_batch_task:
+        resp = client.post("/api/v1/files/bulk/", data=payload)
+    assert resp.status_code == 400, resp.content
+    mock_new_batch_task.assert_not_called()
+    assert not models.File.objects.exists()
+
+
+@pytest.mark.django_db
+def test_bulk_create__failure_removes_stored_files(client, stixifier_profile, identity):
+    saved = []
+
+    def save(name, content, **kwargs):
+        saved.append(original_save(name, content, **kwargs))
+        return saved[-1]
+
+    original_save = default_storage.save
+    payload = dict(
+        archive=make_archive(**{"first.md": "first content", "second.md": "second content"}),
+        profile_id=stixifier_profile.id,
+        identity_id=identity.id,
+        mode="md",
+    )
+    with (
+        patch.object(default_storage, "save", side_effect=save),
+        patch("stixify.web.views.Job.objects.bulk_create", side_effect=ValueError),
+        pytest.raises(ValueError),
+    ):
+        client.post("/api/v1/files/bulk/", data=payload)
+    assert len(saved) == 2
+    assert not any(map(default_storage.exists, saved))
+    assert not models.File.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "payload,has_markdown,expected_status",
+    [
+        (dict(skip_extraction=False, skip_conversion=True), True, 400),  # no profile_id
+        (dict(skip_conversion=True, profile_id="use-profile"), True, 400),  # skip_extraction defaults to true
+        (dict(skip_extraction=False, skip_conversion=True, profile_id="use-profile"), False, 400),
+        (dict(skip_extraction=False, skip_conversion=True, profile_id="use-profile"), True, 201),
+    ],
+)
+def test_reprocess_skip_conversion(client, stixify_file, stixifier_profile, payload, has_markdown, expected_status):
+    if payload.get("profile_id"):
+        payload["profile_id"] = str(stixifier_profile.id)
+    if has_markdown:
+        stixify_file.markdown_file.save("markdown.md", io.BytesIO(b"Some markdown"))
+    with patch("stixify.worker.tasks.new_task") as mock_new_task:
+        resp = client.patch(
+            f"/api/v1/files/{stixify_file.id}/reprocess/",
+            data=payload,
+            content_type="application/json",
+        )
+    assert resp.status_code == expected_status, resp.content
+    if expected_status == 201:
+        job = models.Job.objects.get(pk=resp.data["id"])
+        assert job.type == models.JobType.REPROCESS_POSTS
+        assert job.extra == dict(
+            profile_id=str(stixifier_profile.id), skip_extraction=False, skip_conversion=True
+        )
+        mock_new_task.assert_called_once_with(job)
+    else:
+        mock_new_task.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_bulk_reprocess(client, stixify_job, stixifier_profile, identity, api_schema):
+    processed = stixify_job.file
+    processed.txt2stix_data = {"data": "here"}
+    processed.save()
+    not_processed = models.File.objects.create(
+        file=SimpleUploadedFile("file.md", b"File Content", "text/markdown"),
+        profile=stixifier_profile,
+        identity=identity,
+        mode="md",
+        name="not processed",
+    )
+    failed = models.File.objects.create(
+        file=SimpleUploadedFile("file.md", b"File Content", "text/markdown"),
+        profile=stixifier_profile,
+        identity=identity,
+        mode="md",
+        name="failed reprocess",
+        txt2stix_data={"data": "here"},
+    )
+    models.Job.objects.create(file=failed, state=models.JobState.FAILED)
+
+    with patch("stixify.web.views.tasks.create_bulk_reprocessing_job", side_effect=tasks.create_bulk_reprocessing_job) as mock_create:
+        resp = client.post(
+            "/api/v1/files/reprocess/",
+            data=dict(current_profile_id=str(stixifier_profile.id), max_in_flight=5),
+            content_type="application/json",
+        )
+        assert resp.status_code == 201, resp.content
+        parent = models.Job.objects.get(pk=resp.data["id"])
+        assert parent.type == models.JobType.BULK_REPROCESS_POSTS
+        assert parent.extra["max_in_flight"] == 5
+        # skip_extraction defaults to true, files without extractions are ignored
+        assert set(
+            models.Job.objects.filter(batch_id=parent.id).values_list("file_id", flat=True)
+        ) == {processed.id, failed.id}
+        api_schema["/api/v1/files/reprocess/"]["POST"].validate_response(
+            Transport.get_st_response(resp)
+        )
+
+        resp = client.post(
+            "/api/v1/files/reprocess/",
+            data=dict(last_job_failed=True),
+            content_type="application/json",
+        )
+        assert resp.status_code == 201, resp.content
+        assert list(
+            models.Job.objects.filter(batch_id=resp.data["id"]).values_list("file_id", flat=True)
+        ) == [failed.id]
+
+        resp = client.post(
+            "/api/v1/files/reprocess/",
+            data=dict(skip_extraction=False, profile_id=str(stixifier_profile.id), identity_id=identity.id),
+            content_type="application/json",
+        )
+        assert resp.status_code == 201, resp.content
+        assert models.Job.objects.filter(batch_id=resp.data["id"]).count() == 3
+    assert mock_create.call_count == 3
+    assert mock_create.call_args[0][1] == dict(
+        profile_id=str(stixifier_profile.id), skip_extraction=False, skip_conversion=False
+    )
+
+
+@pytest.mark.django_db
+def test_bulk_reprocess__no_filter(client):
+    with patch("stixify.web.views.tasks.create_bulk_reprocessing_job") as mock_create:
+        resp = client.post("/api/v1/files/reprocess/", data={}, content_type="application/json")
+    assert resp.status_code == 400, resp.content
+    mock_create.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_bulk_reprocess__pending_deletion(client, stixify_file):
+    models.File.objects.filter(pk=stixify_file.pk).update(pending_deletion=True)
+    with patch("stixify.worker.tasks.dispatch_bulk_reprocess"):
+        resp = client.post(
+            "/api/v1/files/reprocess/",
+            data={"file_ids": [str(stixify_file.id)]},
+            content_type="application/json",
+        )
+    assert resp.status_code == 201, resp.content
+    assert not models.Job.objects.filter(batch_id=resp.data["id"]).exists()
+
+
 @pytest.mark.django_db
 def test_file_extractions(client, stixify_file, api_schema):
     post = models.File.objects.get(pk="dcbeb240-8dd6-4892-8e9e-7b6bda30e454")
@@ -88,6 +532,27 @@ def test_file_extractions(client, stixify_file, api_schema):
     api_schema['/api/v1/files/{file_id}/extractions/']['GET'].validate_response(Transport.get_st_response(resp))
 
 
+@pytest.mark.django_db
+def test_file_extractions__navigator_layers(client, stixify_file):
+    post = models.File.objects.get(pk="dcbeb240-8dd6-4892-8e9e-7b6bda30e454")
+    post.txt2stix_data = {"data": "here"}
+    post.save()
+    layer = {"domain": "ics-attack", "name": "ICS Layer", "techniques": []}
+    post.set_navigator_layers([layer])
+    resp = client.get("/api/v1/files/dcbeb240-8dd6-4892-8e9e-7b6bda30e454/extractions/")
+    assert resp.status_code == 200, resp.content
+    assert resp.data == {"data": "here", "navigator_layer": [layer]}
+
+
+@pytest.mark.django_db
+def test_list_files__defers_txt2stix_data():
+    view = FileView()
+    view.action = "list"
+    assert "txt2stix_data" in view.get_queryset().query.deferred_loading[0]
+    view.action = "extractions"
+    assert not view.get_queryset().query.deferred_loading[0]
+
+
 @pytest.mark.django_db
 def test_file_extractions_no_data(client, stixify_file, api_schema):
     post = models.File.objects.get(pk="dcbeb240-8dd6-4892-8e9e-7b6bda30e454")
@@ -103,9 +568,10 @@ def test_file_extractions_no_data(client, stixify_file, api_schema):
 
 
 @pytest.mark.django_db
-def test_file_markdown(client, stixify_file, api_schema):
+def test_file_markdown(client, stixify_file, api_schema, django_capture_on_commit_callbacks):
     post_file = models.File.objects.get(pk="dcbeb240-8dd6-4892-8e9e-7b6bda30e454")
-    post_file.markdown_file.save("markdown.md", io.StringIO("My markdown"))
+    with django_capture_on_commit_callbacks(execute=True):  # invalidates the cached markdown
+        post_file.markdown_file.save("markdown.md", io.StringIO("My markdown"))
     images = [
         models.FileImage.objects.create(
             report=post_file, file=SimpleUploadedFile("nb", b"f1"), name="image1"
@@ -135,6 +601,40 @@ def test_file_markdown(client, stixify_file, api_schema):
         api_schema['/api/v1/files/{file_id}/markdown/']['GET'].validate_response(Transport.get_st_response(resp))
 
 
+@pytest.mark.django_db
+def test_file_markdown__cached(client, stixify_file, django_capture_on_commit_callbacks):
+    post_file = models.File.objects.get(pk="dcbeb240-8dd6-4892-8e9e-7b6bda30e454")
+    url = "/api/v1/files/dcbeb240-8dd6-4892-8e9e-7b6bda30e454/markdown/"
+    with django_capture_on_commit_callbacks(execute=True):
+        post_file.markdown_file.save("markdown.md", io.StringIO("My markdown"))
+    with patch.object(
+        MarkdownImageReplacer, "get_markdown", side_effect=["Built Markdown", "Rebuilt Markdown"]
+    ) as mock_get_markdown:
+        resp = client.get(url)
+        assert resp.status_code == 200, resp.content
+        etag = resp.headers["ETag"]
+
+        resp = client.get(url)
+        assert resp.getvalue() == b"Built Markdown"
+        assert resp.headers["ETag"] == etag
+        assert mock_get_markdown.call_count == 1
+
+        resp = client.get(url, headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert mock_get_markdown.call_count == 1
+
+        # replacing the images (e.g. on reprocess) invalidates the cached markdown
+        with django_capture_on_commit_callbacks(execute=True):
+            models.FileImage.objects.create(
+                report=post_file, file=SimpleUploadedFile("nb", b"f1"), name="image1"
+            ).delete()
+        resp = client.get(url, headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.getvalue() == b"Rebuilt Markdown"
+        assert resp.headers["ETag"] != etag
+        assert mock_get_markdown.call_count == 2
+
+
 @pytest.mark.django_db
 def test_file_images(client, stixify_file, api_schema):
     post = models.File.objects.get(pk="dcbeb240-8dd6-4892-8e9e-7b6bda30e454")
@@ -222,6 +722,23 @@ def test_list_files(client, stixify_file, more_files, api_schema):
     assert len(resp.data["files"]) == 4
     api_schema['/api/v1/files/']['GET'].validate_response(Transport.get_st_response(resp))
 
+
+@pytest.mark.django_db
+def test_list_files__failed_import(client, stixify_file, more_files):
+    job = models.Job.objects.create(
+        file=stixify_file, type=models.JobType.IMPORT_FILE, state=models.JobState.FAILED, extra=dict(resumable=True)
+    )
+    resp = client.get("/api/v1/files/")
+    assert resp.status_code == 200, resp.content
+    assert resp.data["total_results_count"] == 3
+    assert str(stixify_file.id) not in {file["id"] for file in resp.data["files"]}
+    assert client.get(f"/api/v1/files/{stixify_file.id}/").status_code == 404
+
+    # listed again once the import is resumed
+    tasks.resume_job(job)
+    resp = client.get("/api/v1/files/")
+    assert resp.data["total_results_count"] == 4
+
 @pytest.fixture()
 def search_files(stixifier_profile, identity):
     files = [
@@ -418,3 +935,74 @@ def test_file_pdf_with_pdf(client, stixify_file, api_schema):
     assert re.match(r'attachment; filename="dcbeb240-8dd6-4892-8e9e-7b6bda30e454_archived_*[\w]*.pdf"', resp.headers["Content-Disposition"])
     assert resp.getvalue() == b"pdf content"
     api_schema['/api/v1/files/{file_id}/pdf/']['GET'].validate_response(Transport.get_st_response(resp))
+
+
+@pytest.mark.django_db
+def test_file_pdf__range(client, stixify_file):
+    file_obj = models.File.objects.get(pk="dcbeb240-8dd6-4892-8e9e-7b6bda30e454")
+    file_obj.pdf_file.save("archived.pdf", io.BytesIO(b"pdf content"))
+    file_obj.save(update_fields=["pdf_file"])
+    resp = client.get(
+        "/api/v1/files/dcbeb240-8dd6-4892-8e9e-7b6bda30e454/pdf/",
+        headers={"Range": "bytes=4-"},
+    )
+    assert resp.status_code == 206, resp.content
+    assert resp.getvalue() == b"content"
+    assert resp.headers["Content-Range"] == "bytes 4-10/11"
+    resp = client.get(
+        "/api/v1/files/dcbeb240-8dd6-4892-8e9e-7b6bda30e454/pdf/",
+        headers={"If-None-Match": resp.headers["ETag"]},
+    )
+    assert resp.status_code == 304
+
+
+@pytest.mark.django_db
+def test_file_download(client, stixify_file, api_schema):
+    file_obj = models.File.objects.get(pk="dcbeb240-8dd6-4892-8e9e-7b6bda30e454")
+    resp = client.get(
+        "/api/v1/files/dcbeb240-8dd6-4892-8e9e-7b6bda30e454/download/",
+        headers={"Accept": "text/html"},
+    )
+    assert resp.status_code == 200, resp.content
+    assert resp.headers["Content-Type"] == file_obj.mimetype
+    assert resp.getvalue() == file_obj.file.read()
+    api_schema['/api/v1/files/{file_id}/download/']['GET'].validate_response(Transport.get_st_response(resp))
+
+
+@pytest.mark.django_db
+def test_file_image(client, stixify_file, api_schema):
+    post = models.File.objects.get(pk="dcbeb240-8dd6-4892-8e9e-7b6bda30e454")
+    models.FileImage.objects.create(
+        report=post, file=SimpleUploadedFile("nb", b"f1"), name="image1.png"
+    )
+    resp = client.get(
+        "/api/v1/files/dcbeb240-8dd6-4892-8e9e-7b6bda30e454/images/image1.png/",
+    )
+    assert resp.status_code == 200, resp.content
+    assert resp.headers["Content-Type"] == "image/png"
+    assert resp.getvalue() == b"f1"
+    resp = client.get(
+        "/api/v1/files/dcbeb240-8dd6-4892-8e9e-7b6bda30e454/images/image2.png/",
+    )
+    assert resp.status_code == 404
+    api_schema['/api/v1/files/{file_id}/images/{image_name}/']['GET'].validate_response(Transport.get_st_response(resp))
+
+
+@pytest.mark.django_db
+def test_delete_file(client, stixify_file, api_schema, django_capture_on_commit_callbacks):
+    url = "/api/v1/files/dcbeb240-8dd6-4892-8e9e-7b6bda30e454/"
+    with (
+        patch("stixify.worker.tasks.new_task") as mock_new_task,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        resp = client.delete(url)
+        assert resp.status_code == 202, resp.content
+        api_schema['/api/v1/files/{file_id}/']['DELETE'].validate_response(Transport.get_st_response(resp))
+        # hidden straight away, deleting again returns the same job
+        assert client.get(url).status_code == 404
+        assert client.delete(url).data["id"] == resp.data["id"]
+    job = models.Job.objects.get(pk=resp.data["id"])
+    mock_new_task.assert_called_once_with(job)
+    assert job.type == models.JobType.DELETE_REPORT
+    assert job.file == stixify_file
+    assert models.File.objects.get(pk=stixify_file.pk).pending_deletion
@@ -1,3 +1,6 @@
+import json
+from unittest.mock import patch
+
 import pytest
 
 from stixify.web import models
@@ -55,4 +58,149 @@ def test_jobs_filter_by_multiple_states(client, api_schema, states, expected_ids
 
     api_schema["/api/v1/jobs/"]["GET"].validate_response(
         Transport.get_st_response(resp)
-    )
\ No newline at end of file
+    )
+
+@pytest.mark.parametrize(
+    "states,expected_state",
+    [
+        (["pending", "pending"], "pending"),
+        (["pending", "completed"], "processing"),
+        (["processing", "failed"], "processing"),
+        (["completed", "failed"], "completed"),
+    ],
+)
+@pytest.mark.django_db
+def test_job_batch(client, api_schema, states, expected_state):
+    batch_id = "5f7c0f7c-3a1f-4b7a-9b2e-6d1d0c7c1c11"
+    for state in states:
+        models.Job.objects.create(batch_id=batch_id, state=state)
+    models.Job.objects.create(state=models.JobState.PENDING)  # not part of the batch
+
+    resp = client.get(f"/api/v1/jobs/batches/{batch_id}/")
+    assert resp.status_code == 200, resp.content
+    assert resp.data["state"] == expected_state
+    assert resp.data["total_jobs"] == len(states)
+    for state in models.JobState:
+        assert resp.data[f"{state}_jobs"] == states.count(state)
+    api_schema["/api/v1/jobs/batches/{batch_id}/"]["GET"].validate_response(
+        Transport.get_st_response(resp)
+    )
+
+    resp = client.get(f"/api/v1/jobs/?batch_id={batch_id}")
+    assert resp.data["total_results_count"] == len(states)
+
+
+@pytest.mark.django_db
+def test_job_batch__not_found(client):
+    resp = client.get("/api/v1/jobs/batches/5f7c0f7c-3a1f-4b7a-9b2e-6d1d0c7c1c11/")
+    assert resp.status_code == 404
+
+
+@pytest.mark.django_db
+def test_job_metrics(client, api_schema, stixify_file):
+    def job_metrics(wall_time, tokens):
+        return {
+            "metrics": {
+                "extract_file": {
+                    "wall_time": wall_time,
+                    "cpu_time": 1,
+                    "peak_rss_delta": 100,
+                    "llm_calls": 1,
+                    "llm_prompt_tokens": tokens,
+                    "llm_completion_tokens": 10,
+                },
+                "convert_file": {"wall_time": 1, "cpu_time": 1, "peak_rss_delta": 0},
+            }
+        }
+
+    models.Job.objects.create(file=stixify_file, state=models.JobState.COMPLETED, extra=job_metrics(2, 100))
+    models.Job.objects.create(file=stixify_file, state=models.JobState.COMPLETED, extra=job_metrics(4, 300))
+    models.Job.objects.create(file=stixify_file, state=models.JobState.PROCESSING, extra=job_metrics(100, 100))
+    models.Job.objects.create(
+        file=stixify_file,
+        state=models.JobState.COMPLETED,
+        type=models.JobType.REPROCESS_POSTS,
+        extra=job_metrics(1, 50),
+    )
+
+    resp = client.get("/api/v1/jobs/metrics/")
+    assert resp.status_code == 200, resp.content
+    assert len(resp.data) == 2
+    imports, reprocess = resp.data
+    assert imports["type"] == models.JobType.IMPORT_FILE
+    assert imports["profile_id"] == str(stixify_file.profile_id)
+    assert imports["mode"] == "md"
+    assert imports["jobs"] == 2
+    assert imports["stages"]["extract_file"]["wall_time"] == 3
+    assert imports["stages"]["extract_file"]["llm_prompt_tokens"] == 400
+    assert imports["stages"]["convert_file"]["llm_calls"] is None
+    assert reprocess["jobs"] == 1
+    api_schema["/api/v1/jobs/metrics/"]["GET"].validate_response(
+        Transport.get_st_response(resp)
+    )
+
+    resp = client.get("/api/v1/jobs/metrics/", data=dict(mode="pdf"))
+    assert resp.data == []
+
+
+@pytest.mark.django_db
+def test_job_events(client, stixify_job):
+    resp = client.get(f"/api/v1/jobs/{stixify_job.id}/events/")
+    assert resp.status_code == 200
+    assert resp["Content-Type"] == "text/event-stream"
+    assert resp["Cache-Control"] == "no-cache"
+    content = b"".join(resp.streaming_content).decode()
+    assert content.startswith("event: state\ndata: ")
+    assert json.loads(content.split("data: ", 1)[1]) == dict(
+        event="state",
+        job_id=str(stixify_job.id),
+        state=stixify_job.state,
+        error=stixify_job.error,
+    )
+
+
+@pytest.mark.django_db
+def test_job_events__not_found(client):
+    resp = client.get("/api/v1/jobs/9e0d79ed-94d9-42a3-aa41-4772ae922176/events/")
+    assert resp.status_code == 404
+
+
+@pytest.mark.django_db
+def test_job_resume(client, api_schema, stixify_job, django_capture_on_commit_callbacks):
+    stixify_job.state = models.JobState.FAILED
+    stixify_job.error = "failed to process report: llm error"
+    stixify_job.extra = {"resumable": True}
+    stixify_job.save()
+    with (
+        patch("stixify.worker.tasks.new_task") as mock_new_task,
+        django_capture_on_commit_callbacks(execute=True),
+    ):
+        resp = client.post(f"/api/v1/jobs/{stixify_job.id}/resume/")
+    assert resp.status_code == 200, resp.content
+    assert resp.data["state"] == models.JobState.PENDING
+    stixify_job.refresh_from_db()
+    assert stixify_job.error == None
+    assert stixify_job.extra == {}
+    mock_new_task.assert_called_once_with(stixify_job)
+    api_schema["/api/v1/jobs/{job_id}/resume/"]["POST"].validate_response(
+        Transport.get_st_response(resp)
+    )
+
+
+@pytest.mark.parametrize(
+    "state,extra",
+    [
+        (models.JobState.FAILED, {}),
+        (models.JobState.COMPLETED, {"resumable": True}),
+        (models.JobState.PROCESSING, None),
+    ],
+)
+@pytest.mark.django_db
+def test_job_resume__not_resumable(client, stixify_job, state, extra):
+    stixify_job.state = state
+    stixify_job.extra = extra
+    stixify_job.save()
+    with patch("stixify.worker.tasks.new_task") as mock_new_task:
+        resp = client.post(f"/api/v1/jobs/{stixify_job.id}/resume/")
+    assert resp.status_code == 400, resp.content
+    mock_new_task.assert_not_called()
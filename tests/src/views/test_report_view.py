@@ -3,7 +3,7 @@ import json
 import typing
 import uuid
 from stixify.classifier.models import Cluster, DocumentEmbedding
-from stixify.web import models
+from stixify.web import arango_indexes, models
 from stixify.web.serializers import FileSerializer, JobSerializer
 from stixify.web.views import FileView, ReportView
 import pytest
@@ -64,6 +64,7 @@ def make_s2a_uploads(
         **kwargs,
     )
     startup_func()
+    arango_indexes.ensure_search(s2a.arango.db)
     for bundle in uploads:
         for obj in bundle["objects"]:
             obj["_stixify_report_id"] = bundle["id"].replace("bundle", "report")
@@ -84,6 +85,59 @@ def upload_arango_objects():
         return
 
 
+@pytest.fixture
+def report_files(stixifier_profile):
+    """The Files of the reports in `bundles`, the report list is served from them."""
+    from dogesec_commons.identity.models import Identity
+
+    files = []
+    for file_id, identity_id, values in [
+        (
+            "52d2146c-798a-440f-942f-6fe039fb8995",
+            "identity--f92e15d9-6afc-5ae2-bb3e-85a1fd83a3b5",
+            dict(
+                name="The original report",
+                tlp_level="clear",
+                confidence=91,
+                ai_incident_classification=["indicator_of_compromise", "infostealer"],
+                created="2022-08-11T15:18:11.499288Z",
+            ),
+        ),
+        (
+            "ed758a1b-34fe-4fca-8178-0c30d93a03ab",
+            "identity--c5f27ca2-a580-4fee-9bb9-753e2b563a30",
+            dict(
+                name="This is another report",
+                tlp_level="amber",
+                confidence=17,
+                ai_incident_classification=["vulnerability", "exploit", "ttp", "cyber_crime"],
+                created="2025-06-17T15:26:48.932465Z",
+            ),
+        ),
+    ]:
+        identity, _ = Identity.objects.get_or_create(
+            id=identity_id,
+            defaults=dict(
+                created=values["created"],
+                modified=values["created"],
+                stix=dict(name="dummy identity", identity_class="organization"),
+            ),
+        )
+        created = values.pop("created")
+        file = models.File.objects.create(
+            id=file_id,
+            file=SimpleUploadedFile("file.md", b"File Content", "text/markdown"),
+            profile=stixifier_profile,
+            mode="md",
+            identity=identity,
+            txt2stix_data={},
+            **values,
+        )
+        models.File.objects.filter(pk=file.pk).update(created=created)
+        files.append(file)
+    return files
+
+
 @pytest.mark.parametrize(
     "report_id",
     [
@@ -112,7 +166,8 @@ def test_retrieve_bad_kwargs(client, report_id, api_schema):
     api_schema['/api/v1/reports/{report_id}/']['GET'].validate_response(Transport.get_st_response(resp))
 
 
-def test_list(client, api_schema):
+@pytest.mark.django_db
+def test_list(client, report_files, api_schema):
     resp = client.get(f"/api/v1/reports/")
     assert resp.status_code == 200
     assert resp.data["total_results_count"] == 2
@@ -273,6 +328,37 @@ def test_report_objects_types(client, report_id, types, api_schema):
     api_schema["/api/v1/reports/{report_id}/objects/"]['GET'].validate_response(Transport.get_st_response(resp))
 
 
+@pytest.mark.parametrize(
+    "report_id",
+    [
+        "report--52d2146c-798a-440f-942f-6fe039fb8995",
+        "report--ed758a1b-34fe-4fca-8178-0c30d93a03ab",
+    ],
+)
+def test_report_objects_cursor(client, report_id, api_schema):
+    url = f"/api/v1/reports/{report_id}/objects/"
+    expected_ids = {obj["id"] for obj in client.get(url).data["objects"]}
+    object_ids = []
+    cursor = ""
+    while cursor is not None:
+        resp = client.get(url, query_params=dict(cursor=cursor, page_size=2))
+        assert resp.status_code == 200
+        assert resp.data["size"] == len(resp.data["objects"]) <= 2
+        api_schema["/api/v1/reports/{report_id}/objects/"]['GET'].validate_response(Transport.get_st_response(resp))
+        object_ids.extend(obj["id"] for obj in resp.data["objects"])
+        cursor = resp.data["next"]
+    assert len(object_ids) == len(set(object_ids))
+    assert set(object_ids) == expected_ids
+
+
+def test_report_objects_cursor__invalid(client):
+    resp = client.get(
+        "/api/v1/reports/report--52d2146c-798a-440f-942f-6fe039fb8995/objects/",
+        query_params=dict(cursor="not a cursor"),
+    )
+    assert resp.status_code == 404
+
+
 @pytest.mark.parametrize(
     "filters,expected_ids",
     [
@@ -305,6 +391,16 @@ def test_report_objects_types(client, report_id, types, api_schema):
         (dict(tlp_level="amber"), ["report--ed758a1b-34fe-4fca-8178-0c30d93a03ab"]),
         (dict(labels="ploit"), ["report--ed758a1b-34fe-4fca-8178-0c30d93a03ab"]),
         (dict(labels="steal"), ["report--52d2146c-798a-440f-942f-6fe039fb8995"]),
+        (dict(labels="pl"), ["report--ed758a1b-34fe-4fca-8178-0c30d93a03ab"]),
+        (dict(name="other", sort="relevance_descending"), ["report--ed758a1b-34fe-4fca-8178-0c30d93a03ab"]),
+        (
+            dict(description="nigeria", sort="relevance_descending"),
+            [
+                "report--52d2146c-798a-440f-942f-6fe039fb8995",
+                "report--ed758a1b-34fe-4fca-8178-0c30d93a03ab",
+            ],
+        ),
+        (dict(description="hospital"), ["report--ed758a1b-34fe-4fca-8178-0c30d93a03ab"]),
         (
             dict(ai_incident_classification="infostealer"),
             ["report--52d2146c-798a-440f-942f-6fe039fb8995"],
@@ -333,6 +429,9 @@ def test_report_objects_types(client, report_id, types, api_schema):
                 "report--ed758a1b-34fe-4fca-8178-0c30d93a03ab",
             ],
         ),
+        # classifications are matched exactly, like the `classification.<x>` labels of the report
+        (dict(ai_incident_classification="Cyber Crime"), ["report--ed758a1b-34fe-4fca-8178-0c30d93a03ab"]),
+        (dict(ai_incident_classification="crime"), []),
         (
             dict(created_min="2022-08-11T15:18:11.499288Z"),
             [
@@ -358,7 +457,8 @@ def test_report_objects_types(client, report_id, types, api_schema):
         ),
     ],
 )
-def test_list_filters(client, filters, expected_ids, api_schema):
+@pytest.mark.django_db
+def test_list_filters(client, report_files, filters, expected_ids, api_schema):
     resp = client.get(f"/api/v1/reports/", query_params=filters)
     assert resp.status_code == 200
     assert {obj["id"] for obj in resp.data["objects"]} == set(expected_ids)
@@ -366,10 +466,58 @@ def test_list_filters(client, filters, expected_ids, api_schema):
 
 
 @pytest.mark.django_db
-def test_list_with_topic_id_filter(client, api_schema):
+@pytest.mark.parametrize(
+    "labels,expected_ids",
+    [
+        ("class", ["report--ed758a1b-34fe-4fca-8178-0c30d93a03ab"]),
+        ("ion", ["report--ed758a1b-34fe-4fca-8178-0c30d93a03ab"]),
+        ("ALWA", ["report--52d2146c-798a-440f-942f-6fe039fb8995"]),
+    ],
+)
+def test_list_labels__no_classification(client, report_files, labels, expected_ids):
+    models.File.objects.filter(pk=report_files[0].pk).update(ai_incident_classification=None, labels=["malware"])
+    resp = client.get("/api/v1/reports/", query_params=dict(labels=labels))
+    assert resp.status_code == 200
+    assert [obj["id"] for obj in resp.data["objects"]] == expected_ids
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "sort,expected_ids",
+    [
+        (
+            "created_ascending",
+            ["report--52d2146c-798a-440f-942f-6fe039fb8995", "report--ed758a1b-34fe-4fca-8178-0c30d93a03ab"],
+        ),
+        (
+            "confidence_descending",
+            ["report--52d2146c-798a-440f-942f-6fe039fb8995", "report--ed758a1b-34fe-4fca-8178-0c30d93a03ab"],
+        ),
+        (
+            "name_descending",
+            ["report--ed758a1b-34fe-4fca-8178-0c30d93a03ab", "report--52d2146c-798a-440f-942f-6fe039fb8995"],
+        ),
+    ],
+)
+def test_list_cursor(client, report_files, sort, expected_ids, api_schema):
+    report_ids = []
+    cursor = ""
+    while cursor is not None:
+        resp = client.get("/api/v1/reports/", query_params=dict(cursor=cursor, page_size=1, sort=sort))
+        assert resp.status_code == 200
+        assert resp.data["size"] == 1
+        api_schema["/api/v1/reports/"]['GET'].validate_response(Transport.get_st_response(resp))
+        report_ids.extend(obj["id"] for obj in resp.data["objects"])
+        cursor = resp.data["next"]
+    assert report_ids == expected_ids
+
+
+@pytest.mark.django_db
+def test_list_with_topic_id_filter(client, report_files, api_schema):
     emb1 = DocumentEmbedding.objects.create(
         id="52d2146c-798a-440f-942f-6fe039fb8995", text="Iran cyber ops text", embedding=[0.0] * 512
     )
+    models.File.objects.filter(pk=emb1.id).update(embedding=emb1)
     cluster1 = Cluster.objects.create(
         id="78322c04-aca5-4982-88fc-a22a436e3ede",
         label="Iran Cyber Threats",
@@ -387,10 +535,7 @@ def test_list_with_topic_id_filter(client, api_schema):
 @pytest.mark.django_db
 def test_list_attack_navigator__has_data(client, stixify_file, api_schema, navigator_data):
     post = models.File.objects.get(pk="dcbeb240-8dd6-4892-8e9e-7b6bda30e454")
-    post.txt2stix_data = {
-        "navigator_layer": navigator_data
-    }
-    post.save()
+    post.set_navigator_layers(navigator_data)
 
     resp = client.get(
         "/api/v1/reports/report--dcbeb240-8dd6-4892-8e9e-7b6bda30e454/attack-navigator/",
@@ -451,8 +596,7 @@ def test_retrieve_attack_navigator__has_data(
     client, stixify_file, api_schema, navigator_data
 ):
     post = models.File.objects.get(pk="dcbeb240-8dd6-4892-8e9e-7b6bda30e454")
-    post.txt2stix_data = {"navigator_layer": navigator_data}
-    post.save()
+    post.set_navigator_layers(navigator_data)
 
     resp = client.get(
         f"/api/v1/reports/report--dcbeb240-8dd6-4892-8e9e-7b6bda30e454/attack-navigator/ics/",
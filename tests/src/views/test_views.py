@@ -4,6 +4,7 @@ from unittest.mock import patch
 import uuid
 
 from stixify.classifier.models import Cluster, DocumentEmbedding
+from stixify.web import queue_metrics
 
 
 def test_schema_view(client):
@@ -22,6 +23,65 @@ def test_healthcheck_service(client, api_schema):
     api_schema['/api/healthcheck/service/']['GET'].validate_response(Transport.get_st_response(resp))
 
 
+@pytest.fixture
+def queue_metrics_jobs():
+    from django.core.cache import cache
+    from django.utils import timezone
+    from datetime import timedelta
+    from stixify.web.models import Job, JobState, JobType
+
+    cache.delete(queue_metrics.CACHE_KEY)
+    now = timezone.now()
+    Job.objects.create(type=JobType.IMPORT_FILE, state=JobState.PENDING)
+    oldest = Job.objects.create(type=JobType.IMPORT_FILE, state=JobState.PENDING)
+    Job.objects.filter(pk=oldest.pk).update(run_datetime=now - timedelta(minutes=5))
+    Job.objects.create(type=JobType.BUILD_CLUSTERS, state=JobState.PROCESSING)
+    for seconds, state in [(10, JobState.COMPLETED), (30, JobState.COMPLETED), (5, JobState.FAILED)]:
+        job = Job.objects.create(type=JobType.IMPORT_FILE, state=state)
+        Job.objects.filter(pk=job.pk).update(
+            run_datetime=now - timedelta(seconds=seconds + 60),
+            completion_time=now - timedelta(seconds=60),
+        )
+    # finished before the window
+    Job.objects.create(
+        type=JobType.IMPORT_FILE,
+        state=JobState.COMPLETED,
+        completion_time=now - timedelta(hours=1),
+    )
+    with patch.object(queue_metrics, "queue_depths", return_value={"celery": 0, "extract": 4}):
+        yield
+
+
+@pytest.mark.django_db
+def test_queue_metrics(client, api_schema, queue_metrics_jobs):
+    resp = client.get('/api/healthcheck/queues/')
+    assert resp.status_code == 200
+    api_schema['/api/healthcheck/queues/']['GET'].validate_response(Transport.get_st_response(resp))
+    data = resp.json()
+    assert data["queues"] == {"celery": 0, "extract": 4}
+    assert data["jobs"]["import-file"] == {"pending": 2, "processing": 0}
+    assert data["jobs"]["build-clusters"] == {"pending": 0, "processing": 1}
+    assert 300 <= data["oldest_pending_job_age"] < 360
+    assert data["throughput"]["files_per_minute"] == round(2 / queue_metrics.THROUGHPUT_WINDOW_MINUTES, 3)
+    finished = data["throughput"]["jobs"]["import-file"]
+    assert (finished["completed"], finished["failed"]) == (2, 1)
+    assert finished["latency_p50"] == pytest.approx(20, abs=0.1)
+    assert finished["latency_p95"] == pytest.approx(29, abs=0.1)
+
+
+@pytest.mark.django_db
+def test_queue_metrics__prometheus(client, queue_metrics_jobs):
+    resp = client.get('/api/healthcheck/queues/?format=prometheus')
+    assert resp.status_code == 200
+    assert resp.headers['content-type'] == "text/plain; charset=utf-8"
+    lines = resp.content.decode().splitlines()
+    assert "# TYPE stixify_queue_depth gauge" in lines
+    assert 'stixify_queue_depth{queue="extract"} 4' in lines
+    assert 'stixify_jobs{type="import-file",state="pending"} 2' in lines
+    assert 'stixify_jobs_finished{type="import-file",state="failed"} 1' in lines
+    assert any(line.startswith('stixify_job_latency_seconds{type="import-file",quantile="0.95"} ') for line in lines)
+
+
 @pytest.mark.django_db
 def test_update_knowledgebase_passes(client, api_schema, celery_eager):
     with patch("stixify.worker.helpers.sync.run_on_kb_and_collection", return_value=(50, 22)) as mock_run_kb:
@@ -36,6 +96,8 @@ def test_update_knowledgebase_passes(client, api_schema, celery_eager):
         "id": resp_data['id'],
         "file": None,
         "type": "sync-knowledgebase",
+        "priority": "sync",
+        "queued_time": None,
         "state": "completed",
         "extra": {
             "knowledgebase": "cve",
@@ -63,6 +125,8 @@ def test_update_knowledgebase_fails(client, api_schema, celery_eager):
         "id": resp_data['id'],
         "file": None,
         "type": "sync-knowledgebase",
+        "priority": "sync",
+        "queued_time": None,
         "state": "failed",
         "extra": {'knowledgebase': 'cwe', 'unique_objects': 0, 'processed_items': 0},
         "error": 'explosion!',